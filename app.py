@@ -1,12 +1,13 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
 
 from utils.supabase_errors import is_supabase_connectivity_error, get_supabase_error_message
-from data.supabase_conn import check_supabase_health
+from data.supabase_conn import check_supabase_health, estadisticas_pool
 from routes.json_fields_routes import json_fields
 from routes.solicitudes_routes import solicitudes
 from routes.solicitantes_routes import solicitantes
@@ -26,6 +27,11 @@ from routes.estadisticas_routes import estadisticas
 load_dotenv()
 
 app = Flask(__name__)
+# Proxies de confianza delante de la app (X-Forwarded-For): con N saltos request.remote_addr es la IP
+# que vio el último proxy propio, no un valor que el cliente pueda inventar. 0 = sin proxy.
+PROXY_SALTOS = int(os.getenv("PROXY_SALTOS", "0"))
+if PROXY_SALTOS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_SALTOS)
 jwt = JWTManager(app)
 cors = CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
@@ -104,12 +110,13 @@ def health_check():
     """Verifica estado de la API y conectividad con Supabase."""
     ok, err = check_supabase_health()
     if ok:
-        return jsonify({"ok": True, "status": "healthy", "supabase": "connected"}), 200
+        return jsonify({"ok": True, "status": "healthy", "supabase": "connected", "http_pool": estadisticas_pool()}), 200
     return jsonify({
         "ok": False,
         "status": "degraded",
         "supabase": "disconnected",
         "error": str(err)[:200] if err else "Unknown",
+        "http_pool": estadisticas_pool(),
     }), 503
 
 
@@ -5,6 +5,11 @@ from datetime import datetime, timedelta
 from flask import request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from models.auth_model import AuthModel
+from utils.usuario_autenticado import claims_alcance
+from utils.contrasenas import (
+    IntentosExcedidosError, ServicioSaturadoError,
+    registrar_login_exitoso, registrar_login_fallido, verificar_intentos_login
+)
 
 
 class AuthController:
@@ -38,9 +43,19 @@ class AuthController:
                     }
                 }), 400
 
+            # Límite de intentos fallidos por cuenta e IP (antes de gastar CPU en bcrypt)
+            ip = self._ip_cliente()
+            verificar_intentos_login(correo, ip)
+
             # Autenticar usuario
             print(f"[LOGIN] 🔍 Intentando autenticar usuario: {correo}")
-            usuario = self.model.authenticate_user(correo, contraseña)
+            # Una sola consulta: usuario, empresa y estado de usuario temporal
+            autenticacion = self.model.autenticar(correo, contraseña)
+            usuario = autenticacion["usuario"]
+            if usuario:
+                registrar_login_exitoso(correo)
+            else:
+                registrar_login_fallido(correo, ip)
             print(f"[LOGIN] 📊 Resultado autenticación: {usuario is not None}")
 
             if usuario:
@@ -49,31 +64,25 @@ class AuthController:
                 print(f"[LOGIN] ❌ Usuario NO autenticado (None retornado)")
 
             if not usuario:
-                print(f"[LOGIN] 🔍 Verificando si es usuario temporal (para mensaje específico)...")
-                # Verificar si el usuario existe pero está inactivo o expirado
-                try:
-                    usuario_info = self.model._verificar_usuario_temporal(correo)
-                    print(f"[LOGIN] 📊 Resultado verificación temporal: {usuario_info}")
-
-                    if usuario_info:
-                        if usuario_info.get("inactivo"):
-                            print("[LOGIN] ❌ ERROR: Usuario temporal inactivo")
-                            return jsonify({
-                                "ok": False,
-                                "error": "Usuario inactivo",
-                                "message": "Tu cuenta temporal está desactivada. Contacta al administrador.",
-                                "error_code": "USER_INACTIVE"
-                            }), 403
-                        elif usuario_info.get("expirado"):
-                            print("[LOGIN] ❌ ERROR: Usuario temporal expirado")
-                            return jsonify({
-                                "ok": False,
-                                "error": "Cuenta expirada",
-                                "message": f"Tu cuenta temporal expiró el {usuario_info.get('fecha_expiracion', '')}. Contacta al administrador para renovar el acceso.",
-                                "error_code": "USER_EXPIRED"
-                            }), 403
-                except Exception as verif_error:
-                    print(f"[LOGIN] ⚠️ Error verificando usuario temporal: {verif_error}")
+                # Usuario temporal inactivo o expirado (evaluado sobre la misma consulta del login)
+                usuario_info = autenticacion["temporal"]
+                if usuario_info:
+                    if usuario_info.get("inactivo"):
+                        print("[LOGIN] ❌ ERROR: Usuario temporal inactivo")
+                        return jsonify({
+                            "ok": False,
+                            "error": "Usuario inactivo",
+                            "message": "Tu cuenta temporal está desactivada. Contacta al administrador.",
+                            "error_code": "USER_INACTIVE"
+                        }), 403
+                    elif usuario_info.get("expirado"):
+                        print("[LOGIN] ❌ ERROR: Usuario temporal expirado")
+                        return jsonify({
+                            "ok": False,
+                            "error": "Cuenta expirada",
+                            "message": f"Tu cuenta temporal expiró el {usuario_info.get('fecha_expiracion', '')}. Contacta al administrador para renovar el acceso.",
+                            "error_code": "USER_EXPIRED"
+                        }), 403
 
                 print("[LOGIN] ❌ ERROR: Usuario no autenticado - Credenciales inválidas")
                 return jsonify({
@@ -86,9 +95,12 @@ class AuthController:
             print(f"[LOGIN] 🔐 Creando token JWT para usuario ID: {usuario.get('id')}")
             try:
                 expires = timedelta(hours=24)  # Token válido por 24 horas
+                # Claims de alcance (rol, empresa, banco, ciudad) para autorizar sin consultar la BD;
+                # flask-jwt-extended exige que el subject sea string
                 access_token = create_access_token(
-                    identity=usuario["id"],
-                    expires_delta=expires
+                    identity=str(usuario["id"]),
+                    expires_delta=expires,
+                    additional_claims=claims_alcance(usuario)
                 )
                 print(f"[LOGIN] ✅ Token JWT creado exitosamente")
             except Exception as token_error:
@@ -97,13 +109,8 @@ class AuthController:
                 traceback.print_exc()
                 raise
 
-            # Obtener información de la empresa
-            empresa_info = None
-            if usuario.get("empresa_id"):
-                try:
-                    empresa_info = self.model.get_empresa_info(usuario["empresa_id"])
-                except Exception as empresa_error:
-                    empresa_info = None
+            # La empresa ya viene embebida en la consulta del login
+            empresa_info = autenticacion["empresa"]
 
             respuesta = {
                 "ok": True,
@@ -126,6 +133,24 @@ class AuthController:
 
             return jsonify(respuesta), 200
 
+        except IntentosExcedidosError as ie:
+            print(f"[LOGIN] ⛔ Demasiados intentos fallidos, reintentar en {ie.reintentar_en:.0f}s")
+            return jsonify({
+                "ok": False,
+                "error": str(ie),
+                "message": "Demasiados intentos",
+                "error_code": "TOO_MANY_ATTEMPTS"
+            }), 429, {"Retry-After": str(int(ie.reintentar_en) + 1)}
+
+        except ServicioSaturadoError as se:
+            print(f"[LOGIN] ⏳ Pool de bcrypt saturado")
+            return jsonify({
+                "ok": False,
+                "error": str(se),
+                "message": "Servicio ocupado",
+                "error_code": "LOGIN_BUSY"
+            }), 503, {"Retry-After": str(int(se.reintentar_en) or 1)}
+
         except Exception as ex:
             print(f"\n[LOGIN] ❌❌❌ ERROR EXCEPCIÓN EN LOGIN ❌❌❌")
             print(f"[LOGIN] Tipo de error: {type(ex).__name__}")
@@ -142,6 +167,11 @@ class AuthController:
                 "error_type": type(ex).__name__
             }), 500
 
+    @staticmethod
+    def _ip_cliente():
+        """IP del cliente; detrás de proxies ProxyFix (PROXY_SALTOS) ya la deja en remote_addr."""
+        return request.remote_addr
+
     @jwt_required()
     def verify_token(self):
         """Verifica si el token JWT es válido y retorna info del usuario."""
@@ -230,8 +260,9 @@ class AuthController:
             # Crear nuevo token
             expires = timedelta(hours=24)
             new_token = create_access_token(
-                identity=usuario["id"],
-                expires_delta=expires
+                identity=str(usuario["id"]),
+                expires_delta=expires,
+                additional_claims=claims_alcance(usuario)
             )
 
             return jsonify({
@@ -1,53 +1,99 @@
 from flask import request, jsonify
 from data.supabase_conn import supabase
+from utils.concurrencia import ejecutar_en_paralelo
+from models.alcance_rol import AlcanceRol
+from models.directorio_usuarios import DirectorioUsuarios
+from utils.usuario_autenticado import obtener_usuario_autenticado
 
-class DashboardController:
-    @staticmethod
-    def _obtener_usuario_autenticado():
-        """Obtener información del usuario autenticado desde la base de datos"""
-        try:
-            # Obtener el token del header Authorization
-            auth_header = request.headers.get("Authorization")
+# Columnas que devuelve la tabla del dashboard por cada entidad
+COLUMNAS_SOLICITANTE = "id, nombres, primer_apellido, segundo_apellido, tipo_identificacion, numero_documento, fecha_nacimiento, genero, correo, info_extra, created_at, empresa_id"
+COLUMNAS_ACTIVIDAD = "id, solicitante_id, detalle_actividad, created_at, empresa_id"
+COLUMNAS_FINANCIERA = "id, solicitante_id, total_ingresos_mensuales, total_egresos_mensuales, total_activos, total_pasivos, detalle_financiera, created_at, empresa_id"
+COLUMNAS_REFERENCIA = "id, solicitante_id, detalle_referencia, created_at, empresa_id"
+COLUMNAS_UBICACION = "id, solicitante_id, ciudad_residencia, departamento_residencia, detalle_direccion, created_at, empresa_id"
+COLUMNAS_SOLICITUD = "id, empresa_id, solicitante_id, created_by_user_id, estado, created_at, assigned_to_user_id, updated_at, detalle_credito, banco_nombre, ciudad_solicitud, observaciones"
 
-            if not auth_header or not auth_header.startswith("Bearer "):
-                print(f"   ❌ Authorization header inválido o faltante")
-                return None
+# Secciones del modo paginado (/dashboard/datos): nombre -> (tabla, columnas disponibles)
+SECCIONES_DASHBOARD = {
+    "solicitante": ("solicitantes", COLUMNAS_SOLICITANTE),
+    "actividad_economica": ("actividad_economica", COLUMNAS_ACTIVIDAD),
+    "informacion_financiera": ("informacion_financiera", COLUMNAS_FINANCIERA),
+    "referencias": ("referencias", COLUMNAS_REFERENCIA),
+    "solicitud": ("solicitudes", COLUMNAS_SOLICITUD),
+    "ubicacion": ("ubicacion", COLUMNAS_UBICACION),
+}
 
-            # Obtener user_id del header o query parameter
-            user_id = request.headers.get("X-User-Id") or request.args.get("user_id")
+# Tamaño de página del modo paginado
+LIMIT_DATOS_DEFECTO = 50
+LIMIT_DATOS_MAXIMO = 500
 
-            if not user_id:
-                print(f"   ❌ User ID faltante (header X-User-Id o query user_id)")
-                return None
+# Filas por consulta cuando /dashboard se pide sin limit (por debajo del max-rows de PostgREST)
+TAMANO_PAGINA_TODOS = 1000
 
-            # Consultar la base de datos para obtener información completa del usuario
-            # print(f"   🔍 Consultando usuario con ID: {user_id}")
-            user_response = supabase.table("usuarios").select("id, rol, info_extra").eq("id", int(user_id)).execute()
-            # print(f"   📊 Respuesta de BD: {user_response.data}")
+# Máximo de IDs por filtro in_ (mantiene acotado el largo de la URL de PostgREST)
+TAMANO_BLOQUE_IN = 200
 
-            user_data = user_response.data[0] if user_response.data else None
+class DashboardController:
+    @staticmethod
+    def _obtener_usuario_autenticado():
+        """Usuario autenticado de la petición (resuelto una vez por petición y en caché por ID)"""
+        return obtener_usuario_autenticado()
 
-            if not user_data:
-                print(f"   ❌ Usuario no encontrado en BD")
-                return None
+    @staticmethod
+    def _seleccionar_por_solicitantes(tabla, columnas, empresa_id, solicitante_ids, campo="solicitante_id"):
+        """Trae las filas de una tabla para un conjunto de solicitantes, en bloques para no exceder el largo de URL"""
+        filas = []
+        ids = list(solicitante_ids)
+        for inicio in range(0, len(ids), TAMANO_BLOQUE_IN):
+            bloque = ids[inicio:inicio + TAMANO_BLOQUE_IN]
+            resp = supabase.table(tabla).select(columnas).eq('empresa_id', empresa_id).in_(campo, bloque).execute()
+            filas.extend(resp.data or [])
+        return filas
 
-            # Extraer banco_nombre y ciudad del info_extra del usuario
-            info_extra = user_data.get("info_extra", {})
-            banco_nombre = info_extra.get("banco_nombre")
-            ciudad = info_extra.get("ciudad")
+    @staticmethod
+    def _indexar_primero(filas, campo="solicitante_id"):
+        """Índice campo -> primera fila encontrada (equivale al next(...) por solicitante)"""
+        indice = {}
+        for fila in filas:
+            indice.setdefault(fila.get(campo), fila)
+        return indice
 
-            usuario_info = {
-                "id": user_data["id"],
-                "rol": user_data.get("rol", "empresa"),
-                "banco_nombre": banco_nombre,  # Desde info_extra del usuario
-                "ciudad": ciudad  # Desde info_extra del usuario
-            }
+    @staticmethod
+    def _indexar_todos(filas, campo="solicitante_id"):
+        """Índice campo -> lista de filas"""
+        indice = {}
+        for fila in filas:
+            indice.setdefault(fila.get(campo), []).append(fila)
+        return indice
 
-            return usuario_info
+    @staticmethod
+    def _pagina_solicitantes(empresa_id, usuario_info, limit, offset):
+        """
+        Página de solicitantes visibles para el rol con sus solicitudes visibles embebidas
+        (solicitudes!inner), ordenada por id, y el total exacto. El alcance, el orden y la
+        paginación se resuelven en la BD; sin limit se recorren todas las páginas.
+        """
+        query = supabase.table('solicitantes').select(
+            f"{COLUMNAS_SOLICITANTE}, solicitudes!inner({COLUMNAS_SOLICITUD})", count="exact"
+        ).eq('empresa_id', empresa_id)
+        query = DashboardController._aplicar_alcance_solicitudes(query, usuario_info, empresa_id)
+        if query is None:
+            return [], 0
+        query = query.order('id')
 
-        except Exception as e:
-            print(f"   ❌ Error obteniendo usuario autenticado: {e}")
-            return None
+        if limit:
+            resp = query.range(offset, offset + limit - 1).execute()
+            return resp.data or [], resp.count or 0
+
+        filas, total, inicio = [], 0, offset
+        while True:
+            resp = query.range(inicio, inicio + TAMANO_PAGINA_TODOS - 1).execute()
+            lote = resp.data or []
+            filas.extend(lote)
+            total = resp.count or 0
+            inicio += TAMANO_PAGINA_TODOS
+            if len(lote) < TAMANO_PAGINA_TODOS or inicio >= total:
+                return filas, total
 
     @staticmethod
     def get_dashboard_data(empresa_id):
@@ -55,89 +101,67 @@ class DashboardController:
             # Obtener información del usuario autenticado
             usuario_info = DashboardController._obtener_usuario_autenticado()
 
-            # Obtener datos del solicitante
-            solicitante_data = supabase.table('solicitantes').select('*').eq('empresa_id', empresa_id).execute()
+            # Paginación opcional sobre los solicitantes visibles (sin limit se devuelven todos)
+            limit = request.args.get('limit', type=int)
+            limit = max(limit, 1) if limit else None
+            offset = max(request.args.get('offset', default=0, type=int) or 0, 0)
 
-            if not solicitante_data.data:
-                return jsonify({"ok": True, "data": []})
+            # Solicitantes de la página con sus solicitudes filtradas por rol, y el total, en una consulta
+            solicitantes, total = DashboardController._pagina_solicitantes(empresa_id, usuario_info, limit, offset)
+            pagina_ids = [sol["id"] for sol in solicitantes]
 
-            solicitante_id = solicitante_data.data[0]['id']
+            if not pagina_ids:
+                return jsonify({"ok": True, "data": [], "paginacion": {"total": total, "limit": limit, "offset": offset}})
 
-            # Obtener datos relacionados
-            actividad_economica = supabase.table('actividad_economica').select('*').eq('empresa_id', empresa_id).execute()
-            informacion_financiera = supabase.table('informacion_financiera').select('*').eq('empresa_id', empresa_id).execute()
-            referencias = supabase.table('referencias').select('*').eq('empresa_id', empresa_id).execute()
+            # Secciones relacionadas solo de los solicitantes de la página, en paralelo
+            relacionadas = {
+                seccion: (tabla, columnas) for seccion, (tabla, columnas) in SECCIONES_DASHBOARD.items()
+                if seccion not in ["solicitante", "solicitud"]
+            }
+            resultados = ejecutar_en_paralelo({
+                seccion: (lambda tabla=tabla, columnas=columnas:
+                          DashboardController._seleccionar_por_solicitantes(tabla, columnas, empresa_id, pagina_ids))
+                for seccion, (tabla, columnas) in relacionadas.items()
+            })
+            indices = {
+                seccion: (DashboardController._indexar_todos(filas) if seccion == "referencias"
+                          else DashboardController._indexar_primero(filas))
+                for seccion, filas in resultados.items()
+            }
 
-            # Usar el método del modelo de solicitudes que ya tiene el JOIN implementado
-            from models.solicitudes_model import SolicitudesModel
-            solicitudes_model = SolicitudesModel()
+            # Primera solicitud visible de cada solicitante
+            solicitud_por_solicitante = {}
+            for sol in solicitantes:
+                solicitudes = sol.pop("solicitudes", None) or []
+                if solicitudes:
+                    solicitud_por_solicitante[sol["id"]] = min(solicitudes, key=lambda soli: soli.get("id") or 0)
 
-            # Obtener solicitudes con filtros de permisos por rol y JOIN con usuarios
-            solicitud_data = solicitudes_model.list_con_filtros_rol(
-                empresa_id=empresa_id,
-                usuario_info=usuario_info,
-                limit=1000  # Límite alto para el dashboard
+            # Nombres del creador y de su supervisor, como en list_con_filtros_rol
+            directorio = DirectorioUsuarios.de_empresa(
+                empresa_id, DirectorioUsuarios.ids_en(solicitud_por_solicitante.values(), "created_by_user_id")
             )
-
-            # Convertir a formato compatible con el resto del código
-            solicitud = type('obj', (object,), {'data': solicitud_data})()
-            ubicacion = supabase.table('ubicacion').select('*').eq('empresa_id', empresa_id).execute()
-
-            # # print(f"   📄 Solicitudes encontradas: {len(solicitud.data) if solicitud.data else 0}")
-            # if solicitud.data:
-            #     for s in solicitud.data:
-            #         print(f"      - ID: {s.get('id')}, Estado: {s.get('estado')}, Banco: {s.get('banco_nombre')}, Solicitante: {s.get('solicitante_id')}")
+            for solicitud in solicitud_por_solicitante.values():
+                created_by_user_id = solicitud.get("created_by_user_id")
+                solicitud["created_by_user_name"] = directorio.nombre(created_by_user_id)
+                solicitud["created_by_supervisor_name"] = directorio.supervisor_nombre(created_by_user_id)
 
             # Construir respuesta consolidada
             response_data = []
-
-            # Obtener solo los solicitantes que tienen solicitudes filtradas
-            solicitantes_con_solicitudes = set()
-            if solicitud.data:
-                for s in solicitud.data:
-                    solicitantes_con_solicitudes.add(s.get('solicitante_id'))
-
-            for sol in solicitante_data.data:
-                sol_id = sol['id']
-
-                # Solo incluir solicitantes que tienen solicitudes filtradas
-                if sol_id not in solicitantes_con_solicitudes:
-                    continue
-
-                # Encontrar datos relacionados
-                act_eco = next((ae for ae in actividad_economica.data if ae.get('solicitante_id') == sol_id), {})
-                info_fin = next((inf for inf in informacion_financiera.data if inf.get('solicitante_id') == sol_id), {})
-                refs = [r for r in referencias.data if r.get('solicitante_id') == sol_id]
-                soli = next((s for s in solicitud.data if s.get('solicitante_id') == sol_id), {})
-                ubi = next((u for u in ubicacion.data if u.get('solicitante_id') == sol_id), {})
-
-                                # Aplicar filtro de ciudad para usuarios banco
-                if usuario_info and usuario_info.get("rol") == "banco" and usuario_info.get("ciudad"):
-                    ciudad_usuario = usuario_info.get("ciudad")
-
-                    # Buscar ciudad en el campo fijo ciudad_solicitud de la solicitud
-                    ciudad_solicitante = None
-                    if soli:
-                        # ciudad_solicitud es un campo fijo en la tabla solicitudes
-                        ciudad_solicitante = soli.get('ciudad_solicitud')
-
-                    if ciudad_solicitante and ciudad_solicitante != ciudad_usuario:
-                        # print(f"   🏙️ Saltando solicitante {sol_id} (ciudad: {ciudad_solicitante}, usuario: {ciudad_usuario})")
-                        continue
-                        # print(f"   🏙️ Ciudad coincidente: {ciudad_solicitante}")
-
+            for sol in solicitantes:
+                sol_id = sol["id"]
                 response_data.append({
                     "solicitante": sol,
-                    "actividad_economica": act_eco,
-                    "informacion_financiera": info_fin,
-                    "referencias": refs,
-                    "solicitud": soli,
-                    "ubicacion": ubi
+                    "actividad_economica": indices["actividad_economica"].get(sol_id, {}),
+                    "informacion_financiera": indices["informacion_financiera"].get(sol_id, {}),
+                    "referencias": indices["referencias"].get(sol_id, []),
+                    "solicitud": solicitud_por_solicitante.get(sol_id, {}),
+                    "ubicacion": indices["ubicacion"].get(sol_id, {})
                 })
 
             return jsonify({
                 "ok": True,
-                "data": response_data
+                "data": response_data,
+                "paginacion": {"total": total, "limit": limit, "offset": offset}
             })
 
         except Exception as e:
@@ -145,3 +169,130 @@ class DashboardController:
                 "ok": False,
                 "error": str(e)
             }), 500
+
+    @staticmethod
+    def _parsear_fields(fields):
+        """
+        Convierte el parámetro fields en {seccion: "col1, col2"}.
+        Acepta secciones completas (solicitud) o columnas sueltas (solicitud.estado).
+        """
+        if not fields:
+            return {seccion: columnas for seccion, (_, columnas) in SECCIONES_DASHBOARD.items()}
+
+        seleccion = {}
+        for campo in (f.strip() for f in fields.split(",")):
+            if not campo:
+                continue
+            seccion, _, columna = campo.partition(".")
+            if seccion not in SECCIONES_DASHBOARD:
+                raise ValueError(f"Sección desconocida en fields: '{seccion}'")
+            disponibles = [c.strip() for c in SECCIONES_DASHBOARD[seccion][1].split(",")]
+            if not columna:
+                seleccion[seccion] = list(disponibles)
+                continue
+            if columna not in disponibles:
+                raise ValueError(f"Columna desconocida en fields: '{campo}'")
+            actuales = seleccion.setdefault(seccion, [])
+            if columna not in actuales:
+                actuales.append(columna)
+
+        # Las llaves de unión siempre se incluyen
+        resultado = {}
+        for seccion, columnas in seleccion.items():
+            llaves = ["id"] if seccion == "solicitante" else ["id", "solicitante_id"]
+            resultado[seccion] = ", ".join(llaves + [c for c in columnas if c not in llaves])
+        return resultado
+
+    @staticmethod
+    def _aplicar_alcance_solicitudes(query, usuario_info, empresa_id):
+        """
+        Filtra los solicitantes por las solicitudes que el rol puede ver, sobre el embebido
+        solicitudes!inner. Devuelve None si el usuario no puede ver ninguna.
+        """
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        if alcance.sin_acceso:
+            return None
+        return alcance.filtrar_solicitudes(query, reference_table="solicitudes", incluir_sin_ciudad=True)
+
+    @staticmethod
+    def get_dashboard_datos(empresa_id):
+        """Datos del dashboard filtrados por rol en la BD, con paginación por cursor y proyección de columnas"""
+        try:
+            usuario_info = DashboardController._obtener_usuario_autenticado()
+
+            limit = request.args.get('limit', default=LIMIT_DATOS_DEFECTO, type=int) or LIMIT_DATOS_DEFECTO
+            limit = min(max(limit, 1), LIMIT_DATOS_MAXIMO)
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    cursor = int(cursor)
+                except ValueError as exc:
+                    raise ValueError("cursor inválido") from exc
+
+            secciones = DashboardController._parsear_fields(request.args.get('fields'))
+            paginacion = {"limit": limit, "cursor": cursor, "siguiente_cursor": None, "hay_mas": False}
+
+            # 1. Solicitantes visibles para el rol (el filtro se resuelve en la BD vía solicitudes!inner)
+            columnas_solicitante = secciones.get("solicitante", "id")
+            columnas_solicitud = secciones.get("solicitud", "id")
+            query = supabase.table('solicitantes').select(
+                f"{columnas_solicitante}, solicitudes!inner({columnas_solicitud})"
+            ).eq('empresa_id', empresa_id)
+            query = DashboardController._aplicar_alcance_solicitudes(query, usuario_info, empresa_id)
+            if query is None:
+                return jsonify({"ok": True, "data": [], "paginacion": paginacion})
+
+            if cursor:
+                query = query.gt('id', cursor)
+            query = query.order('id').limit(limit + 1)
+            solicitantes = query.execute().data or []
+
+            if len(solicitantes) > limit:
+                solicitantes = solicitantes[:limit]
+                paginacion["hay_mas"] = True
+                paginacion["siguiente_cursor"] = solicitantes[-1]["id"]
+
+            pagina_ids = [sol["id"] for sol in solicitantes]
+            if not pagina_ids:
+                return jsonify({"ok": True, "data": [], "paginacion": paginacion})
+
+            # 2. Secciones relacionadas solo para los solicitantes de la página, en paralelo
+            relacionadas = {
+                seccion: columnas for seccion, columnas in secciones.items()
+                if seccion not in ["solicitante", "solicitud"]
+            }
+            resultados = ejecutar_en_paralelo({
+                seccion: (lambda tabla=SECCIONES_DASHBOARD[seccion][0], columnas=columnas:
+                          DashboardController._seleccionar_por_solicitantes(tabla, columnas, empresa_id, pagina_ids))
+                for seccion, columnas in relacionadas.items()
+            })
+            indices = {
+                seccion: (DashboardController._indexar_todos(filas) if seccion == "referencias"
+                          else DashboardController._indexar_primero(filas))
+                for seccion, filas in resultados.items()
+            }
+
+            # 3. Ensamblar en el orden del cursor
+            data = []
+            for sol in solicitantes:
+                sol_id = sol["id"]
+                solicitudes = sol.pop("solicitudes", None) or []
+                item = {}
+                if "solicitante" in secciones:
+                    item["solicitante"] = sol
+                if "solicitud" in secciones:
+                    # La solicitud más antigua visible para el rol
+                    item["solicitud"] = min(solicitudes, key=lambda soli: soli.get("id") or 0) if solicitudes else {}
+                for seccion, indice in indices.items():
+                    item[seccion] = indice.get(sol_id, [] if seccion == "referencias" else {})
+                data.append(item)
+
+            return jsonify({"ok": True, "data": data, "paginacion": paginacion})
+
+        except ValueError as ve:
+            return jsonify({"ok": False, "error": str(ve)}), 400
+        except Exception as e:
+            return jsonify({
+                "ok": False,
+                "error": str(e)
+            }), 500
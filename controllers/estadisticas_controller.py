@@ -1,6 +1,8 @@
 from flask import request, jsonify
-from models.estadisticas_model import EstadisticasModel
-from data.supabase_conn import supabase
+from models.estadisticas_model import EstadisticasModel, invalidar_estadisticas
+from models.estadisticas_contadores_model import EstadisticasContadoresModel
+from utils.concurrencia import ejecutar_en_paralelo
+from utils.usuario_autenticado import obtener_usuario_autenticado
 
 class EstadisticasController:
     def __init__(self):
@@ -17,50 +19,8 @@ class EstadisticasController:
             raise ValueError("empresa_id debe ser entero") from exc
 
     def _obtener_usuario_autenticado(self):
-        """Obtener información del usuario autenticado desde la base de datos"""
-        try:
-            # Obtener el token del header Authorization
-            auth_header = request.headers.get("Authorization")
-
-            if not auth_header or not auth_header.startswith("Bearer "):
-                # print(f"   ❌ Authorization header inválido o faltante")
-                return None
-
-            # Obtener user_id del header o query parameter
-            user_id = request.headers.get("X-User-Id") or request.args.get("user_id")
-
-            if not user_id:
-                # print(f"   ❌ User ID faltante (header X-User-Id o query user_id)")
-                return None
-
-            # Consultar la base de datos para obtener información completa del usuario
-            # print(f"   🔍 Consultando usuario con ID: {user_id}")
-            user_response = supabase.table("usuarios").select("id, rol, info_extra").eq("id", int(user_id)).execute()
-            # print(f"   📊 Respuesta de BD: {user_response.data}")
-
-            user_data = user_response.data[0] if user_response.data else None
-
-            if not user_data:
-                print(f"   ❌ Usuario no encontrado en BD")
-                return None
-
-            # Extraer banco_nombre y ciudad del info_extra del usuario
-            info_extra = user_data.get("info_extra") or {}
-            banco_nombre = info_extra.get("banco_nombre") if isinstance(info_extra, dict) else None
-            ciudad = info_extra.get("ciudad") if isinstance(info_extra, dict) else None
-
-            usuario_info = {
-                "id": user_data["id"],
-                "rol": user_data.get("rol", "empresa"),
-                "banco_nombre": banco_nombre,
-                "ciudad": ciudad
-            }
-
-            return usuario_info
-
-        except Exception as e:
-            # print(f"   ❌ Error obteniendo usuario autenticado: {e}")
-            return None
+        """Usuario autenticado de la petición (resuelto una vez por petición y en caché por ID)"""
+        return obtener_usuario_autenticado()
 
     def estadisticas_generales(self):
         """Endpoint para obtener estadísticas generales"""
@@ -222,11 +182,28 @@ class EstadisticasController:
                 # print(f"   👤 Usuario info: {usuario_info}")
                 # print(f"   📅 Período: {dias} días")
 
-            # Obtener todas las estadísticas
-            estadisticas_generales = self.model.estadisticas_generales(empresa_id, usuario_info)
-            estadisticas_rendimiento = self.model.estadisticas_rendimiento(empresa_id, usuario_info, dias)
-            estadisticas_financieras = self.model.estadisticas_financieras(empresa_id, usuario_info)
-            estadisticas_usuarios = self.model.estadisticas_usuarios(empresa_id, usuario_info)
+            # Obtener todas las estadísticas en paralelo. Se usa un pool propio porque
+            # cada categoría a su vez reparte sus consultas en el pool "consultas".
+            error_tiempo = {"error": "Tiempo de espera agotado"}
+            resultados = ejecutar_en_paralelo(
+                {
+                    "generales": lambda: self.model.estadisticas_generales(empresa_id, usuario_info),
+                    "rendimiento": lambda: self.model.estadisticas_rendimiento(empresa_id, usuario_info, dias),
+                    "financieras": lambda: self.model.estadisticas_financieras(empresa_id, usuario_info),
+                    "usuarios": lambda: self.model.estadisticas_usuarios(empresa_id, usuario_info),
+                },
+                pool="estadisticas",
+                defaults={
+                    "generales": error_tiempo,
+                    "rendimiento": error_tiempo,
+                    "financieras": error_tiempo,
+                    "usuarios": error_tiempo,
+                },
+            )
+            estadisticas_generales = resultados["generales"]
+            estadisticas_rendimiento = resultados["rendimiento"]
+            estadisticas_financieras = resultados["financieras"]
+            estadisticas_usuarios = resultados["usuarios"]
 
             response_data = {
                 "ok": True,
@@ -254,3 +231,31 @@ class EstadisticasController:
         except Exception as ex:
             print(f"❌ Error inesperado: {ex}")
             return jsonify({"ok": False, "error": str(ex)}), 500
+
+    def reconciliar_contadores(self):
+        """Endpoint para recalcular los contadores incrementales de estadísticas de la empresa"""
+        try:
+            empresa_id = self._empresa_id()
+            usuario_info = self._obtener_usuario_autenticado()
+
+            if not usuario_info or usuario_info.get("rol") not in ["admin", "empresa"]:
+                return jsonify({"ok": False, "error": "Sin permisos para reconciliar contadores"}), 403
+
+            empresas = EstadisticasContadoresModel().reconciliar(empresa_id)
+            invalidar_estadisticas(empresa_id)
+
+            return jsonify({
+                "ok": True,
+                "data": {
+                    "empresa_id": empresa_id,
+                    "empresas_reconciliadas": empresas,
+                    "contadores_habilitados": EstadisticasContadoresModel.habilitado,
+                }
+            })
+
+        except ValueError as ve:
+            print(f"❌ Error de validación: {ve}")
+            return jsonify({"ok": False, "error": str(ve)}), 400
+        except Exception as ex:
+            print(f"❌ Error inesperado: {ex}")
+            return jsonify({"ok": False, "error": str(ex)}), 500
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from flask import request, jsonify
 from models.notificaciones_model import NotificacionesModel
+from models.alcance_rol import AlcanceRol
+from utils.usuario_autenticado import obtener_usuario_autenticado
 from utils.debug_helpers import (
     log_request_details, log_operation_result, log_response, log_error
 )
@@ -21,107 +23,15 @@ class NotificacionesController:
             raise ValueError("empresa_id debe ser entero") from exc
 
     def _obtener_usuario_autenticado(self):
-        """Obtener información del usuario autenticado desde la base de datos"""
-        try:
-            # Obtener el token del header Authorization
-            auth_header = request.headers.get("Authorization")
-
-            if not auth_header or not auth_header.startswith("Bearer "):
-                # print(f"   ❌ Authorization header inválido o faltante")
-                return None
-
-            # Obtener user_id del header o query parameter
-            user_id = request.headers.get("X-User-Id") or request.args.get("user_id")
-
-            if not user_id:
-                # print(f"   ❌ User ID faltante (header X-User-Id o query user_id)")
-                return None
-
-            # Consultar la base de datos para obtener información completa del usuario
-            # print(f"   🔍 Consultando usuario con ID: {user_id}")
-            from data.supabase_conn import supabase
-            user_response = supabase.table("usuarios").select("id, rol, info_extra").eq("id", int(user_id)).execute()
-            # print(f"   📊 Respuesta de BD: {user_response.data}")
-
-            user_data = user_response.data[0] if user_response.data else None
-
-            if not user_data:
-                # print(f"   ❌ Usuario no encontrado en BD")
-                return None
-
-            # Extraer banco_nombre y ciudad del info_extra del usuario
-            info_extra = user_data.get("info_extra") or {}
-            banco_nombre = info_extra.get("banco_nombre") if isinstance(info_extra, dict) else None
-            ciudad = info_extra.get("ciudad") if isinstance(info_extra, dict) else None
-
-            usuario_info = {
-                "id": user_data["id"],
-                "rol": user_data.get("rol", "empresa"),
-                "banco_nombre": banco_nombre,
-                "ciudad": ciudad
-            }
-
-            return usuario_info
-
-        except Exception as e:
-            # print(f"   ❌ Error obteniendo usuario autenticado: {e}")
-            return None
+        """Usuario autenticado de la petición (resuelto una vez por petición y en caché por ID)"""
+        return obtener_usuario_autenticado()
 
     def _verificar_permiso_notificacion(self, notificacion: dict, usuario_info: dict = None) -> bool:
         """Verifica si el usuario tiene permisos para acceder a una notificación específica"""
         if not usuario_info:
             return False
-
-        rol = usuario_info.get("rol")
-        user_id = usuario_info.get("id")
-        notif_user_id = notificacion.get("usuario_id")
-
-        # Admin y empresa ven todas las notificaciones
-        if rol in ["admin", "empresa"]:
-            return True
-
-        # Asesor: ve sus notificaciones + las notificaciones de su supervisor
-        if rol == "asesor":
-            if notif_user_id == user_id:
-                return True
-
-            # Verificar si es de su supervisor
-            from models.usuarios_model import UsuariosModel
-            usuarios_model = UsuariosModel()
-            asesor_info = usuarios_model.get_by_id(user_id, notificacion.get("empresa_id"))
-
-            if asesor_info and asesor_info.get("reports_to_id"):
-                supervisor_id = asesor_info["reports_to_id"]
-                return notif_user_id == supervisor_id
-            return False
-
-        # Supervisor: ve notificaciones de su equipo + las suyas propias
-        if rol == "supervisor":
-            if notif_user_id == user_id:
-                return True
-
-            # Verificar si es de su equipo
-            from models.usuarios_model import UsuariosModel
-            usuarios_model = UsuariosModel()
-            team_members = usuarios_model.get_team_members(user_id, notificacion.get("empresa_id"))
-            if team_members:
-                team_ids = [member["id"] for member in team_members]
-                return notif_user_id in team_ids
-            return False
-
-        # Banco: ve notificaciones de su banco y ciudad
-        if rol == "banco":
-            banco_nombre = usuario_info.get("banco_nombre")
-            ciudad = usuario_info.get("ciudad")
-            metadata = notificacion.get("metadata", {})
-
-            # Verificar si la notificación es de su banco o ciudad
-            notif_banco = metadata.get("banco_nombre")
-            notif_ciudad = metadata.get("ciudad")
-
-            return (banco_nombre and notif_banco == banco_nombre) or (ciudad and notif_ciudad == ciudad)
-
-        return False
+        alcance = AlcanceRol.resolver(usuario_info, notificacion.get("empresa_id"))
+        return alcance.permite_notificacion(notificacion)
 
     def list(self):
         """Lista notificaciones con filtros opcionales y permisos por rol."""
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from flask import request, jsonify, make_response
+from flask import request, jsonify, make_response, Response, redirect, send_file
 from models.solicitantes_model import SolicitantesModel
 from models.ubicaciones_model import UbicacionesModel
 from models.actividad_economica_model import ActividadEconomicaModel
@@ -12,17 +12,52 @@ from utils.debug_helpers import (
     log_data_to_save, log_operation_result, log_response, log_error
 )
 from utils.email.sent_email import enviar_email_registro_completo
+from utils.exportaciones import gestor_exportaciones
+from utils.exportacion_ventas import COLUMNAS_VENTAS, AplanadorFilas
+from utils.concurrencia import ejecutar_en_paralelo
 import json
 import os
 import uuid
 import unicodedata
 import io
+import csv
+import itertools
+import tempfile
 from datetime import datetime, timezone, timedelta
 from werkzeug.utils import secure_filename
 from data.supabase_conn import supabase
 from models.documentos_model import DocumentosModel
+from models.registro_completo_model import RegistroCompletoModel
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional; csv y xlsx no lo necesitan
+    pa = None
+    pq = None
+
+# Filas iniciales que se usan para calcular el ancho de las columnas del Excel
+MUESTRA_ANCHOS_EXCEL = int(os.getenv("EXCEL_MUESTRA_ANCHOS", "500"))
+
+# Solicitantes por página al recorrer la empresa para exportar
+TAMANO_PAGINA_EXPORTACION = int(os.getenv("EXPORTACION_TAMANO_PAGINA", "500"))
+
+# Filas por row group al escribir Parquet
+LOTE_PARQUET = int(os.getenv("EXPORTACION_LOTE_PARQUET", "5000"))
+
+# Tiempo límite (segundos) para subir juntos los documentos de un registro completo;
+# las subidas corren en el pool "documentos" (tamaño con POOL_DOCUMENTOS_WORKERS)
+TIMEOUT_SUBIDA_DOCUMENTOS = float(os.getenv("DOCUMENTOS_SUBIDA_TIMEOUT", "120"))
+
+TIPOS_EXPORTACION = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
 
 
 class SolicitantesController:
@@ -34,6 +69,7 @@ class SolicitantesController:
         self.referencias_model = ReferenciasModel()
         self.solicitudes_model = SolicitudesModel()
         self.documentos_model = DocumentosModel()
+        self.registro_completo_model = RegistroCompletoModel()
 
     def _empresa_id(self) -> int:
         empresa_id = request.headers.get("X-Empresa-Id") or request.args.get("empresa_id")
@@ -44,6 +80,98 @@ class SolicitantesController:
         except Exception as exc:
             raise ValueError("empresa_id debe ser entero") from exc
 
+    def _subir_documentos(self, files_list, solicitante_id: int):
+        """
+        Sube los archivos a Storage en paralelo y registra los documentos con un solo insert.
+        Devuelve (documentos creados, con '_bytes' y '_content_type' para adjuntar al email,
+        y [{"nombre", "error"}] de los que fallaron); un archivo que falla no frena a los demás.
+        """
+        if not files_list:
+            return [], []
+
+        # Los archivos del request se leen en este hilo; al pool solo van los bytes
+        archivos = []
+        for idx, file in enumerate(files_list):
+            original_name = secure_filename(file.filename or f"documento_{idx+1}")
+            ext = os.path.splitext(original_name)[1]
+            unique_name = f"{uuid.uuid4().hex}{ext}" if ext else uuid.uuid4().hex
+            archivos.append({
+                "clave": f"{idx}:{original_name}",
+                "nombre": original_name,
+                "storage_path": f"solicitantes/{solicitante_id}/{unique_name}",
+                "content_type": getattr(file, "mimetype", None) or "application/octet-stream",
+                "bytes": file.read(),
+            })
+
+        storage = supabase.storage.from_("document")
+
+        def _subir(archivo):
+            try:
+                storage.upload(
+                    archivo["storage_path"],
+                    archivo["bytes"],
+                    file_options={
+                        "content-type": archivo["content_type"],
+                        "upsert": "true",
+                    },
+                )
+
+                public_url_resp = storage.get_public_url(archivo["storage_path"])
+                public_url = None
+                if isinstance(public_url_resp, dict):
+                    public_url = public_url_resp.get("publicUrl") or (
+                        public_url_resp.get("data", {}) if isinstance(public_url_resp.get("data"), dict) else {}
+                    ).get("publicUrl")
+                elif hasattr(public_url_resp, "data"):
+                    data_dict = getattr(public_url_resp, "data", {})
+                    if isinstance(data_dict, dict):
+                        public_url = data_dict.get("publicUrl")
+                if not public_url:
+                    public_url = str(public_url_resp)
+                return {"documento_url": public_url}
+            except Exception as e:
+                return {"error": str(e)}
+
+        subidas = ejecutar_en_paralelo(
+            {archivo["clave"]: (lambda archivo=archivo: _subir(archivo)) for archivo in archivos},
+            timeout=TIMEOUT_SUBIDA_DOCUMENTOS,
+            pool="documentos",
+            defaults={archivo["clave"]: {"error": "Tiempo de subida agotado"} for archivo in archivos},
+        )
+
+        subidos = []
+        fallidos = []
+        for idx, archivo in enumerate(archivos):
+            resultado = subidas[archivo["clave"]]
+            if "error" in resultado:
+                print(f"   ❌ Error subiendo documento {idx+1}: {resultado['error']}")
+                fallidos.append({"nombre": archivo["nombre"], "error": resultado["error"]})
+            else:
+                subidos.append({**archivo, "documento_url": resultado["documento_url"]})
+
+        try:
+            guardados = self.documentos_model.create_many(
+                solicitante_id=solicitante_id,
+                documentos=[{"nombre": doc["nombre"], "documento_url": doc["documento_url"]} for doc in subidos],
+            )
+        except Exception as e:
+            print(f"   ❌ Error guardando documentos en BD: {e}")
+            fallidos.extend({"nombre": doc["nombre"], "error": str(e)} for doc in subidos)
+            # Sin fila en documentos nadie referencia los archivos subidos: se borran del bucket
+            try:
+                storage.remove([doc["storage_path"] for doc in subidos])
+            except Exception as e_remove:
+                print(f"   ❌ Error eliminando de Storage los documentos no registrados: {e_remove}")
+            return [], fallidos
+
+        documentos_creados = []
+        for doc_saved, doc in zip(guardados, subidos):
+            # Guardar también los bytes para adjuntar directamente al email (sin descargar)
+            doc_saved["_bytes"] = doc["bytes"]
+            doc_saved["_content_type"] = doc["content_type"]
+            documentos_creados.append(doc_saved)
+        return documentos_creados, fallidos
+
     def _resolve_assigned_user_id(self, candidate_id, *, default_user_id: str | int, empresa_id: int) -> int:
         """
         Determina el assigned_to_user_id válido.
@@ -157,215 +285,45 @@ class SolicitantesController:
             return jsonify({"ok": False, "error": str(ex)}), 500
 
     def descargar_ventas_excel(self):
-        """Exportar todos los solicitantes a Excel (.xlsx) con TODA la información"""
+        """Exportar todos los solicitantes con TODA la información (format=xlsx|csv|parquet, por defecto xlsx)"""
         try:
             empresa_id = self._empresa_id()
-            print(f"\n📥 DESCARGANDO VENTAS EXCEL COMPLETO - Empresa ID: {empresa_id}")
-
-            # Obtener todos los datos completos sin límite
-            try:
-                data = self.model.list_completo_para_excel(empresa_id=empresa_id, limit=10000, offset=0)
-                print(f"   📊 Total de registros: {len(data)}")
-
-                # Debug: Mostrar estructura del primer registro
-                if data and len(data) > 0:
-                    primer_registro = data[0]
-                    # # print(f"\n   🔍 DEBUG - Estructura del primer registro:")
-                    # # print(f"      - info_extra keys: {list(primer_registro.get('info_extra', {}).keys())}")
-                    # if primer_registro.get('ubicaciones'):
-                    #     # print(f"      - ubicaciones[0] keys: {list(primer_registro['ubicaciones'][0].keys())}")
-                    #     if primer_registro['ubicaciones'][0].get('detalle_direccion'):
-                    #         # print(f"      - detalle_direccion keys: {list(primer_registro['ubicaciones'][0]['detalle_direccion'].keys())}")
-                    # if primer_registro.get('actividad_economica'):
-                    #     # print(f"      - actividad_economica[0] keys: {list(primer_registro['actividad_economica'][0].keys()) if primer_registro['actividad_economica'] else 'None'}")
-                    # if primer_registro.get('informacion_financiera'):
-                        # print(f"      - informacion_financiera[0] keys: {list(primer_registro['informacion_financiera'][0].keys()) if primer_registro['informacion_financiera'] else 'None'}")
-                    print()
-
-            except Exception as model_error:
-                print(f"   ❌ Error al obtener datos del modelo: {model_error}")
-                import traceback
-                traceback.print_exc()
-                raise ValueError(f"Error al obtener datos: {str(model_error)}")
-
-            # CONFIGURACIÓN DE COLUMNAS - TODAS las columnas del registro completo
-            columnas_config = [
-                # === DATOS BÁSICOS ===
-                ("Nombres", lambda item: f"{item.get('nombres', '')} {item.get('primer_apellido', '')} {item.get('segundo_apellido', '')}".strip()),
-                ("Tipo Identificación", lambda item: item.get("tipo_identificacion", "")),
-                ("Número Documento", lambda item: item.get("numero_documento", "")),
-                ("Fecha Nacimiento", lambda item: item.get("fecha_nacimiento", "")),
-                ("Género", lambda item: item.get("genero", "")),
-                ("Correo", lambda item: item.get("correo", "")),
-                ("Fecha Creación", lambda item: self._extraer_fecha(item.get("created_at", ""))),
-                ("Hora Creación", lambda item: self._extraer_hora(item.get("created_at", ""))),
-
-                # === INFO EXTRA ===
-                ("Celular", lambda item: self._extraer_info_extra(item, "celular")),
-                ("Teléfono", lambda item: self._extraer_info_extra(item, "telefono")),
-                ("Estado Civil", lambda item: self._extraer_info_extra(item, "estado_civil")),
-                ("Nivel Educativo", lambda item: self._extraer_info_extra(item, "nivel_educativo")),
-                ("Profesión", lambda item: self._extraer_info_extra(item, "profesion")),
-                ("Personas a Cargo", lambda item: self._extraer_info_extra(item, "personas_a_cargo")),
-                ("Lugar Nacimiento", lambda item: self._extraer_info_extra(item, "lugar_nacimiento")),
-                ("Nacionalidad", lambda item: self._extraer_info_extra(item, "nacionalidad")),
-
-                # === UBICACIÓN ===
-                ("Dirección", lambda item: self._extraer_ubicacion(item, "direccion")),
-                ("Ciudad Residencia", lambda item: self._extraer_ubicacion(item, "ciudad_residencia")),
-                ("Departamento Residencia", lambda item: self._extraer_ubicacion(item, "departamento_residencia")),
-                ("Barrio", lambda item: self._extraer_ubicacion(item, "barrio")),
-                ("Estrato", lambda item: self._extraer_ubicacion(item, "estrato")),
-                ("Tipo Vivienda", lambda item: self._extraer_ubicacion(item, "tipo_vivienda")),
-                ("Paga Arriendo", lambda item: self._extraer_ubicacion(item, "paga_arriendo")),
-                ("Valor Arriendo", lambda item: self._extraer_ubicacion(item, "valor_mensual_arriendo")),
-
-                # === ACTIVIDAD ECONÓMICA ===
-                ("Tipo Actividad", lambda item: self._extraer_actividad(item, "tipo_actividad")),
-                ("Tipo Actividad Económica", lambda item: self._extraer_actividad(item, "tipo_actividad_economica")),
-                ("Ocupación", lambda item: self._extraer_actividad(item, "ocupacion")),
-                ("Nombre Empresa", lambda item: self._extraer_actividad(item, "nombre_empresa")),
-                ("Cargo", lambda item: self._extraer_actividad(item, "cargo")),
-                ("Antigüedad Laboral", lambda item: self._extraer_actividad(item, "antiguedad_laboral")),
-                ("Tipo Contrato", lambda item: self._extraer_actividad(item, "tipo_contrato")),
-                ("Dirección Empresa", lambda item: self._extraer_actividad(item, "direccion_empresa")),
-                ("Teléfono Empresa", lambda item: self._extraer_actividad(item, "telefono_empresa")),
-                ("Ciudad Empresa", lambda item: self._extraer_actividad(item, "ciudad_empresa")),
-                ("Sector Económico", lambda item: self._extraer_actividad(item, "sector_economico")),
-
-                # === INFORMACIÓN FINANCIERA ===
-                ("Total Ingresos Mensuales", lambda item: self._extraer_financiera(item, "total_ingresos_mensuales")),
-                ("Total Egresos Mensuales", lambda item: self._extraer_financiera(item, "total_egresos_mensuales")),
-                ("Total Activos", lambda item: self._extraer_financiera(item, "total_activos")),
-                ("Total Pasivos", lambda item: self._extraer_financiera(item, "total_pasivos")),
-                ("Ingreso Básico Mensual", lambda item: self._extraer_financiera(item, "ingreso_basico_mensual")),
-                ("Ingreso Variable Mensual", lambda item: self._extraer_financiera(item, "ingreso_variable_mensual")),
-                ("Otros Ingresos Mensuales", lambda item: self._extraer_financiera(item, "otros_ingresos_mensuales")),
-                ("Gastos Financieros", lambda item: self._extraer_financiera(item, "gastos_financieros_mensuales")),
-                ("Gastos Personales", lambda item: self._extraer_financiera(item, "gastos_personales_mensuales")),
-                ("Declara Renta", lambda item: self._extraer_financiera(item, "declara_renta")),
-
-                # === SOLICITUD ===
-                ("Tipo Crédito", lambda item: self._extraer_solicitud(item, "detalle_credito", "tipo_credito")),
-                ("Monto Solicitado", lambda item: self._extraer_solicitud(item, "detalle_credito", "monto_solicitado")),
-                ("Plazo", lambda item: self._extraer_solicitud(item, "detalle_credito", "plazo")),
-                ("Destino Crédito", lambda item: self._extraer_solicitud(item, "detalle_credito", "destino_credito")),
-                ("Banco", lambda item: self._extraer_solicitud(item, "banco_nombre")),
-                ("Ciudad Solicitud", lambda item: self._extraer_solicitud(item, "ciudad_solicitud")),
-                ("Estado", lambda item: self._extraer_solicitud(item, "estado")),
-
-                # === REFERENCIAS ===
-                ("Referencia 1 - Nombre", lambda item: self._extraer_referencia(item, 0, "nombre_completo")),
-                ("Referencia 1 - Relación", lambda item: self._extraer_referencia(item, 0, "relacion_referencia")),
-                ("Referencia 1 - Teléfono", lambda item: self._extraer_referencia(item, 0, "telefono")),
-                ("Referencia 1 - Celular", lambda item: self._extraer_referencia(item, 0, "celular_referencia")),
-                ("Referencia 1 - Ciudad", lambda item: self._extraer_referencia(item, 0, "ciudad")),
-                ("Referencia 2 - Nombre", lambda item: self._extraer_referencia(item, 1, "nombre_completo")),
-                ("Referencia 2 - Relación", lambda item: self._extraer_referencia(item, 1, "relacion_referencia")),
-                ("Referencia 2 - Teléfono", lambda item: self._extraer_referencia(item, 1, "telefono")),
-                ("Referencia 2 - Celular", lambda item: self._extraer_referencia(item, 1, "celular_referencia")),
-                ("Referencia 2 - Ciudad", lambda item: self._extraer_referencia(item, 1, "ciudad")),
-
-                # === DOCUMENTOS ===
-                ("Total Documentos", lambda item: self._contar_documentos(item)),
-                ("Documentos Cargados", lambda item: self._listar_documentos(item)),
-
-                # === USUARIOS ===
-                ("Creado por", lambda item: item.get("created_by_user_name", "")),
-                ("Supervisor", lambda item: item.get("created_by_supervisor_name", "")),
-            ]
+            formato = self._formato_exportacion()
+            print(f"\n📥 DESCARGANDO VENTAS {formato.upper()} COMPLETO - Empresa ID: {empresa_id}")
+
+            # Los solicitantes se leen por páginas (paginación por llave) y se escriben a
+            # medida que llegan, sin cargar toda la empresa en memoria
+            data = self.model.iterar_completo_para_excel(
+                empresa_id=empresa_id, tamano_pagina=TAMANO_PAGINA_EXPORTACION
+            )
+
+            filename = f"ventas_{empresa_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+
+            if formato == "csv":
+                # El CSV se envía fila a fila mientras se leen las páginas. La primera página se
+                # lee antes de responder para que un error de consulta siga siendo un 500 en JSON;
+                # si falla una página posterior la respuesta ya empezó y el CSV queda incompleto.
+                primera = list(itertools.islice(data, 1))
+                response = Response(
+                    self._csv_por_partes(COLUMNAS_VENTAS, itertools.chain(primera, data)),
+                    mimetype=TIPOS_EXPORTACION["csv"],
+                )
+            else:
+                # Excel y Parquet se escriben en un archivo temporal (memoria constante) y se envían por partes
+                ruta_archivo = self._escribir_exportacion_ventas(formato, COLUMNAS_VENTAS, data)
+                response = Response(
+                    self._leer_por_partes(ruta_archivo),
+                    mimetype=TIPOS_EXPORTACION[formato],
+                    direct_passthrough=True,
+                )
+                response.headers["Content-Length"] = str(os.path.getsize(ruta_archivo))
 
-            # Crear libro de Excel
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Ventas"
-
-            # Estilo para encabezados
-            header_fill = PatternFill(start_color="4CAF50", end_color="4CAF50", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF", size=11)
-            header_alignment = Alignment(horizontal="center", vertical="center")
-
-            # Escribir encabezados
-            headers = [col[0] for col in columnas_config]
-            for col_idx, header in enumerate(headers, start=1):
-                cell = ws.cell(row=1, column=col_idx, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = header_alignment
-
-            # print(f"   📋 Columnas exportadas: {', '.join(headers)}")
-
-            # Escribir datos y verificar campos vacíos
-            campos_vacios = {}
-            for row_idx, item in enumerate(data, start=2):
-                for col_idx, (header, extractor) in enumerate(columnas_config, start=1):
-                    try:
-                        value = extractor(item)
-                        # Convertir None a string vacío
-                        if value is None:
-                            value = ""
-                        # Asegurar que sea string
-                        value = str(value) if value else ""
-
-                        # Contar campos vacíos para debugging
-                        if not value and row_idx == 2:  # Solo primera fila para debug
-                            campos_vacios[header] = campos_vacios.get(header, 0) + 1
-
-                        cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                        cell.alignment = Alignment(horizontal="left", vertical="center")
-                    except Exception as e:
-                        print(f"   ⚠️ Error extrayendo valor en fila {row_idx}, col {col_idx} ({header}): {e}")
-                        ws.cell(row=row_idx, column=col_idx, value="")
-
-            # Log de campos vacíos
-            # if campos_vacios:
-                # print(f"   📋 Campos vacíos en primer registro: {list(campos_vacios.keys())}")
-
-            # Ajustar ancho de columnas basado en el contenido real
-            for col_idx, header in enumerate(headers, start=1):
-                column_letter = ws.cell(row=1, column=col_idx).column_letter
-
-                # Calcular el ancho máximo basado en el contenido
-                max_length = len(str(header))  # Empezar con el largo del encabezado
-
-                # Revisar todas las filas para encontrar el valor más largo
-                for row_idx in range(2, len(data) + 2):
-                    cell_value = ws.cell(row=row_idx, column=col_idx).value
-                    if cell_value:
-                        cell_length = len(str(cell_value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-
-                # Ajustar el ancho con un margen adicional (máximo 50 para evitar columnas muy anchas)
-                adjusted_width = min(max_length + 3, 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-
-            # Guardar en memoria con manejo de errores
-            output = io.BytesIO()
-            try:
-                wb.save(output)
-                output.seek(0)
-                excel_data = output.getvalue()
-                # print(f"   💾 Archivo Excel guardado en memoria: {len(excel_data)} bytes")
-            except Exception as save_error:
-                print(f"   ❌ Error al guardar Excel: {save_error}")
-                raise
-            finally:
-                output.close()
-
-            # Preparar respuesta
-            response = make_response(excel_data)
-            filename = f"ventas_{empresa_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-            # Headers optimizados para descarga de Excel
-            response.headers["Content-Type"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            # Headers optimizados para descarga
             response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-            response.headers["Content-Length"] = str(len(excel_data))
             response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
             response.headers["Pragma"] = "no-cache"
             response.headers["Expires"] = "0"
 
-            # print(f"   ✅ Excel generado exitosamente con {len(columnas_config)} columnas y {len(data)} registros")
             return response
 
         except ValueError as ve:
@@ -375,146 +333,257 @@ class SolicitantesController:
             log_error(ex, "ERROR INESPERADO EN DESCARGA EXCEL")
             return jsonify({"ok": False, "error": str(ex)}), 500
 
-    def _extraer_info_extra(self, item: dict, campo: str) -> str:
-        """Extrae un campo de info_extra"""
-        try:
-            info_extra = item.get("info_extra", {})
-            valor = info_extra.get(campo, "") if info_extra else ""
-            return str(valor) if valor else ""
-        except Exception:
-            return ""
-
-    def _extraer_ubicacion(self, item: dict, campo: str) -> str:
-        """Extrae un campo de la primera ubicación"""
-        try:
-            ubicaciones = item.get("ubicaciones", [])
-            if ubicaciones and len(ubicaciones) > 0:
-                ubicacion = ubicaciones[0]
-                detalle = ubicacion.get("detalle_direccion", {}) if ubicacion else {}
-                # Buscar en detalle_direccion primero, luego en el nivel superior
-                valor = detalle.get(campo) or ubicacion.get(campo)
-                return str(valor) if valor else ""
-            return ""
-        except Exception:
-            return ""
-
-    def _extraer_actividad(self, item: dict, campo: str) -> str:
-        """Extrae un campo de la primera actividad económica"""
-        try:
-            actividades = item.get("actividad_economica", [])
-            if actividades and len(actividades) > 0:
-                actividad = actividades[0]
-                detalle = actividad.get("detalle_actividad", {}) if actividad else {}
-                # Buscar en detalle_actividad primero, luego en el nivel superior
-                valor = detalle.get(campo) or actividad.get(campo)
-                return str(valor) if valor else ""
-            return ""
-        except Exception:
-            return ""
-
-    def _extraer_financiera(self, item: dict, campo: str) -> str:
-        """Extrae un campo de la primera información financiera"""
+    def crear_exportacion_ventas(self):
+        """Encola la exportación de ventas (format=xlsx|csv|parquet) y devuelve el trabajo para consultar su avance"""
         try:
-            financieras = item.get("informacion_financiera", [])
-            if financieras and len(financieras) > 0:
-                financiera = financieras[0]
-                detalle = financiera.get("detalle_financiera", {}) if financiera else {}
-                # Buscar en detalle_financiera primero, luego en el nivel superior
-                valor = detalle.get(campo) or financiera.get(campo)
-                return str(valor) if valor else ""
-            return ""
-        except Exception:
-            return ""
-
-    def _extraer_solicitud(self, item: dict, *campos) -> str:
-        """Extrae un campo de la solicitud (puede ser anidado)"""
-        try:
-            solicitud = item.get("solicitud")
-            if not solicitud:
-                return ""
-
-            valor = solicitud
-            for campo in campos:
-                if isinstance(valor, dict):
-                    valor = valor.get(campo)
-                else:
-                    return ""
-
-            return str(valor) if valor else ""
-        except Exception:
-            return ""
+            empresa_id = self._empresa_id()
+            formato = self._formato_exportacion()
+            filename = f"ventas_{empresa_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+            job = gestor_exportaciones.encolar(
+                tipo="ventas",
+                empresa_id=empresa_id,
+                parametros={"formato": formato},
+                nombre_archivo=filename,
+                generar=lambda ruta, progreso: self._generar_exportacion_ventas(empresa_id, formato, ruta, progreso),
+            )
+            return jsonify({"ok": True, "data": job}), 202
+        except ValueError as ve:
+            return jsonify({"ok": False, "error": str(ve)}), 400
+        except Exception as ex:
+            log_error(ex, "ERROR AL ENCOLAR EXPORTACIÓN DE VENTAS")
+            return jsonify({"ok": False, "error": str(ex)}), 500
 
-    def _extraer_referencia(self, item: dict, index: int, campo: str) -> str:
-        """Extrae un campo de una referencia específica por índice"""
+    def estado_exportacion(self, job_id: str):
+        """Estado y avance (filas escritas / total) de una exportación"""
         try:
-            referencias = item.get("referencias", [])
-            if referencias and len(referencias) > index:
-                referencia = referencias[index]
-                detalle = referencia.get("detalle_referencia", {}) if referencia else {}
-                # Buscar en detalle_referencia primero, luego en el nivel superior
-                valor = detalle.get(campo) or referencia.get(campo)
-                return str(valor) if valor else ""
-            return ""
-        except Exception:
-            return ""
-
-    def _contar_documentos(self, item: dict) -> str:
-        """Cuenta el total de documentos"""
+            empresa_id = self._empresa_id()
+            job = gestor_exportaciones.obtener(job_id, empresa_id=empresa_id)
+            if not job:
+                return jsonify({"ok": False, "error": "Exportación no encontrada"}), 404
+            return jsonify({"ok": True, "data": job})
+        except ValueError as ve:
+            return jsonify({"ok": False, "error": str(ve)}), 400
+        except Exception as ex:
+            return jsonify({"ok": False, "error": str(ex)}), 500
+
+    def descargar_exportacion(self, job_id: str):
+        """Descarga el archivo de una exportación terminada"""
         try:
-            documentos = item.get("documentos", [])
-            return str(len(documentos))
-        except Exception:
-            return "0"
+            empresa_id = self._empresa_id()
+            job = gestor_exportaciones.obtener(job_id, empresa_id=empresa_id)
+            if not job:
+                return jsonify({"ok": False, "error": "Exportación no encontrada"}), 404
+            if job["estado"] != "completado":
+                return jsonify({"ok": False, "error": f"La exportación está en estado '{job['estado']}'", "data": job}), 409
+
+            if job["almacenamiento"] == "supabase":
+                url = gestor_exportaciones.url_descarga(job_id)
+                if not url:
+                    return jsonify({"ok": False, "error": "Archivo de exportación no disponible"}), 410
+                return redirect(url)
+
+            ruta_archivo = gestor_exportaciones.ruta_local(job_id)
+            if not ruta_archivo:
+                return jsonify({"ok": False, "error": "Archivo de exportación no disponible"}), 410
+            response = send_file(ruta_archivo, as_attachment=True, download_name=job["nombre_archivo"])
+            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+            return response
+        except ValueError as ve:
+            return jsonify({"ok": False, "error": str(ve)}), 400
+        except Exception as ex:
+            log_error(ex, "ERROR AL DESCARGAR EXPORTACIÓN")
+            return jsonify({"ok": False, "error": str(ex)}), 500
 
-    def _listar_documentos(self, item: dict) -> str:
-        """Lista los nombres de los documentos separados por coma"""
+    def _generar_exportacion_ventas(self, empresa_id: int, formato: str, ruta_destino: str, progreso) -> int:
+        """Genera la exportación de ventas en ruta_destino informando el avance (se ejecuta en el pool de exportaciones)"""
+        total = self.model.contar_para_excel(empresa_id=empresa_id)
+        progreso(0, total)
+
+        escritas = 0
+
+        def _con_progreso(registros):
+            nonlocal escritas
+            for registro in registros:
+                yield registro
+                escritas += 1
+                if escritas % 100 == 0:
+                    progreso(escritas, None)
+
+        data = self.model.iterar_completo_para_excel(
+            empresa_id=empresa_id, tamano_pagina=TAMANO_PAGINA_EXPORTACION
+        )
+        self._escribir_exportacion_ventas(formato, COLUMNAS_VENTAS, _con_progreso(data), ruta_destino=ruta_destino)
+        progreso(escritas, None)
+        return escritas
+
+    def _formato_exportacion(self) -> str:
+        """Formato pedido en ?format= (o en el body JSON); por defecto xlsx"""
+        formato = request.args.get("format")
+        if not formato and request.is_json:
+            formato = (request.get_json(silent=True) or {}).get("format")
+        formato = (formato or "xlsx").strip().lower()
+        if formato not in TIPOS_EXPORTACION:
+            raise ValueError(f"format debe ser uno de: {', '.join(TIPOS_EXPORTACION)}")
+        if formato == "parquet" and pq is None:
+            raise ValueError("El formato parquet requiere el paquete pyarrow instalado en el servidor")
+        return formato
+
+    def _escribir_exportacion_ventas(self, formato: str, columnas_config: list, data, ruta_destino: str | None = None) -> str:
+        """Escribe la exportación en el formato pedido y devuelve la ruta del archivo"""
+        if formato == "csv":
+            return self._escribir_csv_ventas(columnas_config, data, ruta_destino=ruta_destino)
+        if formato == "parquet":
+            return self._escribir_parquet_ventas(columnas_config, data, ruta_destino=ruta_destino)
+        return self._escribir_excel_ventas(columnas_config, data, ruta_destino=ruta_destino)
+
+    def _filas_ventas(self, columnas_config: list, data):
+        """Genera cada fila de la exportación como tupla de textos, en el orden de columnas_config"""
+        aplanador = AplanadorFilas(columnas_config)
+        for row_idx, item in enumerate(data, start=2):
+            yield aplanador.aplanar(item, row_idx)
+
+    def _escribir_excel_ventas(self, columnas_config: list, data, ruta_destino: str | None = None) -> str:
+        """
+        Escribe la exportación con una hoja write-only de openpyxl (las filas van a disco,
+        no se guardan en memoria) y devuelve la ruta del archivo generado
+        (un temporal si no se indica ruta_destino).
+        """
+        headers = [col[0] for col in columnas_config]
+        filas = self._filas_ventas(columnas_config, data)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title="Ventas")
+
+        # Estilos compartidos: openpyxl los registra una sola vez en el libro
+        header_fill = PatternFill(start_color="4CAF50", end_color="4CAF50", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=11)
+        header_alignment = Alignment(horizontal="center", vertical="center")
+        body_alignment = Alignment(horizontal="left", vertical="center")
+
+        # En modo write-only los anchos deben fijarse antes de la primera fila, así que se
+        # calculan sobre los encabezados y una muestra inicial que se mantiene en memoria
+        muestra = list(itertools.islice(filas, MUESTRA_ANCHOS_EXCEL))
+        anchos = [len(header) for header in headers]
+        for fila in muestra:
+            for col_idx, value in enumerate(fila):
+                if len(value) > anchos[col_idx]:
+                    anchos[col_idx] = len(value)
+        for col_idx, ancho in enumerate(anchos, start=1):
+            # Margen adicional (máximo 50 para evitar columnas muy anchas)
+            ws.column_dimensions[get_column_letter(col_idx)].width = min(ancho + 3, 50)
+
+        def _celdas(valores, font=None, fill=None, alignment=None):
+            celdas = []
+            for value in valores:
+                cell = WriteOnlyCell(ws, value=value)
+                if font is not None:
+                    cell.font = font
+                if fill is not None:
+                    cell.fill = fill
+                cell.alignment = alignment
+                celdas.append(cell)
+            return celdas
+
+        ws.append(_celdas(headers, font=header_font, fill=header_fill, alignment=header_alignment))
+        total = 0
+        for fila in itertools.chain(muestra, filas):
+            ws.append(_celdas(fila, alignment=body_alignment))
+            total += 1
+
+        if ruta_destino is None:
+            archivo = tempfile.NamedTemporaryFile(prefix="ventas_", suffix=".xlsx", delete=False)
+            archivo.close()
+            ruta_destino = archivo.name
         try:
-            documentos = item.get("documentos", [])
-            nombres = [doc.get("tipo_documento", "") for doc in documentos if doc.get("tipo_documento")]
-            return ", ".join(nombres) if nombres else ""
-        except Exception:
-            return ""
-
-    def _extraer_fecha(self, created_at: str) -> str:
-        """Extrae la fecha en formato DD/MM/YYYY del timestamp, convertido a zona horaria de Colombia (UTC-5)"""
-        if not created_at:
-            return ""
+            wb.save(ruta_destino)
+        except Exception as save_error:
+            print(f"   ❌ Error al guardar Excel: {save_error}")
+            if os.path.exists(ruta_destino):
+                os.remove(ruta_destino)
+            raise
+
+        print(f"   ✅ Excel generado con {len(headers)} columnas y {total} registros")
+        return ruta_destino
+
+    def _csv_por_partes(self, columnas_config: list, data, filas_por_parte: int = 200):
+        """Genera el CSV (UTF-8) en bloques de texto a medida que se producen las filas"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([col[0] for col in columnas_config])
+        pendientes = 0
+        for fila in self._filas_ventas(columnas_config, data):
+            writer.writerow(fila)
+            pendientes += 1
+            if pendientes >= filas_por_parte:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate(0)
+                pendientes = 0
+        yield buffer.getvalue().encode("utf-8")
+
+    def _escribir_csv_ventas(self, columnas_config: list, data, ruta_destino: str | None = None) -> str:
+        """Escribe la exportación en CSV y devuelve la ruta del archivo (un temporal si no se indica)"""
+        if ruta_destino is None:
+            archivo = tempfile.NamedTemporaryFile(prefix="ventas_", suffix=".csv", delete=False)
+            archivo.close()
+            ruta_destino = archivo.name
         try:
-            # Parsear el timestamp UTC
-            dt_utc = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-
-            # Convertir a zona horaria de Colombia (UTC-5)
-            colombia_tz = timezone(timedelta(hours=-5))
-            dt_colombia = dt_utc.astimezone(colombia_tz)
-
-            return dt_colombia.strftime("%d/%m/%Y")
-        except Exception as e:
-            try:
-                return created_at.split("T")[0] if "T" in str(created_at) else str(created_at)
-            except:
-                return ""
-
-    def _extraer_hora(self, created_at: str) -> str:
-        """Extrae la hora en formato 12 horas (hh:mm:ss AM/PM) del timestamp, convertido a zona horaria de Colombia (UTC-5)"""
-        if not created_at:
-            return ""
+            with open(ruta_destino, "wb") as archivo:
+                for parte in self._csv_por_partes(columnas_config, data):
+                    archivo.write(parte)
+        except Exception as save_error:
+            print(f"   ❌ Error al guardar CSV: {save_error}")
+            if os.path.exists(ruta_destino):
+                os.remove(ruta_destino)
+            raise
+        return ruta_destino
+
+    def _escribir_parquet_ventas(self, columnas_config: list, data, ruta_destino: str | None = None) -> str:
+        """
+        Escribe la exportación en Parquet por lotes columnares: cada lote de filas se
+        transpone a columnas y se agrega como row group, sin cargar todo en memoria.
+        """
+        headers = [col[0] for col in columnas_config]
+        schema = pa.schema([(header, pa.string()) for header in headers])
+        if ruta_destino is None:
+            archivo = tempfile.NamedTemporaryFile(prefix="ventas_", suffix=".parquet", delete=False)
+            archivo.close()
+            ruta_destino = archivo.name
+
+        total = 0
+        filas = self._filas_ventas(columnas_config, data)
         try:
-            # Parsear el timestamp UTC
-            dt_utc = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-
-            # Convertir a zona horaria de Colombia (UTC-5)
-            colombia_tz = timezone(timedelta(hours=-5))
-            dt_colombia = dt_utc.astimezone(colombia_tz)
-
-            # Formato 12 horas con AM/PM
-            return dt_colombia.strftime("%I:%M:%S %p")
-        except Exception as e:
+            with pq.ParquetWriter(ruta_destino, schema, compression="snappy") as writer:
+                while True:
+                    lote = list(itertools.islice(filas, LOTE_PARQUET))
+                    if not lote:
+                        break
+                    columnas = [pa.array(columna, type=pa.string()) for columna in zip(*lote)]
+                    writer.write_batch(pa.RecordBatch.from_arrays(columnas, schema=schema))
+                    total += len(lote)
+        except Exception as save_error:
+            print(f"   ❌ Error al guardar Parquet: {save_error}")
+            if os.path.exists(ruta_destino):
+                os.remove(ruta_destino)
+            raise
+
+        print(f"   ✅ Parquet generado con {len(headers)} columnas y {total} registros")
+        return ruta_destino
+
+    def _leer_por_partes(self, ruta_archivo: str, tamano_parte: int = 64 * 1024):
+        """Envía un archivo temporal por partes y lo elimina al terminar"""
+        try:
+            with open(ruta_archivo, "rb") as archivo:
+                while True:
+                    parte = archivo.read(tamano_parte)
+                    if not parte:
+                        break
+                    yield parte
+        finally:
             try:
-                if "T" in str(created_at):
-                    return created_at.split("T")[1].split(".")[0]
-                return ""
-            except:
-                return ""
+                os.remove(ruta_archivo)
+            except OSError:
+                pass
 
     def update(self, id: int):
         try:
@@ -641,62 +710,11 @@ class SolicitantesController:
             datos_solicitante["empresa_id"] = empresa_id
             # print(f"   Datos a guardar: {datos_solicitante}")
 
-            solicitante_creado = self.model.create(**datos_solicitante)
-            solicitante_id = solicitante_creado["id"]
-            # print(f"   ✅ Solicitante creado con ID: {solicitante_id}")
-
-            # 1.b SUBIR DOCUMENTOS (si vinieron en multipart)
-            documentos_creados = []
-            if files_list:
-                # print(f"\n1️⃣b SUBIENDO DOCUMENTOS ({len(files_list)})...")
-                storage = supabase.storage.from_("document")
-                for idx, file in enumerate(files_list):
-                    try:
-                        original_name = secure_filename(file.filename or f"documento_{idx+1}")
-                        ext = os.path.splitext(original_name)[1]
-                        unique_name = f"{uuid.uuid4().hex}{ext}" if ext else uuid.uuid4().hex
-                        storage_path = f"solicitantes/{solicitante_id}/{unique_name}"
-
-                        content_type = getattr(file, "mimetype", None) or "application/octet-stream"
-                        file_bytes = file.read()
-                        storage.upload(
-                            storage_path,
-                            file_bytes,
-                            file_options={
-                                "content-type": content_type,
-                                "upsert": "true",
-                            },
-                        )
-
-                        public_url_resp = storage.get_public_url(storage_path)
-                        public_url = None
-                        if isinstance(public_url_resp, dict):
-                            public_url = public_url_resp.get("publicUrl") or (
-                                public_url_resp.get("data", {}) if isinstance(public_url_resp.get("data"), dict) else {}
-                            ).get("publicUrl")
-                        elif hasattr(public_url_resp, "data"):
-                            data_dict = getattr(public_url_resp, "data", {})
-                            if isinstance(data_dict, dict):
-                                public_url = data_dict.get("publicUrl")
-                        if not public_url:
-                            public_url = str(public_url_resp)
-
-                        doc_saved = self.documentos_model.create(
-                            nombre=original_name,
-                            documento_url=public_url,
-                            solicitante_id=solicitante_id,
-                        )
-                        # Guardar también los bytes para adjuntar directamente al email (sin descargar)
-                        doc_saved['_bytes'] = file_bytes  # Bytes en memoria para adjuntar
-                        doc_saved['_content_type'] = content_type  # Tipo MIME para adjuntar
-                        documentos_creados.append(doc_saved)
-                        # print(f"   ✅ Documento subido: {original_name}")
-                    except Exception as e:
-                        print(f"   ❌ Error subiendo documento {idx+1}: {e}")
-                # print(f"   📊 Total documentos subidos y guardados: {len(documentos_creados)}")
+            # Se arman y validan todas las filas; se insertan juntas en el paso 7, en una sola transacción
+            payload_solicitante = self.model.construir_payload(**datos_solicitante)
 
             # 2. CREAR UBICACIONES
-            ubicaciones_creadas = []
+            payloads_ubicaciones = []
             if datos_ubicaciones:
                 # print(f"\n2️⃣ CREANDO UBICACIONES...")
                 for idx, ubicacion_data in enumerate(datos_ubicaciones):
@@ -723,16 +741,15 @@ class SolicitantesController:
 
                     # print(f"   Ubicación {idx + 1} procesada: {ubicacion_data}")
                     ubicacion_data["empresa_id"] = empresa_id
-                    ubicacion_data["solicitante_id"] = solicitante_id
+                    ubicacion_data["solicitante_id"] = None  # Lo asigna RegistroCompletoModel.crear
 
-                    ubicacion_creada = self.ubicaciones_model.create(**ubicacion_data)
-                    ubicaciones_creadas.append(ubicacion_creada)
+                    payloads_ubicaciones.append(self.ubicaciones_model.construir_payload(**ubicacion_data))
                     # print(f"   ✅ Ubicación {idx + 1} creada con ID: {ubicacion_creada['id']}")
             # else:
                 # print(f"\n2️⃣ UBICACIONES: No hay datos para crear")
 
             # 3. CREAR ACTIVIDAD ECONÓMICA
-            actividad_creada = None
+            payload_actividad = None
             if datos_actividad:
                 # print(f"\n3️⃣ CREANDO ACTIVIDAD ECONÓMICA...")
                 # print(f"   Datos originales: {datos_actividad}")
@@ -752,15 +769,15 @@ class SolicitantesController:
 
                 # print(f"   Datos procesados: {datos_actividad}")
                 datos_actividad["empresa_id"] = empresa_id
-                datos_actividad["solicitante_id"] = solicitante_id
+                datos_actividad["solicitante_id"] = None
 
-                actividad_creada = self.actividad_model.create(**datos_actividad)
+                payload_actividad = self.actividad_model.construir_payload(**datos_actividad)
                 # print(f"   ✅ Actividad económica creada con ID: {actividad_creada['id']}")
             # else:
                 # print(f"\n3️⃣ ACTIVIDAD ECONÓMICA: No hay datos para crear")
 
             # 4. CREAR INFORMACIÓN FINANCIERA
-            financiera_creada = None
+            payload_financiera = None
             if datos_financiera:
                 # print(f"\n4️⃣ CREANDO INFORMACIÓN FINANCIERA...")
                 # print(f"   Datos originales: {datos_financiera}")
@@ -786,7 +803,7 @@ class SolicitantesController:
                 # Preparar campos obligatorios (con valores por defecto si no están presentes)
                 datos_para_modelo = {
                     "empresa_id": empresa_id,
-                    "solicitante_id": solicitante_id,
+                    "solicitante_id": None,
                     "total_ingresos_mensuales": float(datos_financiera.get("total_ingresos_mensuales", 0)),
                     "total_egresos_mensuales": float(datos_financiera.get("total_egresos_mensuales", 0)),
                     "total_activos": float(datos_financiera.get("total_activos", 0)),
@@ -796,13 +813,13 @@ class SolicitantesController:
 
                 # print(f"   Datos procesados: {datos_para_modelo}")
 
-                financiera_creada = self.financiera_model.create(**datos_para_modelo)
+                payload_financiera = self.financiera_model.construir_payload(**datos_para_modelo)
                 # print(f"   ✅ Información financiera creada con ID: {financiera_creada['id']}")
             # else:
                 # print(f"\n4️⃣ INFORMACIÓN FINANCIERA: No hay datos para crear")
 
             # 5. CREAR REFERENCIAS (JSON en una sola fila por solicitante)
-            referencias_creadas = []
+            referencias_a_crear = []
             if datos_referencias:
                 # print(f"\n5️⃣ CREANDO REFERENCIAS (JSON)...")
                 for idx, referencia_data in enumerate(datos_referencias):
@@ -846,19 +863,20 @@ class SolicitantesController:
                         print(f"   ⚠️ Referencia {idx+1}: no se crea porque está vacía o solo trae 'tipo_referencia' (keys={list(nueva_ref.keys())})")
                         continue
 
-                    # Agregar mediante el modelo JSON (generará referencia_id incremental)
-                    agregado = self.referencias_model.add_referencia(
-                        empresa_id=empresa_id,
-                        solicitante_id=solicitante_id,
-                        referencia=cleaned
-                    )
-                    referencias_creadas.append(agregado)
+                    referencias_a_crear.append(cleaned)
                 # print(f"   ✅ Total referencias agregadas: {len(referencias_creadas)}")
             # else:
                 # print(f"\n5️⃣ REFERENCIAS: No hay datos para crear")
 
+            # Contenedor JSON con todas las referencias (referencia_id incremental desde 1)
+            payload_referencias = None
+            if referencias_a_crear:
+                payload_referencias = self.referencias_model.construir_contenedor(
+                    empresa_id=empresa_id, solicitante_id=None, referencias=referencias_a_crear
+                )
+
             # 6. CREAR SOLICITUDES
-            solicitudes_creadas = []
+            payloads_solicitudes = []
             if datos_solicitudes:
                 # print(f"\n6️⃣ CREANDO SOLICITUDES...")
                 for idx, solicitud_data in enumerate(datos_solicitudes):
@@ -987,7 +1005,7 @@ class SolicitantesController:
                     # Preparar datos para el modelo (solo campos que acepta el modelo)
                     datos_para_modelo = {
                         "empresa_id": empresa_id,
-                        "solicitante_id": solicitante_id,
+                        "solicitante_id": None,
                         "created_by_user_id": int(user_id),
                         "assigned_to_user_id": assigned_to_user_id,
                         "estado": solicitud_data.get("estado", "Pendiente"),
@@ -1002,28 +1020,54 @@ class SolicitantesController:
 
                     print(f"   🧾 Payload solicitud (create) {idx + 1}: {datos_para_modelo}")
 
-                    solicitud_creada = self.solicitudes_model.create(**datos_para_modelo)
-                    if (
-                        solicitud_creada
-                        and isinstance(solicitud_creada, dict)
-                        and solicitud_creada.get("id")
-                        and solicitud_creada.get("assigned_to_user_id") != assigned_to_user_id
-                    ):
-                        try:
-                            solicitud_creada = self.solicitudes_model.update(
-                                id=solicitud_creada["id"],
-                                empresa_id=empresa_id,
-                                base_updates={"assigned_to_user_id": assigned_to_user_id},
-                                detalle_credito_merge=None,
-                            )
-                        except Exception as assign_sync_error:
-                            print(f"   ⚠️ No se pudo sincronizar assigned_to_user_id post-creación: {assign_sync_error}")
-                    solicitudes_creadas.append(solicitud_creada)
+                    payloads_solicitudes.append(self.solicitudes_model.construir_payload(**datos_para_modelo))
                     # print(f"   ✅ Solicitud {idx + 1} creada con ID: {solicitud_creada['id']}")
             # else:
                 # print(f"\n6️⃣ SOLICITUDES: No hay datos para crear")
 
-            # 7. PREPARAR RESPUESTA
+            # 7. INSERTAR TODO EN UNA SOLA TRANSACCIÓN (todo o nada)
+            creado = self.registro_completo_model.crear(
+                empresa_id=empresa_id,
+                registro={
+                    "solicitante": payload_solicitante,
+                    "ubicaciones": payloads_ubicaciones,
+                    "actividad_economica": payload_actividad,
+                    "informacion_financiera": payload_financiera,
+                    "referencias": payload_referencias,
+                    "solicitudes": payloads_solicitudes,
+                },
+            )
+            solicitante_creado = creado["solicitante"]
+            solicitante_id = solicitante_creado["id"]
+            ubicaciones_creadas = creado["ubicaciones"]
+            actividad_creada = creado["actividad_economica"]
+            financiera_creada = creado["informacion_financiera"]
+            referencias_creadas = [creado["referencias"]] if creado["referencias"] else []
+
+            solicitudes_creadas = []
+            for solicitud_creada, payload_solicitud in zip(creado["solicitudes"], payloads_solicitudes):
+                assigned_to_user_id = payload_solicitud.get("assigned_to_user_id")
+                if (
+                    solicitud_creada
+                    and isinstance(solicitud_creada, dict)
+                    and solicitud_creada.get("id")
+                    and solicitud_creada.get("assigned_to_user_id") != assigned_to_user_id
+                ):
+                    try:
+                        solicitud_creada = self.solicitudes_model.update(
+                            id=solicitud_creada["id"],
+                            empresa_id=empresa_id,
+                            base_updates={"assigned_to_user_id": assigned_to_user_id},
+                            detalle_credito_merge=None,
+                        )
+                    except Exception as assign_sync_error:
+                        print(f"   ⚠️ No se pudo sincronizar assigned_to_user_id post-creación: {assign_sync_error}")
+                solicitudes_creadas.append(solicitud_creada)
+
+            # 7.b SUBIR DOCUMENTOS (si vinieron en multipart): en paralelo y un solo insert en BD
+            documentos_creados, documentos_fallidos = self._subir_documentos(files_list, solicitante_id)
+
+            # 8. PREPARAR RESPUESTA
             # print(f"\n🔗 PREPARANDO RESPUESTA FINAL...")
             response_data = {
                 "ok": True,
@@ -1035,12 +1079,13 @@ class SolicitantesController:
                     "referencias": referencias_creadas,
                     "solicitudes": solicitudes_creadas,
                     "documentos": documentos_creados,
+                    "documentos_fallidos": documentos_fallidos,
                     "resumen": {
                         "solicitante_id": solicitante_id,
                         "total_ubicaciones": len(ubicaciones_creadas),
                         "tiene_actividad_economica": bool(actividad_creada),
                         "tiene_informacion_financiera": bool(financiera_creada),
-                        "total_referencias": len(referencias_creadas),
+                        "total_referencias": len(referencias_a_crear),
                         "total_solicitudes": len(solicitudes_creadas)
                     }
                 },
@@ -1055,7 +1100,7 @@ class SolicitantesController:
             # print(f"   👥 Referencias: {len(referencias_creadas)}")
             # print(f"   📄 Solicitudes: {len(solicitudes_creadas)}")
 
-            # 8. OBTENER DOCUMENTOS DESDE BD (por si se subieron después o en llamadas separadas)
+            # 9. OBTENER DOCUMENTOS DESDE BD (por si se subieron después o en llamadas separadas)
             print(f"\n📎 OBTENIENDO DOCUMENTOS DESDE BD PARA EMAILS...")
             try:
                 documentos_desde_bd = self.documentos_model.list(solicitante_id=solicitante_id)
@@ -1079,7 +1124,7 @@ class SolicitantesController:
                 # Continuar con documentos_creados si hay error
                 print(f"   📊 Usando documentos creados aquí: {len(documentos_creados)}")
 
-            # 9. NO ENVIAR EMAILS AUTOMÁTICAMENTE
+            # 10. NO ENVIAR EMAILS AUTOMÁTICAMENTE
             # Los emails se enviarán cuando el frontend llame al endpoint POST /solicitantes/<solicitante_id>/enviar-emails
             # después de subir todos los documentos
             print(f"\n📧 Emails NO enviados automáticamente")
@@ -1114,62 +1159,20 @@ class SolicitantesController:
         try:
             empresa_id = self._empresa_id()
 
-            # 1. Obtener datos del solicitante principal
-            solicitante = self.model.get_by_id(id=solicitante_id, empresa_id=empresa_id)
-            if not solicitante:
+            # Solicitante y todas sus secciones en una sola ida y vuelta
+            registro = self.registro_completo_model.cargar(solicitante_id=solicitante_id, empresa_id=empresa_id)
+            if not registro:
                 return jsonify({"ok": False, "error": "Solicitante no encontrado"}), 404
 
-            # 2. Obtener ubicaciones
-            try:
-                ubicaciones = self.ubicaciones_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                ubicaciones = []
+            ubicaciones = registro["ubicaciones"]
+            actividad_economica = registro["actividad_economica"]
+            informacion_financiera = registro["informacion_financiera"]
+            referencias = registro["referencias"]
+            solicitudes = registro["solicitudes"]
+            documentos = registro["documentos"]
 
-            # 3. Obtener actividad económica
-            try:
-                actividad_economica_list = self.actividad_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-                actividad_economica = actividad_economica_list[0] if actividad_economica_list else None
-            except Exception as e:
-                actividad_economica = None
-
-            # 4. Obtener información financiera
-            try:
-                financiera_list = self.financiera_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-                informacion_financiera = financiera_list[0] if financiera_list else None
-            except Exception as e:
-                print(f"   ❌ Error obteniendo información financiera: {e}")
-                informacion_financiera = None
-
-            # 5. Obtener referencias
-            try:
-                referencias = self.referencias_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                print(f"   ❌ Error obteniendo referencias: {e}")
-                referencias = []
-
-            # 6. Obtener solicitudes
-            try:
-                solicitudes = self.solicitudes_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                print(f"   ❌ Error obteniendo solicitudes: {e}")
-                solicitudes = []
-
-            # 7. Obtener documentos
-            try:
-                documentos = self.documentos_model.list(solicitante_id=solicitante_id)
-            except Exception as e:
-                print(f"   ❌ Error obteniendo documentos: {e}")
-                documentos = []
-
-            # 8. Combinar toda la información
             datos_completos = {
-                "solicitante": solicitante,
-                "ubicaciones": ubicaciones or [],
-                "actividad_economica": actividad_economica,
-                "informacion_financiera": informacion_financiera,
-                "referencias": referencias or [],
-                "solicitudes": solicitudes or [],
-                "documentos": documentos or [],
+                **registro,
                 "resumen": {
                     "total_ubicaciones": len(ubicaciones) if ubicaciones else 0,
                     "tiene_actividad_economica": bool(actividad_economica),
@@ -1202,49 +1205,23 @@ class SolicitantesController:
         try:
             empresa_id = self._empresa_id()
 
-            # 1. Obtener datos del solicitante principal
-            solicitante = self.model.get_by_id(id=solicitante_id, empresa_id=empresa_id)
-            if not solicitante:
+            # 1-2. Solicitante y entidades relacionadas en una sola ida y vuelta (igual que traer_todos_registros)
+            registro = self.registro_completo_model.cargar(solicitante_id=solicitante_id, empresa_id=empresa_id)
+            if not registro:
                 return jsonify({"ok": False, "error": "Solicitante no encontrado"}), 404
 
-            # 2. Obtener todas las entidades relacionadas (similar a traer_todos_registros)
-            try:
-                ubicaciones = self.ubicaciones_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                ubicaciones = []
-
-            try:
-                actividad_economica_list = self.actividad_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-                actividad_economica = actividad_economica_list[0] if actividad_economica_list else None
-            except Exception as e:
-                actividad_economica = None
-
-            try:
-                financiera_list = self.financiera_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-                informacion_financiera = financiera_list[0] if financiera_list else None
-            except Exception as e:
-                informacion_financiera = None
-
-            try:
-                referencias = self.referencias_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                referencias = []
-
-            try:
-                solicitudes = self.solicitudes_model.list(empresa_id=empresa_id, solicitante_id=solicitante_id)
-            except Exception as e:
-                solicitudes = []
-
             # 3. Obtener documentos con reintentos (por si se están subiendo en paralelo)
             import time
-            documentos = []
+            documentos = registro["documentos"]
             max_intentos = 10  # Hasta 10 intentos
             delay_intento = 2  # 2 segundos entre intentos (total hasta 20 segundos)
 
             print(f"\n📎 Buscando documentos para enviar en emails...")
             for intento in range(max_intentos):
                 try:
-                    documentos = self.documentos_model.list(solicitante_id=solicitante_id)
+                    # El primer intento ya viene con el registro completo
+                    if intento > 0:
+                        documentos = self.documentos_model.list(solicitante_id=solicitante_id)
                     if documentos and len(documentos) > 0:
                         print(f"   ✅ Documentos encontrados: {len(documentos)} (intento {intento + 1}/{max_intentos})")
                         break
@@ -1266,15 +1243,7 @@ class SolicitantesController:
             # 4. Construir response_data similar al de crear_registro_completo
             response_data = {
                 "ok": True,
-                "data": {
-                    "solicitante": solicitante,
-                    "ubicaciones": ubicaciones or [],
-                    "actividad_economica": actividad_economica,
-                    "informacion_financiera": informacion_financiera,
-                    "referencias": referencias or [],
-                    "solicitudes": solicitudes or [],
-                    "documentos": documentos or []
-                }
+                "data": {**registro, "documentos": documentos or []}
             }
 
             # 5. Obtener el JSON original si está disponible (para extraer correos)
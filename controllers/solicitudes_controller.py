@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from flask import request, jsonify
 from models.solicitudes_model import SolicitudesModel
+from utils.usuario_autenticado import obtener_usuario_autenticado
 from models.json_schema_model import JSONSchemaModel
 from models.configuraciones_model import ConfiguracionesModel
 
@@ -22,61 +23,8 @@ class SolicitudesController:
             raise ValueError("empresa_id debe ser entero") from exc
 
     def _obtener_usuario_autenticado(self):
-        """Obtener información del usuario autenticado desde la base de datos"""
-        try:
-            # Obtener el token del header Authorization
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                return None
-
-            # Por ahora, usaremos un header personalizado para el user_id
-            # En una implementación real, decodificarías el JWT aquí
-            user_id = request.headers.get("X-User-Id")
-            if not user_id:
-                return None
-
-            # Consultar la base de datos para obtener información completa del usuario
-            from data.supabase_conn import supabase
-
-            user_response = supabase.table("usuarios").select("id, rol, info_extra").eq("id", int(user_id)).execute()
-            user_data = user_response.data[0] if user_response.data else None
-
-            if not user_data:
-                return None
-
-            # Extraer banco_nombre y ciudad del info_extra del usuario
-            info_extra_raw = user_data.get("info_extra", {})
-
-            # Parsear info_extra si es string JSON
-            if isinstance(info_extra_raw, str):
-                import json
-                try:
-                    info_extra = json.loads(info_extra_raw)
-                except json.JSONDecodeError:
-                    info_extra = {}
-            else:
-                info_extra = info_extra_raw
-
-            banco_nombre = info_extra.get("banco_nombre")
-            ciudad_solicitud = info_extra.get("ciudad")  # En la BD está como "ciudad"
-
-                # print(f"🔍 INFO USUARIO:")
-                # print(f"   👤 User ID: {user_data['id']}")
-                # print(f"   🏷️ Rol: {user_data.get('rol', 'empresa')}")
-                # print(f"   📋 Info Extra Raw: {info_extra_raw}")
-                # print(f"   📋 Info Extra Parsed: {info_extra}")
-                # print(f"   🏦 Banco extraído: {banco_nombre}")
-                # print(f"   🏙️ Ciudad extraída: {ciudad_solicitud}")
-
-            return {
-                "id": user_data["id"],
-                "rol": user_data.get("rol", "empresa"),
-                "banco_nombre": banco_nombre,  # Desde info_extra del usuario
-                "ciudad_solicitud": ciudad_solicitud  # Desde info_extra del usuario
-            }
-        except Exception as e:
-            print(f"Error obteniendo usuario autenticado: {e}")
-            return None
+        """Usuario autenticado de la petición (resuelto una vez por petición y en caché por ID)"""
+        return obtener_usuario_autenticado(permitir_query_param=False)
 
     def _aplicar_filtros_por_rol(self, query, usuario_info):
         """Aplicar filtros de permisos basados en el rol del usuario"""
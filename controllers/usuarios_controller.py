@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from flask import request, jsonify
 from models.usuarios_model import UsuariosModel
+from utils.contrasenas import ServicioSaturadoError
 from utils.debug_helpers import (
     log_request_details, log_operation_result, log_response, log_error
 )
@@ -147,6 +148,9 @@ class UsuariosController:
         except ValueError as ve:
             log_error(ve, "ERROR DE VALIDACIÓN")
             return jsonify({"ok": False, "error": str(ve)}), 400
+        except ServicioSaturadoError as se:
+            log_error(se, "SERVICIO SATURADO")
+            return jsonify({"ok": False, "error": str(se)}), 503, {"Retry-After": str(int(se.reintentar_en) or 1)}
         except Exception as ex:
             log_error(ex, "ERROR INESPERADO")
             return jsonify({"ok": False, "error": str(ex)}), 500
@@ -186,6 +190,9 @@ class UsuariosController:
         except ValueError as ve:
             log_error(ve, "ERROR DE VALIDACIÓN")
             return jsonify({"ok": False, "error": str(ve)}), 400
+        except ServicioSaturadoError as se:
+            log_error(se, "SERVICIO SATURADO")
+            return jsonify({"ok": False, "error": str(se)}), 503, {"Retry-After": str(int(se.reintentar_en) or 1)}
         except Exception as ex:
             log_error(ex, "ERROR INESPERADO")
             return jsonify({"ok": False, "error": str(ex)}), 500
@@ -0,0 +1,211 @@
+"""
+Acceso asíncrono a Supabase para endpoints compuestos.
+
+Los modelos usan el cliente síncrono: un endpoint que necesita siete lecturas
+independientes paga siete latencias de red seguidas. Aquí hay un AsyncClient de
+supabase-py que vive en un event loop propio del proceso (en un hilo de fondo),
+de modo que el código síncrono de Flask puede lanzar varias consultas a la vez
+con `consultar_en_paralelo` y esperar solo lo que tarda la más lenta.
+
+Los modelos exponen variantes `*_async` de sus lecturas que se ejecutan sobre este cliente.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturoTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from postgrest.utils import AsyncClient as PostgrestHTTPClientAsync
+from supabase import AsyncClient, acreate_client
+from supabase.lib.client_options import AsyncClientOptions
+
+from data.supabase_conn import (
+    HTTP2,
+    HTTP_REINTENTOS,
+    HTTP_TIMEOUT,
+    HTTP_TIMEOUT_STORAGE,
+    _aplicar_timeout_llamada,
+    _limites_http,
+    _metricas,
+    _timeout_http,
+    _timeout_llamada,
+)
+from utils.concurrencia import TIMEOUT_POR_DEFECTO
+
+T = TypeVar("T")
+
+_SIN_DEFAULT = object()
+
+
+class _ClienteHTTPAsync(PostgrestHTTPClientAsync):
+    """httpx.AsyncClient de PostgREST con el mismo pool, timeouts y métricas que el cliente síncrono."""
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        _aplicar_timeout_llamada(request)
+        inicio = time.monotonic()
+        _metricas.inicio()
+        error = None
+        try:
+            return await super().send(request, **kwargs)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            _metricas.fin(time.monotonic() - inicio, error)
+
+
+async def _crear_cliente() -> AsyncClient:
+    cliente = await acreate_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=AsyncClientOptions(
+            postgrest_client_timeout=HTTP_TIMEOUT,
+            storage_client_timeout=HTTP_TIMEOUT_STORAGE,
+        ),
+    )
+    # Igual que en supabase_conn: se sustituye la sesión por defecto por una con el pool ajustado
+    postgrest = cliente.postgrest
+    sesion_original = postgrest.session
+    postgrest.session = _ClienteHTTPAsync(
+        base_url=str(sesion_original.base_url),
+        headers=sesion_original.headers,
+        timeout=_timeout_http(HTTP_TIMEOUT),
+        follow_redirects=True,
+        transport=httpx.AsyncHTTPTransport(limits=_limites_http(), http2=HTTP2, retries=HTTP_REINTENTOS),
+    )
+    await sesion_original.aclose()
+    return cliente
+
+
+class _BucleFondo:
+    """Event loop en un hilo daemon, dueño del AsyncClient del proceso."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._cliente: Optional[AsyncClient] = None
+        self._cliente_lock: Optional[asyncio.Lock] = None
+        self.hilo = threading.Thread(target=self._correr, name="supabase-async", daemon=True)
+        self.hilo.start()
+
+    def _correr(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def cliente(self) -> AsyncClient:
+        if self._cliente is None:
+            if self._cliente_lock is None:
+                self._cliente_lock = asyncio.Lock()
+            async with self._cliente_lock:
+                if self._cliente is None:
+                    self._cliente = await _crear_cliente()
+        return self._cliente
+
+
+_bucle: Optional[tuple] = None
+_bucle_lock = threading.Lock()
+
+
+def _obtener_bucle() -> _BucleFondo:
+    """Bucle de fondo de este proceso; se recrea tras un fork (el hilo no sobrevive al fork)."""
+    global _bucle
+    pid = os.getpid()
+    entrada = _bucle
+    if entrada and entrada[0] == pid:
+        return entrada[1]
+    with _bucle_lock:
+        if _bucle is None or _bucle[0] != pid:
+            _bucle = (pid, _BucleFondo())
+        return _bucle[1]
+
+
+async def obtener_cliente_async() -> AsyncClient:
+    """AsyncClient de Supabase del proceso (solo dentro de corrutinas lanzadas con `ejecutar`)."""
+    return await _obtener_bucle().cliente()
+
+
+def ejecutar(corrutina: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Puente para código síncrono: ejecuta la corrutina en el bucle de fondo y espera su resultado.
+    Respeta el `con_timeout` activo en el hilo que llama. TimeoutError si no termina a tiempo.
+    """
+    bucle = _obtener_bucle()
+    if threading.current_thread() is bucle.hilo:
+        raise RuntimeError("ejecutar() no se puede llamar desde el bucle asíncrono; usa await")
+
+    timeout_llamada = _timeout_llamada.get()
+
+    async def _con_contexto():
+        # El contexto del hilo que llama no pasa al bucle: se reaplica el tiempo límite por llamada
+        _timeout_llamada.set(timeout_llamada)
+        return await corrutina
+
+    timeout = TIMEOUT_POR_DEFECTO if timeout is None else timeout
+    futuro = asyncio.run_coroutine_threadsafe(_con_contexto(), bucle.loop)
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturoTimeoutError as exc:
+        futuro.cancel()
+        raise TimeoutError(f"La consulta asíncrona excedió el tiempo límite de {timeout}s") from exc
+
+
+async def reunir(
+    consultas: Dict[str, Callable[[], Awaitable[Any]]],
+    timeout: Optional[float] = None,
+    defaults: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Lanza a la vez las corrutinas y devuelve {nombre: resultado}.
+    Mismas reglas que `ejecutar_en_paralelo`: si una falla o no termina a tiempo se usa
+    su valor en `defaults`; sin default se propaga el error (TimeoutError si se agotó el tiempo).
+    """
+    defaults = defaults or {}
+    timeout = TIMEOUT_POR_DEFECTO if timeout is None else timeout
+
+    inicio = time.monotonic()
+    tareas = {nombre: asyncio.ensure_future(fn()) for nombre, fn in consultas.items()}
+    if tareas:
+        await asyncio.wait(list(tareas.values()), timeout=timeout)
+
+    resultados: Dict[str, Any] = {}
+    error_sin_default: Optional[BaseException] = None
+    for nombre, tarea in tareas.items():
+        default = defaults.get(nombre, _SIN_DEFAULT)
+
+        if not tarea.done():
+            tarea.cancel()
+            print(f"⏱️ Consulta '{nombre}' sin respuesta tras {time.monotonic() - inicio:.1f}s")
+            if default is _SIN_DEFAULT:
+                error_sin_default = error_sin_default or TimeoutError(
+                    f"La consulta '{nombre}' excedió el tiempo límite de {timeout}s"
+                )
+            resultados[nombre] = default
+            continue
+
+        error = tarea.exception()
+        if error is not None:
+            if default is _SIN_DEFAULT:
+                error_sin_default = error_sin_default or error
+            else:
+                print(f"❌ Error en consulta '{nombre}': {error}")
+            resultados[nombre] = default
+            continue
+
+        resultados[nombre] = tarea.result()
+
+    # Se recorren todas antes de propagar para no dejar tareas sin cancelar ni excepciones sin leer
+    if error_sin_default is not None:
+        raise error_sin_default
+    return resultados
+
+
+def consultar_en_paralelo(
+    consultas: Dict[str, Callable[[], Awaitable[Any]]],
+    timeout: Optional[float] = None,
+    defaults: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Versión síncrona de `reunir` para controladores y modelos síncronos."""
+    timeout = TIMEOUT_POR_DEFECTO if timeout is None else timeout
+    # Margen sobre el timeout de las consultas para que `reunir` aplique los defaults antes de cortar
+    return ejecutar(reunir(consultas, timeout=timeout, defaults=defaults), timeout=timeout + 5)
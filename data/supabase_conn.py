@@ -1,10 +1,221 @@
 from dotenv import load_dotenv
 import os
-from supabase import create_client
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import httpx
+from postgrest.utils import SyncClient as PostgrestHTTPClient
+from supabase import Client, create_client
+from supabase.lib.client_options import SyncClientOptions
 
 load_dotenv()
 
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+# Pool HTTP hacia Supabase (por proceso; los hilos de un worker comparten las conexiones)
+HTTP_MAX_CONEXIONES = int(os.getenv("SUPABASE_HTTP_MAX_CONEXIONES", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_SEGUNDOS = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_SEGUNDOS", "30"))
+HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+
+# Tiempos límite: conexión y espera de un cupo en el pool; total de PostgREST y de Storage
+HTTP_TIMEOUT_CONEXION = float(os.getenv("SUPABASE_HTTP_TIMEOUT_CONEXION", "5"))
+HTTP_TIMEOUT_POOL = float(os.getenv("SUPABASE_HTTP_TIMEOUT_POOL", "10"))
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "120"))
+HTTP_TIMEOUT_STORAGE = float(os.getenv("SUPABASE_HTTP_TIMEOUT_STORAGE", "60"))
+
+# Reintentos de conexión (solo errores al conectar: seguro también para escrituras)
+HTTP_REINTENTOS = int(os.getenv("SUPABASE_HTTP_REINTENTOS", "2"))
+
+# Tiempo límite de la llamada en curso (ver con_timeout)
+_timeout_llamada: ContextVar[Optional[float]] = ContextVar("supabase_timeout_llamada", default=None)
+
+
+class _Metricas:
+    """Contadores de las peticiones HTTP a Supabase en este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self) -> None:
+        self.peticiones = 0
+        self.en_curso = 0
+        self.errores = 0
+        self.timeouts = 0
+        self.segundos_total = 0.0
+        self.segundos_max = 0.0
+
+    def inicio(self) -> None:
+        with self._lock:
+            self.peticiones += 1
+            self.en_curso += 1
+
+    def fin(self, segundos: float, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self.en_curso -= 1
+            self.segundos_total += segundos
+            self.segundos_max = max(self.segundos_max, segundos)
+            if isinstance(error, httpx.TimeoutException):
+                self.timeouts += 1
+            elif error is not None:
+                self.errores += 1
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "peticiones": self.peticiones,
+                "en_curso": self.en_curso,
+                "errores": self.errores,
+                "timeouts": self.timeouts,
+                "latencia_media_ms": round(1000 * self.segundos_total / self.peticiones, 1) if self.peticiones else 0.0,
+                "latencia_max_ms": round(1000 * self.segundos_max, 1),
+            }
+
+
+_metricas = _Metricas()
+
+
+def _aplicar_timeout_llamada(request: httpx.Request) -> None:
+    timeout = _timeout_llamada.get()
+    if timeout is not None:
+        request.extensions["timeout"] = httpx.Timeout(
+            timeout, connect=min(timeout, HTTP_TIMEOUT_CONEXION), pool=min(timeout, HTTP_TIMEOUT_POOL)
+        ).as_dict()
+
+
+def _limites_http() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONEXIONES,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_SEGUNDOS,
+    )
+
+
+def _timeout_http(timeout_total: float) -> httpx.Timeout:
+    return httpx.Timeout(timeout_total, connect=HTTP_TIMEOUT_CONEXION, pool=HTTP_TIMEOUT_POOL)
+
+
+class _ClienteHTTP(PostgrestHTTPClient):
+    """httpx.Client de PostgREST / Storage con pool ajustado, timeout por llamada y métricas."""
+
+    def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        _aplicar_timeout_llamada(request)
+        inicio = time.monotonic()
+        _metricas.inicio()
+        error = None
+        try:
+            return super().send(request, **kwargs)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            _metricas.fin(time.monotonic() - inicio, error)
+
+
+def _crear_sesion(base_url: str, headers, timeout_total: float) -> _ClienteHTTP:
+    return _ClienteHTTP(
+        base_url=base_url,
+        headers=headers,
+        timeout=_timeout_http(timeout_total),
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(limits=_limites_http(), http2=HTTP2, retries=HTTP_REINTENTOS),
+    )
+
+
+def _crear_cliente() -> Client:
+    cliente = create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=SyncClientOptions(
+            postgrest_client_timeout=HTTP_TIMEOUT,
+            storage_client_timeout=HTTP_TIMEOUT_STORAGE,
+        ),
+    )
+    # supabase-py no permite pasar el httpx.Client: se sustituyen las sesiones que crea por defecto
+    postgrest = cliente.postgrest
+    sesion_original = postgrest.session
+    postgrest.session = _crear_sesion(str(sesion_original.base_url), sesion_original.headers, HTTP_TIMEOUT)
+    sesion_original.close()
+
+    storage = cliente.storage
+    sesion_original = storage.session
+    storage.session = storage._client = _crear_sesion(
+        str(sesion_original.base_url), sesion_original.headers, HTTP_TIMEOUT_STORAGE
+    )
+    sesion_original.close()
+    return cliente
+
+
+_cliente: Optional[tuple] = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_cliente() -> Client:
+    """
+    Cliente de Supabase de este proceso, creado la primera vez que se usa.
+    Se recrea tras un fork (workers de gunicorn con preload) para no compartir sockets entre procesos.
+    """
+    global _cliente
+    pid = os.getpid()
+    entrada = _cliente
+    if entrada and entrada[0] == pid:
+        return entrada[1]
+    with _cliente_lock:
+        if _cliente is None or _cliente[0] != pid:
+            _cliente = (pid, _crear_cliente())
+            _metricas.reiniciar()
+        return _cliente[1]
+
+
+class _ClienteSupabase:
+    """Delegado de `supabase`: los módulos lo importan una vez y cada acceso usa el cliente del proceso."""
+
+    def __getattr__(self, nombre: str):
+        return getattr(obtener_cliente(), nombre)
+
+
+supabase = _ClienteSupabase()
+
+
+@contextmanager
+def con_timeout(segundos: float):
+    """Tiempo límite (total, en segundos) de las llamadas a Supabase hechas dentro del bloque en este hilo."""
+    token = _timeout_llamada.set(segundos)
+    try:
+        yield
+    finally:
+        _timeout_llamada.reset(token)
+
+
+def estadisticas_pool() -> Dict[str, Any]:
+    """Estado del pool HTTP hacia Supabase y contadores de peticiones de este proceso."""
+    estado: Dict[str, Any] = {
+        "pid": os.getpid(),
+        "http2": HTTP2,
+        "max_conexiones": HTTP_MAX_CONEXIONES,
+        "max_keepalive": HTTP_MAX_KEEPALIVE,
+        **_metricas.resumen(),
+    }
+    entrada = _cliente
+    if not entrada or entrada[0] != os.getpid():
+        return estado
+
+    for nombre, sesion in (("postgrest", entrada[1].postgrest.session), ("storage", entrada[1].storage.session)):
+        try:
+            # httpcore no expone estadísticas públicas: se leen las conexiones del pool del transporte
+            pool = sesion._transport._pool
+            conexiones = list(pool.connections)
+            estado[nombre] = {
+                "conexiones": len(conexiones),
+                "inactivas": sum(1 for conexion in conexiones if conexion.is_idle()),
+                "disponibles": sum(1 for conexion in conexiones if conexion.is_available()),
+                "peticiones_en_pool": len(getattr(pool, "_requests", [])),
+            }
+        except Exception as e:
+            estado[nombre] = {"error": str(e)}
+    return estado
 
 
 def check_supabase_health():
@@ -15,7 +226,8 @@ def check_supabase_health():
     """
     try:
         # Query mínima para validar conexión
-        supabase.table("empresas").select("id").limit(1).execute()
+        with con_timeout(5):
+            supabase.table("empresas").select("id").limit(1).execute()
         return True, None
     except Exception as e:
-        return False, str(e)
\ No newline at end of file
+        return False, str(e)
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, Optional, Tuple
+from utils.cache_ttl import CacheTTL
+
+# Alcances resueltos por usuario; UsuariosModel los invalida cuando cambian los usuarios de la empresa
+_cache_alcances = CacheTTL(
+    ttl_segundos=float(os.getenv("ALCANCE_ROL_TTL", "60")),
+    max_entradas=int(os.getenv("ALCANCE_ROL_MAX", "2048")),
+)
+
+# Roles que ven toda la empresa
+ROLES_EMPRESA = ("admin", "empresa")
+
+
+def invalidar_alcances(empresa_id: Optional[int] = None) -> None:
+    """Descarta los alcances en caché de una empresa (o de todas)."""
+    if empresa_id is None:
+        _cache_alcances.invalidar()
+    else:
+        _cache_alcances.invalidar(lambda clave: clave[0] == int(empresa_id))
+
+
+class AlcanceRol:
+    """
+    Qué solicitudes y notificaciones ve un usuario según su rol:
+      - admin / empresa (o sin usuario): toda la empresa
+      - supervisor: las suyas + las de todos los usuarios bajo él (equipos de varios niveles)
+      - asesor: solo las suyas
+      - banco: las de su banco (y ciudad, si la tiene)
+    Se resuelve una vez por usuario (con TTL) y se usa como filtro PostgREST o como predicado en memoria.
+    """
+
+    def __init__(
+        self,
+        *,
+        empresa_id: Optional[int],
+        rol: Optional[str] = None,
+        user_id: Optional[int] = None,
+        user_ids: Optional[Tuple[int, ...]] = None,
+        supervisor_id: Optional[int] = None,
+        banco_nombre: Optional[str] = None,
+        ciudad: Optional[str] = None,
+        sin_acceso: bool = False,
+    ):
+        self.empresa_id = empresa_id
+        self.rol = rol
+        self.user_id = user_id
+        self.user_ids = user_ids
+        self.supervisor_id = supervisor_id
+        self.banco_nombre = banco_nombre
+        self.ciudad = ciudad
+        self.sin_acceso = sin_acceso
+
+    @classmethod
+    def resolver(cls, usuario_info: Optional[Dict[str, Any]], empresa_id: Optional[int]) -> "AlcanceRol":
+        """Alcance del usuario en la empresa, memoizado por usuario"""
+        if not usuario_info:
+            return cls(empresa_id=empresa_id)
+
+        rol = usuario_info.get("rol")
+        user_id = usuario_info.get("id")
+        banco_nombre = usuario_info.get("banco_nombre")
+        # Según el controlador la ciudad del usuario banco llega como "ciudad" o "ciudad_solicitud"
+        ciudad = usuario_info.get("ciudad") or usuario_info.get("ciudad_solicitud")
+
+        if rol in ROLES_EMPRESA:
+            return cls(empresa_id=empresa_id, rol=rol, user_id=user_id)
+        if rol == "banco":
+            return cls(
+                empresa_id=empresa_id, rol=rol, user_id=user_id,
+                banco_nombre=banco_nombre, ciudad=ciudad, sin_acceso=not banco_nombre,
+            )
+        if rol not in ("supervisor", "asesor") or not user_id:
+            # Rol desconocido o usuario sin ID: no ve nada
+            return cls(empresa_id=empresa_id, rol=rol, user_id=user_id, sin_acceso=True)
+
+        clave = (int(empresa_id or 0), rol, int(user_id))
+        alcance = _cache_alcances.get(clave)
+        if alcance is None:
+            alcance = cls._resolver_equipo(rol, int(user_id), empresa_id)
+            _cache_alcances.set(clave, alcance)
+        return alcance
+
+    @classmethod
+    def _resolver_equipo(cls, rol: str, user_id: int, empresa_id: Optional[int]) -> "AlcanceRol":
+        from models.directorio_usuarios import DirectorioUsuarios
+        from models.jerarquia_usuarios import JerarquiaUsuarios
+        from models.usuarios_model import UsuariosModel
+
+        user_ids: Tuple[int, ...] = (user_id,)
+        supervisor_id = None
+        if not empresa_id:
+            return cls(empresa_id=empresa_id, rol=rol, user_id=user_id, user_ids=user_ids)
+
+        jerarquia = JerarquiaUsuarios.de_empresa(empresa_id)
+        if user_id in jerarquia:
+            if rol == "supervisor":
+                # Su propio ID + todos los usuarios bajo él, en cualquier nivel
+                user_ids += tuple(sorted(jerarquia.descendientes(user_id)))
+            else:
+                supervisor_id = jerarquia.padre(user_id)
+        elif rol == "supervisor":
+            # Usuario aún no presente en la jerarquía en caché (creado en otro worker): su equipo directo
+            user_ids += tuple(UsuariosModel().get_team_member_ids(user_id, empresa_id))
+        else:
+            entrada = DirectorioUsuarios.de_empresa(empresa_id, [user_id]).get(user_id)
+            supervisor_id = entrada.reports_to_id if entrada else None
+
+        return cls(empresa_id=empresa_id, rol=rol, user_id=user_id, user_ids=user_ids, supervisor_id=supervisor_id)
+
+    @property
+    def ve_todo(self) -> bool:
+        """Sin restricción dentro de la empresa (admin, empresa o sin usuario)"""
+        return not self.sin_acceso and self.user_ids is None and self.banco_nombre is None
+
+    def clave(self) -> tuple:
+        """Identifica lo que ve el usuario dentro de su rol (para claves de caché)"""
+        if self.banco_nombre is not None or self.rol == "banco":
+            return (self.banco_nombre, self.ciudad)
+        if self.user_ids is not None:
+            return (self.user_id,)
+        return ()
+
+    # ------------------------------------------------------------------
+    # Solicitudes
+    # ------------------------------------------------------------------
+    def filtrar_solicitudes(self, query, reference_table: Optional[str] = None, incluir_sin_ciudad: bool = False):
+        """Aplica el alcance a un select de solicitudes (o al embebido `reference_table`).
+        Con incluir_sin_ciudad el usuario banco también ve las solicitudes sin ciudad_solicitud."""
+        prefijo = f"{reference_table}." if reference_table else ""
+        if self.sin_acceso:
+            return query.in_(f"{prefijo}id", [])
+        if self.user_ids is not None:
+            lista = ",".join(map(str, self.user_ids))
+            return query.or_(
+                f"created_by_user_id.in.({lista}),assigned_to_user_id.in.({lista})",
+                reference_table=reference_table,
+            )
+        if self.banco_nombre:
+            query = query.eq(f"{prefijo}banco_nombre", self.banco_nombre)
+            if self.ciudad and incluir_sin_ciudad:
+                query = query.or_(
+                    f'ciudad_solicitud.is.null,ciudad_solicitud.eq."{self.ciudad}"', reference_table=reference_table
+                )
+            elif self.ciudad:
+                query = query.eq(f"{prefijo}ciudad_solicitud", self.ciudad)
+        return query
+
+    def permite_solicitud(self, solicitud: Dict[str, Any], incluir_sin_ciudad: bool = False) -> bool:
+        """Mismo criterio que filtrar_solicitudes, evaluado sobre una solicitud ya cargada"""
+        if self.sin_acceso:
+            return False
+        if self.user_ids is not None:
+            return (
+                solicitud.get("created_by_user_id") in self.user_ids
+                or solicitud.get("assigned_to_user_id") in self.user_ids
+            )
+        if self.banco_nombre:
+            if solicitud.get("banco_nombre") != self.banco_nombre:
+                return False
+            ciudad_solicitud = solicitud.get("ciudad_solicitud")
+            if incluir_sin_ciudad and not ciudad_solicitud:
+                return True
+            return not self.ciudad or ciudad_solicitud == self.ciudad
+        return True
+
+    # ------------------------------------------------------------------
+    # Notificaciones (filtran por quien las creó, usuario_id)
+    # ------------------------------------------------------------------
+    def ids_notificaciones(self) -> Optional[Tuple[int, ...]]:
+        """Creadores de notificaciones visibles: supervisor y equipo, o asesor y su supervisor"""
+        if self.user_ids is None:
+            return None
+        if self.rol == "asesor" and self.supervisor_id:
+            return self.user_ids + (self.supervisor_id,)
+        return self.user_ids
+
+    def filtrar_notificaciones(self, query):
+        # Igual que en solicitudes: sin acceso (p. ej. banco sin banco_nombre) no ve nada
+        if self.sin_acceso:
+            return query.in_("id", [])
+        if self.rol == "banco":
+            # Banco: notificaciones cuya metadata es de su banco o de su ciudad
+            filtros = []
+            if self.banco_nombre:
+                filtros.append(f"metadata->>'banco_nombre'.eq.{self.banco_nombre}")
+            if self.ciudad:
+                filtros.append(f"metadata->>'ciudad'.eq.{self.ciudad}")
+            return query.or_(",".join(filtros)) if filtros else query.in_("id", [])
+        ids = self.ids_notificaciones()
+        if ids is not None:
+            return query.in_("usuario_id", list(ids))
+        return query
+
+    def permite_notificacion(self, notificacion: Dict[str, Any]) -> bool:
+        """Mismo criterio que filtrar_notificaciones, evaluado sobre una notificación ya cargada"""
+        if self.sin_acceso:
+            return False
+        if self.rol in ROLES_EMPRESA:
+            return True
+        if self.rol == "banco":
+            metadata = notificacion.get("metadata") or {}
+            return bool(
+                (self.banco_nombre and metadata.get("banco_nombre") == self.banco_nombre)
+                or (self.ciudad and metadata.get("ciudad") == self.ciudad)
+            )
+        ids = self.ids_notificaciones()
+        return ids is not None and notificacion.get("usuario_id") in ids
@@ -1,8 +1,13 @@
 from __future__ import annotations
-from typing import Dict, Optional
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
 from datetime import datetime
-import bcrypt
 from data.supabase_conn import supabase
+from utils.cache_ttl import CacheTTL
+from utils.contrasenas import (
+    ServicioSaturadoError, hashear_contrasena, necesita_rehash, rehashear_en_segundo_plano, verificar_contrasena
+)
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -11,6 +16,16 @@ def _get_data(resp):
         return resp["data"]
     return resp
 
+# Datos de referencia del login (tabla de roles completa y empresas por ID): cambian muy poco
+_cache_referencia = CacheTTL(
+    ttl_segundos=float(os.getenv("DATOS_REFERENCIA_TTL", "600")),
+    max_entradas=int(os.getenv("DATOS_REFERENCIA_MAX", "512")),
+)
+
+COLUMNAS_EMPRESA = "id, nombre, imagen, created_at"
+COLUMNAS_LOGIN = "id, nombre, cedula, correo, contraseña, rol, info_extra, empresa_id, created_at"
+
+
 class AuthModel:
     """Modelo para autenticación de usuarios."""
 
@@ -28,90 +43,54 @@ class AuthModel:
             Dict con datos del usuario si autenticación exitosa
             None si credenciales inválidas o usuario temporal expirado/inactivo
         """
-        try:
-            print(f"\n[authenticate_user] 🔍 Iniciando autenticación para correo: {correo}")
+        return self.autenticar(correo, contraseña)["usuario"]
 
-            resp = (
-                supabase.table(self.usuarios_table)
-                .select("id, nombre, cedula, correo, contraseña, rol, info_extra, empresa_id, created_at")
-                .eq("correo", correo)
-                .execute()
-            )
+    def autenticar(self, correo: str, contraseña: str) -> Dict[str, Any]:
+        """Autentica con una sola consulta a la BD (usuario + empresa embebida) más bcrypt.
 
-            print(f"[authenticate_user] ✅ Consulta a BD ejecutada")
+        El rol sale de la caché de datos de referencia y el estado de usuario temporal
+        se evalúa sobre la misma fila, sin lecturas adicionales.
 
-            data = _get_data(resp)
-            print(f"[authenticate_user] 📊 Datos obtenidos: {len(data) if data else 0} registro(s)")
+        Returns:
+            {"usuario": Dict | None, "empresa": Dict | None,
+             "temporal": {"inactivo" | "expirado": True, "fecha_expiracion": str} | None}
+        """
+        resultado: Dict[str, Any] = {"usuario": None, "empresa": None, "temporal": None}
+        try:
+            print(f"\n[authenticate_user] 🔍 Iniciando autenticación para correo: {correo}")
 
-            if not data or len(data) == 0:
+            usuario, empresa = self._consultar_login(correo)
+            if not usuario:
                 print(f"[authenticate_user] ❌ Usuario no encontrado en BD")
-                return None
+                return resultado
 
-            usuario = data[0]
             print(f"[authenticate_user] 👤 Usuario encontrado - ID: {usuario.get('id')}, Nombre: {usuario.get('nombre')}")
 
-            password_hash = usuario.get("contraseña", "")
-            print(f"[authenticate_user] 🔐 Hash de contraseña obtenido: {'Sí' if password_hash else 'No'}")
+            # Usuario temporal inactivo o expirado: se rechaza antes de gastar CPU en bcrypt
+            info_extra = self._parsear_info_extra(usuario.get("info_extra"))
+            temporal = self._estado_temporal(usuario["id"], info_extra)
+            if temporal:
+                if temporal.get("expirado") and info_extra.get("usuario_activo") is not False:
+                    print(f"[authenticate_user] ❌ Fecha de expiración PASADA, marcando como inactivo")
+                    self._marcar_usuario_inactivo(usuario["id"], info_extra)
+                resultado["temporal"] = temporal
+                return resultado
 
+            password_hash = usuario.get("contraseña", "")
             password_valid = self._verify_password(contraseña, password_hash)
             print(f"[authenticate_user] 🔐 Validación de contraseña: {'✅ Válida' if password_valid else '❌ Inválida'}")
 
             if not password_valid:
                 print(f"[authenticate_user] ❌ Contraseña inválida, rechazando login")
-                return None
+                return resultado
 
-            # Validar si es usuario temporal
-            info_extra = usuario.get("info_extra", {})
-            print(f"[authenticate_user] 📋 Info_extra tipo: {type(info_extra)}, valor: {info_extra}")
+            if necesita_rehash(password_hash):
+                # Hash con otro costo (o contraseña antigua sin hashear): se actualiza sin demorar el login
+                rehashear_en_segundo_plano(contraseña, lambda nuevo_hash: self._guardar_hash(usuario["id"], nuevo_hash))
 
-            # Manejar caso cuando info_extra es None
-            if info_extra is None:
-                print(f"[authenticate_user] 📋 Info_extra es None, convirtiendo a dict vacío")
-                info_extra = {}
-            elif isinstance(info_extra, str):
-                import json
-                try:
-                    info_extra = json.loads(info_extra)
-                    print(f"[authenticate_user] 📋 Info_extra parseado de JSON a dict")
-                except json.JSONDecodeError as e:
-                    print(f"[authenticate_user] ⚠️ Error parseando JSON de info_extra: {e}")
-                    info_extra = {}
-
-            print(f"[authenticate_user] 📋 Info_extra final: {info_extra}")
-
-            # Verificar si es usuario temporal
-            if "usuario_activo" in info_extra or "tiempo_conexion" in info_extra:
-                print(f"[authenticate_user] ⏰ Usuario TEMPORAL detectado")
-                # Es usuario temporal
-                usuario_activo = info_extra.get("usuario_activo", True)
-                tiempo_conexion_str = info_extra.get("tiempo_conexion", "")
-
-                print(f"[authenticate_user] ⏰ usuario_activo: {usuario_activo}, tiempo_conexion: {tiempo_conexion_str}")
-
-                # Si está inactivo, rechazar login
-                if usuario_activo is False:
-                    print(f"[authenticate_user] ❌ Usuario temporal INACTIVO, rechazando login")
-                    return None
-
-                # Validar fecha de expiración
-                if tiempo_conexion_str:
-                    print(f"[authenticate_user] ⏰ Validando fecha de expiración: {tiempo_conexion_str}")
-                    if self._validar_fecha_expiracion(tiempo_conexion_str, usuario["id"]):
-                        print(f"[authenticate_user] ❌ Fecha de expiración PASADA, marcando como inactivo")
-                        # La fecha expiró, marcar como inactivo y rechazar
-                        self._marcar_usuario_inactivo(usuario["id"])
-                        return None
-                    else:
-                        print(f"[authenticate_user] ✅ Fecha de expiración VÁLIDA")
-                # Fecha aún válida, continuar con login
-            else:
-                print(f"[authenticate_user] ✅ Usuario PERMANENTE (no temporal)")
-
-            print(f"[authenticate_user] 🔍 Obteniendo información del rol...")
             rol_info = self._get_rol_info(usuario.get("rol"))
-            print(f"[authenticate_user] 📋 Rol info: {rol_info}")
 
-            resultado = {
+            resultado["usuario"] = {
                 "id": usuario["id"],
                 "nombre": usuario["nombre"],
                 "email": usuario["correo"],
@@ -122,45 +101,100 @@ class AuthModel:
                 "created_at": usuario.get("created_at"),
                 "info_extra": usuario.get("info_extra")
             }
+            resultado["empresa"] = empresa
 
             print(f"[authenticate_user] ✅ Autenticación exitosa - Retornando datos del usuario")
             return resultado
 
+        except ServicioSaturadoError:
+            raise
         except Exception as e:
             print(f"[authenticate_user] ❌ ERROR EXCEPCIÓN: {type(e).__name__}: {str(e)}")
             import traceback
             print(f"[authenticate_user] 📋 Traceback completo:")
             traceback.print_exc()
-            return None
+            return resultado
 
-    def _verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verifica contraseña usando bcrypt."""
+    def _consultar_login(self, correo: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Usuario por correo con su empresa embebida en la misma consulta.
+        Si PostgREST no resuelve la relación, consulta solo el usuario y toma la empresa de la caché."""
         try:
-            if not hashed_password.startswith('$2b$'):
-                result = plain_password == hashed_password
-                return result
-
-            result = bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-            return result
+            resp = (
+                supabase.table(self.usuarios_table)
+                .select(f"{COLUMNAS_LOGIN}, empresas({COLUMNAS_EMPRESA})")
+                .eq("correo", correo)
+                .execute()
+            )
+            data = _get_data(resp)
+            if not data:
+                return None, None
+            usuario = data[0]
+            empresa = usuario.pop("empresas", None)
+            if isinstance(empresa, list):
+                empresa = empresa[0] if empresa else None
+            if empresa and empresa.get("id") is not None:
+                _cache_referencia.set(("empresa", int(empresa["id"])), empresa)
+            return usuario, empresa
         except Exception as e:
-            result = plain_password == hashed_password
-            return result
+            print(f"[authenticate_user] ⚠️ Consulta embebida no disponible ({e}), consultando solo el usuario")
+
+        resp = supabase.table(self.usuarios_table).select(COLUMNAS_LOGIN).eq("correo", correo).execute()
+        data = _get_data(resp)
+        if not data:
+            return None, None
+        usuario = data[0]
+        empresa = self.get_empresa_info(usuario["empresa_id"]) if usuario.get("empresa_id") else None
+        return usuario, empresa
+
+    @staticmethod
+    def _parsear_info_extra(info_extra: Any) -> Dict:
+        # Manejar caso cuando info_extra es None o viene como string JSON
+        if isinstance(info_extra, str):
+            try:
+                info_extra = json.loads(info_extra)
+            except json.JSONDecodeError:
+                info_extra = {}
+        return info_extra if isinstance(info_extra, dict) else {}
+
+    def _estado_temporal(self, usuario_id: int, info_extra: Dict) -> Optional[Dict]:
+        """{"inactivo"/"expirado": True, "fecha_expiracion": ...} si es un usuario temporal sin acceso, si no None"""
+        if "usuario_activo" not in info_extra and "tiempo_conexion" not in info_extra:
+            return None  # No es usuario temporal
+
+        tiempo_conexion_str = info_extra.get("tiempo_conexion", "")
+        if info_extra.get("usuario_activo", True) is False:
+            return {"inactivo": True, "fecha_expiracion": tiempo_conexion_str}
+        if tiempo_conexion_str and self._validar_fecha_expiracion(tiempo_conexion_str, usuario_id):
+            return {"expirado": True, "fecha_expiracion": tiempo_conexion_str}
+        return None  # Usuario temporal pero activo y no expirado
+
+    def _verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """Verifica contraseña usando bcrypt (en el pool de bcrypt)."""
+        return verificar_contrasena(plain_password, hashed_password or "")
+
+    def _guardar_hash(self, usuario_id: int, password_hash: str) -> None:
+        """Guarda el hash rehasheado de un usuario."""
+        supabase.table(self.usuarios_table).update({"contraseña": password_hash}).eq("id", usuario_id).execute()
 
     def _get_rol_info(self, rol_id) -> Dict:
-        """Obtiene información del rol."""
+        """Obtiene información del rol (de la tabla de roles en caché)."""
         if not rol_id:
             return {"id": None, "nombre": "usuario"}
 
-        try:
-            resp = supabase.table(self.roles_table).select("id, nombre, descripcion").eq("id", rol_id).execute()
-
-            data = _get_data(resp)
-            if data and len(data) > 0:
-                return data[0]
-        except Exception:
-            pass
+        return self._roles().get(str(rol_id)) or {"id": rol_id, "nombre": str(rol_id)}
 
-        return {"id": rol_id, "nombre": str(rol_id)}
+    def _roles(self) -> Dict[str, Dict]:
+        """Tabla de roles completa indexada por ID (como string), en caché de datos de referencia."""
+        roles = _cache_referencia.get(("roles",))
+        if roles is None:
+            try:
+                resp = supabase.table(self.roles_table).select("id, nombre, descripcion").execute()
+                roles = {str(rol["id"]): rol for rol in _get_data(resp) or []}
+            except Exception as e:
+                print(f"Error al obtener roles: {e}")
+                return {}
+            _cache_referencia.set(("roles",), roles)
+        return roles
 
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """Obtiene usuario por ID (para validar tokens)."""
@@ -186,14 +220,19 @@ class AuthModel:
         }
 
     def get_empresa_info(self, empresa_id: int) -> Optional[Dict]:
-        """Obtiene información de la empresa."""
+        """Obtiene información de la empresa (en caché de datos de referencia)."""
+        clave = ("empresa", int(empresa_id))
+        empresa = _cache_referencia.get(clave)
+        if empresa is not None:
+            return empresa
         try:
-            resp = supabase.table("empresas").select("id, nombre, imagen, created_at").eq("id", empresa_id).execute()
+            resp = supabase.table("empresas").select(COLUMNAS_EMPRESA).eq("id", empresa_id).execute()
 
             data = _get_data(resp)
             if not data or len(data) == 0:
                 return None
 
+            _cache_referencia.set(clave, data[0])
             return data[0]
         except Exception as e:
             print(f"Error al obtener información de empresa: {e}")
@@ -263,28 +302,25 @@ class AuthModel:
             print(f"[_validar_fecha_expiracion] ⚠️ Error validando fecha de expiración para usuario {usuario_id}: {e}")
             return False
 
-    def _marcar_usuario_inactivo(self, usuario_id: int):
+    def _marcar_usuario_inactivo(self, usuario_id: int, info_extra: Optional[Dict] = None):
         """
         Marca un usuario temporal como inactivo en la base de datos.
 
         Args:
             usuario_id: ID del usuario a marcar como inactivo
+            info_extra: info_extra actual si ya se leyó (evita volver a consultarlo)
         """
         try:
-            # Obtener info_extra actual
-            resp = supabase.table(self.usuarios_table).select("info_extra").eq("id", usuario_id).execute()
-            data = _get_data(resp)
+            if info_extra is None:
+                # Obtener info_extra actual
+                resp = supabase.table(self.usuarios_table).select("info_extra").eq("id", usuario_id).execute()
+                data = _get_data(resp)
 
-            if not data or len(data) == 0:
-                return
+                if not data or len(data) == 0:
+                    return
 
-            info_extra = data[0].get("info_extra", {})
-            if isinstance(info_extra, str):
-                import json
-                try:
-                    info_extra = json.loads(info_extra)
-                except json.JSONDecodeError:
-                    info_extra = {}
+                info_extra = self._parsear_info_extra(data[0].get("info_extra", {}))
+            info_extra = dict(info_extra)
 
             # Actualizar usuario_activo a False
             info_extra["usuario_activo"] = False
@@ -319,42 +355,7 @@ class AuthModel:
                 return None
 
             usuario = data[0]
-            info_extra = usuario.get("info_extra", {})
-
-            # Manejar caso cuando info_extra es None
-            if info_extra is None:
-                info_extra = {}
-            elif isinstance(info_extra, str):
-                import json
-                try:
-                    info_extra = json.loads(info_extra)
-                except json.JSONDecodeError:
-                    info_extra = {}
-
-            # Verificar si es usuario temporal
-            if "usuario_activo" not in info_extra and "tiempo_conexion" not in info_extra:
-                return None  # No es usuario temporal
-
-            # Es usuario temporal
-            usuario_activo = info_extra.get("usuario_activo", True)
-            tiempo_conexion_str = info_extra.get("tiempo_conexion", "")
-
-            resultado = {}
-
-            # Verificar si está inactivo
-            if usuario_activo is False:
-                resultado["inactivo"] = True
-                resultado["fecha_expiracion"] = tiempo_conexion_str
-                return resultado
-
-            # Verificar si está expirado
-            if tiempo_conexion_str:
-                if self._validar_fecha_expiracion(tiempo_conexion_str, usuario["id"]):
-                    resultado["expirado"] = True
-                    resultado["fecha_expiracion"] = tiempo_conexion_str
-                    return resultado
-
-            return None  # Usuario temporal pero activo y no expirado
+            return self._estado_temporal(usuario["id"], self._parsear_info_extra(usuario.get("info_extra")))
 
         except Exception as e:
             print(f"Error verificando usuario temporal: {e}")
@@ -362,4 +363,4 @@ class AuthModel:
 
     def hash_password(self, password: str) -> str:
         """Hashea una contraseña (para crear usuarios)."""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        return hashear_contrasena(password)
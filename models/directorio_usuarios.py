@@ -0,0 +1,120 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from data.supabase_conn import supabase
+from utils.cache_ttl import CacheTTL
+
+def _get_data(resp):
+    if hasattr(resp, "data"):
+        return resp.data
+    if isinstance(resp, dict) and "data" in resp:
+        return resp["data"]
+    return resp
+
+
+# Directorio completo por empresa; UsuariosModel lo invalida en create / update / delete
+_cache_directorios = CacheTTL(
+    ttl_segundos=float(os.getenv("DIRECTORIO_USUARIOS_TTL", "300")),
+    max_entradas=int(os.getenv("DIRECTORIO_USUARIOS_MAX", "256")),
+)
+
+
+def invalidar_directorio(empresa_id: Optional[int] = None) -> None:
+    """Descarta el directorio en caché de una empresa (o de todas)."""
+    if empresa_id is None:
+        _cache_directorios.invalidar()
+    else:
+        _cache_directorios.invalidar(lambda clave: clave == int(empresa_id))
+
+
+class EntradaUsuario(NamedTuple):
+    nombre: Optional[str]
+    reports_to_id: Optional[int]
+    supervisor_nombre: Optional[str]
+
+
+class DirectorioUsuarios:
+    """Directorio id -> (nombre, reports_to_id, supervisor_nombre) para enriquecer listados con nombres de usuarios."""
+
+    TABLE = "usuarios"
+
+    def __init__(self, entradas: Optional[Dict[int, EntradaUsuario]] = None):
+        self._entradas = entradas or {}
+
+    @classmethod
+    def de_empresa(cls, empresa_id: int, user_ids: Iterable[Any] = ()) -> "DirectorioUsuarios":
+        """Directorio de todos los usuarios de la empresa, en caché por TTL.
+        Si alguno de `user_ids` no está (p. ej. se creó en otro worker), se consulta aparte sin cachear."""
+        clave = int(empresa_id)
+        directorio = _cache_directorios.get(clave)
+        if directorio is None:
+            resp = supabase.table(cls.TABLE).select("id, nombre, reports_to_id").eq("empresa_id", clave).execute()
+            directorio = cls._construir(_get_data(resp) or [])
+            _cache_directorios.set(clave, directorio)
+
+        faltantes = {user_id for user_id in user_ids if user_id and user_id not in directorio}
+        if not faltantes:
+            return directorio
+        return directorio.combinar(cls.para_ids(faltantes))
+
+    @classmethod
+    def para_ids(cls, user_ids: Iterable[Any]) -> "DirectorioUsuarios":
+        """Construye el directorio de un lote de usuarios con una consulta (más otra si faltan supervisores)."""
+        ids = {user_id for user_id in user_ids if user_id}
+        if not ids:
+            return cls()
+        resp = supabase.table(cls.TABLE).select("id, nombre, reports_to_id").in_("id", list(ids)).execute()
+        return cls._construir(_get_data(resp) or [])
+
+    @classmethod
+    def _construir(cls, filas: List[Dict[str, Any]]) -> "DirectorioUsuarios":
+        usuarios = {usuario["id"]: usuario for usuario in filas}
+
+        # Supervisores que no venían en el lote: solo se necesita su nombre
+        faltantes = {
+            usuario["reports_to_id"] for usuario in usuarios.values()
+            if usuario.get("reports_to_id") and usuario["reports_to_id"] not in usuarios
+        }
+        nombres = {user_id: usuario.get("nombre") for user_id, usuario in usuarios.items()}
+        if faltantes:
+            resp = supabase.table(cls.TABLE).select("id, nombre").in_("id", list(faltantes)).execute()
+            nombres.update({supervisor["id"]: supervisor.get("nombre") for supervisor in _get_data(resp) or []})
+
+        return cls({
+            user_id: EntradaUsuario(
+                nombre=usuario.get("nombre"),
+                reports_to_id=usuario.get("reports_to_id"),
+                supervisor_nombre=nombres.get(usuario["reports_to_id"]) if usuario.get("reports_to_id") else None,
+            )
+            for user_id, usuario in usuarios.items()
+        })
+
+    def combinar(self, otro: "DirectorioUsuarios") -> "DirectorioUsuarios":
+        """Nuevo directorio con las entradas de ambos (el cacheado no se modifica)"""
+        return DirectorioUsuarios({**self._entradas, **otro._entradas})
+
+    @staticmethod
+    def ids_en(registros: Iterable[Dict[str, Any]], *campos: str) -> set:
+        """IDs de usuario presentes en los campos indicados de una lista de registros"""
+        return {registro.get(campo) for registro in registros for campo in campos if registro.get(campo)}
+
+    def reportes(self) -> Dict[int, Optional[int]]:
+        """id -> reports_to_id de todas las entradas (base de JerarquiaUsuarios)"""
+        return {user_id: entrada.reports_to_id for user_id, entrada in self._entradas.items()}
+
+    def get(self, user_id: Any) -> Optional[EntradaUsuario]:
+        return self._entradas.get(user_id) if user_id else None
+
+    def nombre(self, user_id: Any) -> Optional[str]:
+        entrada = self.get(user_id)
+        return entrada.nombre if entrada else None
+
+    def supervisor_nombre(self, user_id: Any) -> Optional[str]:
+        entrada = self.get(user_id)
+        return entrada.supervisor_nombre if entrada else None
+
+    def __contains__(self, user_id: Any) -> bool:
+        return user_id in self._entradas
+
+    def __len__(self) -> int:
+        return len(self._entradas)
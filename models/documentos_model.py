@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import Any, Dict, List, Optional
 
 from data.supabase_conn import supabase
+from data.supabase_async import obtener_cliente_async
 
 
 def _get_data(resp):
@@ -27,12 +28,32 @@ class DocumentosModel:
         data = _get_data(resp)
         return data[0] if isinstance(data, list) and data else data
 
+    def create_many(self, *, solicitante_id: int, documentos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Inserta varios documentos ({"nombre", "documento_url"}) en una sola petición, en el mismo orden"""
+        if not documentos:
+            return []
+        payload = [
+            {"nombre": doc["nombre"], "documento_url": doc["documento_url"], "solicitante_id": solicitante_id}
+            for doc in documentos
+        ]
+        resp = supabase.table(self.TABLE).insert(payload).execute()
+        return _get_data(resp) or []
+
     def list(self, *, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
-        q = supabase.table(self.TABLE).select("*")
+        resp = self._consulta_list(supabase, solicitante_id=solicitante_id, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    async def list_async(self, *, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Igual que list, sobre el cliente asíncrono (ver data.supabase_async)"""
+        cliente = await obtener_cliente_async()
+        resp = await self._consulta_list(cliente, solicitante_id=solicitante_id, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    def _consulta_list(self, cliente, *, solicitante_id: Optional[int], limit: int, offset: int):
+        q = cliente.table(self.TABLE).select("*")
         if solicitante_id is not None:
             q = q.eq("solicitante_id", solicitante_id)
-        resp = q.range(offset, offset + max(limit - 1, 0)).execute()
-        return _get_data(resp) or []
+        return q.range(offset, offset + max(limit - 1, 0))
 
     def delete(self, *, id: int) -> int:
         resp = supabase.table(self.TABLE).delete().eq("id", id).execute()
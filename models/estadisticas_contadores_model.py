@@ -0,0 +1,119 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from data.supabase_conn import supabase
+from models.estadisticas_model import ESTADOS_RADICADOS, extraer_monto_credito
+from utils.supabase_errors import is_rpc_not_found_error
+
+def _get_data(resp):
+    if hasattr(resp, "data"):
+        return resp.data
+    if isinstance(resp, dict) and "data" in resp:
+        return resp["data"]
+    return resp
+
+# Columnas de solicitudes que afectan a los contadores
+COLUMNAS_CONTADORES = "estado, banco_nombre, ciudad_solicitud, created_at, detalle_credito"
+
+
+class EstadisticasContadoresModel:
+    """Contadores de estadísticas por empresa mantenidos en cada escritura de solicitudes (sql/estadisticas_contadores.sql)."""
+
+    TABLE = "estadisticas_contadores"
+    RPC_AJUSTAR = "estadisticas_contadores_ajustar"
+    RPC_RECONCILIAR = "estadisticas_contadores_reconciliar"
+
+    # Opt-in: requiere aplicar la migración SQL antes de activarlo
+    habilitado = os.getenv("ESTADISTICAS_CONTADORES", "false").lower() in ("1", "true", "si", "yes")
+
+    def contribuciones(self, solicitud: Optional[Dict[str, Any]]) -> List[Tuple[str, str, float]]:
+        """Lista de (dimension, clave, monto) que una solicitud aporta a los contadores"""
+        if not solicitud:
+            return []
+
+        estado = solicitud.get("estado") or "Sin Estado"
+        banco = solicitud.get("banco_nombre") or "Sin Banco"
+        ciudad = solicitud.get("ciudad_solicitud") or "Sin Ciudad"
+
+        aportes = [
+            ("total", "", 0.0),
+            ("estado", estado, 0.0),
+            ("banco", banco, 0.0),
+            ("ciudad", ciudad, 0.0),
+        ]
+        dia = self._dia_utc(solicitud.get("created_at"))
+        if dia:
+            aportes.append(("dia", dia, 0.0))
+
+        if estado in ESTADOS_RADICADOS:
+            monto = extraer_monto_credito(solicitud.get("detalle_credito") or {})
+            aportes.append(("radicado_estado", estado, monto))
+            aportes.append(("radicado_banco", banco, monto))
+
+        return aportes
+
+    def registrar_cambio(self, empresa_id: int, antes: Optional[Dict[str, Any]], despues: Optional[Dict[str, Any]]) -> None:
+        """Envía a la BD la diferencia entre el estado anterior y el nuevo de una solicitud"""
+        if not self.habilitado:
+            return
+
+        deltas: Dict[Tuple[str, str], List[float]] = {}
+        for signo, solicitud in ((-1, antes), (1, despues)):
+            for dimension, clave, monto in self.contribuciones(solicitud):
+                acumulado = deltas.setdefault((dimension, clave), [0, 0.0])
+                acumulado[0] += signo
+                acumulado[1] += signo * monto
+
+        payload = [
+            {"dimension": dimension, "clave": clave, "total": total, "monto": round(monto, 2)}
+            for (dimension, clave), (total, monto) in deltas.items()
+            if total != 0 or monto != 0
+        ]
+        if not payload:
+            return
+
+        try:
+            supabase.rpc(self.RPC_AJUSTAR, {"p_empresa_id": empresa_id, "p_deltas": payload}).execute()
+        except Exception as e:
+            # Nunca bloquear la escritura principal; la reconciliación corrige la desviación
+            if is_rpc_not_found_error(e):
+                EstadisticasContadoresModel.habilitado = False
+                print(f"⚠️ RPC {self.RPC_AJUSTAR} no instalada, contadores desactivados")
+            else:
+                print(f"❌ Error ajustando contadores de estadísticas: {e}")
+
+    def leer(self, empresa_id: int, fecha_inicio: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Devuelve {dimension: {clave: {"total": n, "monto": m}}}; los días solo desde fecha_inicio"""
+        resp = (
+            supabase.table(self.TABLE)
+            .select("dimension, clave, total, monto")
+            .eq("empresa_id", empresa_id)
+            .or_(f"dimension.neq.dia,clave.gte.{fecha_inicio}")
+            .execute()
+        )
+        contadores: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for fila in _get_data(resp) or []:
+            contadores.setdefault(fila["dimension"], {})[fila["clave"]] = {
+                "total": int(fila.get("total") or 0),
+                "monto": float(fila.get("monto") or 0),
+            }
+        return contadores
+
+    def reconciliar(self, empresa_id: Optional[int] = None) -> int:
+        """Recalcula los contadores desde la tabla solicitudes; devuelve cuántas empresas procesó"""
+        resp = supabase.rpc(self.RPC_RECONCILIAR, {"p_empresa_id": empresa_id}).execute()
+        data = _get_data(resp)
+        return int(data or 0) if not isinstance(data, list) else len(data)
+
+    def _dia_utc(self, created_at: Any) -> Optional[str]:
+        """Fecha YYYY-MM-DD (UTC) de un created_at de Supabase"""
+        if not created_at:
+            return None
+        from datetime import datetime, timezone
+        try:
+            fecha = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        except ValueError:
+            return str(created_at)[:10]
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc)
+        return fecha.strftime("%Y-%m-%d")
@@ -1,6 +1,12 @@
 from __future__ import annotations
+import copy
+import os
 from typing import Any, Dict, List, Optional
 from data.supabase_conn import supabase
+from utils.supabase_errors import is_rpc_not_found_error
+from utils.concurrencia import ejecutar_en_paralelo
+from utils.cache_ttl import CacheTTL
+from models.alcance_rol import AlcanceRol
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -9,128 +15,263 @@ def _get_data(resp):
         return resp["data"]
     return resp
 
+# Caché de respuestas de estadísticas por (empresa, rol, alcance, endpoint, parámetros).
+# ESTADISTICAS_CACHE_TTL=0 la desactiva.
+_cache_estadisticas = CacheTTL(
+    ttl_segundos=float(os.getenv("ESTADISTICAS_CACHE_TTL", "60")),
+    max_entradas=int(os.getenv("ESTADISTICAS_CACHE_MAX", "512")),
+)
+
+
+class _ResultadoSinCache(dict):
+    """Respuesta por defecto tras un error: se devuelve al cliente pero no se guarda en caché."""
+
+
+def invalidar_estadisticas(empresa_id: Optional[int] = None) -> None:
+    """Descarta las estadísticas en caché de una empresa (o de todas si no se indica)."""
+    if empresa_id is None:
+        _cache_estadisticas.invalidar()
+        return
+    try:
+        empresa_id = int(empresa_id)
+    except (TypeError, ValueError):
+        pass
+    _cache_estadisticas.invalidar(lambda clave: clave[0] == empresa_id)
+
+
+# Estados que se consideran radicaciones para las métricas de montos
+ESTADOS_RADICADOS = ["Radicado", "Aprobado", "Rechazado"]
+
+
+def extraer_monto_credito(detalle: dict) -> float:
+    """Extrae el monto del detalle_credito de forma robusta (ver fn_extraer_monto_credito en sql/)."""
+    if not isinstance(detalle, dict):
+        return 0.0
+    # Candidatos comunes
+    for k in ("monto_radicado", "monto_solicitado", "monto", "valor_solicitado"):
+        v = detalle.get(k)
+        if isinstance(v, (int, float)):
+            return float(v)
+        if isinstance(v, str):
+            try:
+                return float(v)
+            except:
+                pass
+    # Buscar en tipos de crédito específicos
+    for sub in ("credito_vehicular", "credito_hipotecario", "credito_consumo", "credito_comercial", "microcredito", "credito_educativo"):
+        subobj = detalle.get(sub)
+        if isinstance(subobj, dict):
+            v = subobj.get("monto_solicitado") or subobj.get("monto")
+            if isinstance(v, (int, float)):
+                return float(v)
+            if isinstance(v, str):
+                try:
+                    return float(v)
+                except:
+                    pass
+    return 0.0
+
+
 class EstadisticasModel:
     """Modelo para consultas agregadas y estadísticas del sistema."""
 
+    # Función SQL que calcula todos los desgloses generales en un solo viaje (sql/estadisticas_generales.sql)
+    RPC_GENERALES = "estadisticas_generales_agg"
+    # Se desactiva en caliente si la función no existe en la BD (migración pendiente)
+    _rpc_generales_disponible = True
+
     def __init__(self):
         pass
 
     def estadisticas_generales(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
         """Obtiene estadísticas generales del sistema aplicando filtros por rol"""
+        return self._con_cache(
+            "generales", empresa_id, usuario_info, {},
+            lambda: self._calcular_generales(empresa_id, usuario_info),
+        )
+
+    def _calcular_generales(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Calcula las estadísticas generales sin pasar por la caché"""
+        from models.estadisticas_contadores_model import EstadisticasContadoresModel
+
+        # Los contadores incrementales solo cubren la vista completa de la empresa
+        if EstadisticasContadoresModel.habilitado and (not usuario_info or usuario_info.get("rol") in ["admin", "empresa"]):
+            try:
+                return self._estadisticas_generales_contadores(empresa_id, usuario_info)
+            except Exception as e:
+                print(f"⚠️ Error leyendo contadores de estadísticas, recalculando: {e}")
+
+        if EstadisticasModel._rpc_generales_disponible:
+            try:
+                return self._estadisticas_generales_rpc(empresa_id, usuario_info)
+            except Exception as e:
+                if is_rpc_not_found_error(e):
+                    EstadisticasModel._rpc_generales_disponible = False
+                    print(f"⚠️ RPC {self.RPC_GENERALES} no instalada, usando consultas individuales")
+                else:
+                    print(f"⚠️ Error en RPC {self.RPC_GENERALES}, usando consultas individuales: {e}")
+
+        return self._estadisticas_generales_consultas(empresa_id, usuario_info)
+
+    def _estadisticas_generales_contadores(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Arma las estadísticas generales desde los contadores precalculados (sql/estadisticas_contadores.sql)"""
+        from datetime import datetime, timedelta
+        from models.estadisticas_contadores_model import EstadisticasContadoresModel
+
+        fecha_inicio = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        resultados = ejecutar_en_paralelo({
+            "contadores": lambda: EstadisticasContadoresModel().leer(empresa_id, fecha_inicio),
+            "total_solicitantes": lambda: self._contar_solicitantes_por_rol(empresa_id, usuario_info),
+            "total_documentos": lambda: self._contar_documentos_por_rol(empresa_id, usuario_info),
+        })
+        contadores = resultados["contadores"]
+
+        def _totales(dimension: str) -> Dict[str, int]:
+            return {clave: valor["total"] for clave, valor in contadores.get(dimension, {}).items()}
+
+        def _montos(dimension: str) -> Dict[str, float]:
+            return {clave: round(valor["monto"], 2) for clave, valor in contadores.get(dimension, {}).items()}
+
+        radicaciones_por_estado = _totales("radicado_estado")
+        monto_por_estado = _montos("radicado_estado")
+
+        return {
+            "total_solicitantes": resultados["total_solicitantes"],
+            "total_solicitudes": contadores.get("total", {}).get("", {}).get("total", 0),
+            "solicitudes_por_estado": _totales("estado"),
+            "solicitudes_por_banco": _totales("banco"),
+            "solicitudes_por_ciudad": _totales("ciudad"),
+            "total_documentos": resultados["total_documentos"],
+            "solicitudes_por_dia": _totales("dia"),
+            "total_creditos": sum(radicaciones_por_estado.values()),
+            "radicaciones_por_banco": _totales("radicado_banco"),
+            "radicaciones_por_estado": radicaciones_por_estado,
+            "total_monto": round(sum(monto_por_estado.values()), 2),
+            "monto_por_banco": _montos("radicado_banco"),
+            "monto_por_estado": monto_por_estado,
+        }
+
+    def _estadisticas_generales_rpc(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Calcula las estadísticas generales con una sola llamada RPC agregada en la BD"""
+        from datetime import datetime, timedelta
+
+        params = self._parametros_alcance_rpc(empresa_id, usuario_info)
+        params["p_fecha_inicio"] = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+
+        resp = supabase.rpc(self.RPC_GENERALES, params).execute()
+        data = _get_data(resp) or {}
+        if isinstance(data, list):
+            data = data[0] if data else {}
+
+        return {
+            "total_solicitantes": data.get("total_solicitantes", 0),
+            "total_solicitudes": data.get("total_solicitudes", 0),
+            "solicitudes_por_estado": data.get("solicitudes_por_estado") or {},
+            "solicitudes_por_banco": data.get("solicitudes_por_banco") or {},
+            "solicitudes_por_ciudad": data.get("solicitudes_por_ciudad") or {},
+            "total_documentos": data.get("total_documentos", 0),
+            "solicitudes_por_dia": data.get("solicitudes_por_dia") or {},
+            "total_creditos": data.get("total_creditos", 0),
+            "radicaciones_por_banco": data.get("radicaciones_por_banco") or {},
+            "radicaciones_por_estado": data.get("radicaciones_por_estado") or {},
+            "total_monto": round(float(data.get("total_monto") or 0), 2),
+            "monto_por_banco": {k: round(float(v), 2) for k, v in (data.get("monto_por_banco") or {}).items()},
+            "monto_por_estado": {k: round(float(v), 2) for k, v in (data.get("monto_por_estado") or {}).items()},
+        }
+
+    def _parametros_alcance_rpc(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Traduce las reglas de _aplicar_query_filtros_rol y _contar_*_por_rol a parámetros de la RPC"""
+        rol = usuario_info.get("rol") if usuario_info else None
+        params = {
+            "p_empresa_id": empresa_id,
+            "p_user_ids": None,
+            "p_banco_nombre": None,
+            "p_ciudad": None,
+            "p_incluir_desglose": not usuario_info or rol in ["admin", "supervisor", "empresa"],
+            "p_conteo_relacionados": "empresa",
+        }
+
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        if alcance.ve_todo:
+            return params
+
+        if alcance.sin_acceso:
+            # Banco sin banco asignado o rol desconocido: un arreglo vacío no coincide con nada
+            params["p_user_ids"] = []
+            params["p_conteo_relacionados"] = "ninguno"
+        elif alcance.banco_nombre:
+            params["p_banco_nombre"] = alcance.banco_nombre
+            params["p_ciudad"] = alcance.ciudad or None
+            params["p_conteo_relacionados"] = "banco"
+        else:
+            # Supervisor: su propio ID + IDs de su equipo; asesor: su propio ID
+            params["p_user_ids"] = list(alcance.user_ids)
+            params["p_conteo_relacionados"] = "creador"
+
+        return params
+
+    def _estadisticas_generales_consultas(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Calcula las estadísticas generales con consultas individuales (respaldo si la RPC no está disponible)"""
         try:
-            # Aplicar filtros base por empresa
-            filtros_base = {"empresa_id": empresa_id}
-
-            # Aplicar filtros adicionales según el rol
-            filtros_solicitudes = self._aplicar_filtros_rol(filtros_base.copy(), usuario_info)
+            from datetime import datetime, timedelta
 
-            # Total de solicitantes (aplicando filtros de rol optimizados)
-            total_solicitantes = self._contar_solicitantes_por_rol(empresa_id, usuario_info)
+            puede_ver_desglose = not usuario_info or usuario_info.get("rol") in ["admin", "supervisor", "empresa"]
+            # Solicitudes por día (últimos 30 días para gráfico de línea de tiempo)
+            fecha_inicio = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+            # Definir estados que consideramos como radicaciones para métricas
+            estados_radicados = ESTADOS_RADICADOS
+
+            def _consultar_solicitudes(columnas: str, count: Optional[str] = None, ajustar=None):
+                return self._consultar_solicitudes(empresa_id, usuario_info, columnas, count=count, ajustar=ajustar)
+
+            # Las consultas son independientes entre sí: se lanzan en paralelo
+            tareas = {
+                "total_solicitantes": lambda: self._contar_solicitantes_por_rol(empresa_id, usuario_info),
+                "total_solicitudes": lambda: _consultar_solicitudes("id", count="exact").count or 0,
+                "estados": lambda: _get_data(_consultar_solicitudes("estado")) or [],
+                "total_documentos": lambda: self._contar_documentos_por_rol(empresa_id, usuario_info),
+                "tiempo": lambda: _get_data(_consultar_solicitudes(
+                    "created_at", ajustar=lambda q: q.gte("created_at", fecha_inicio)
+                )) or [],
+                "radicados": lambda: _get_data(_consultar_solicitudes(
+                    "estado,banco_nombre,detalle_credito", ajustar=lambda q: q.in_("estado", estados_radicados)
+                )) or [],
+            }
+            # Banco y ciudad solo si el usuario puede ver múltiples bancos/ciudades
+            if puede_ver_desglose:
+                tareas["bancos"] = lambda: _get_data(_consultar_solicitudes("banco_nombre")) or []
+                tareas["ciudades"] = lambda: _get_data(_consultar_solicitudes("ciudad_solicitud")) or []
 
-            # Total de solicitudes (con filtros de rol)
-            solicitudes_query = supabase.table("solicitudes").select("id", count="exact").eq("empresa_id", empresa_id)
-            solicitudes_query = self._aplicar_query_filtros_rol(solicitudes_query, usuario_info, empresa_id)
-            solicitudes_resp = solicitudes_query.execute()
-            total_solicitudes = solicitudes_resp.count or 0
+            resultados = ejecutar_en_paralelo(tareas)
 
-            # Solicitudes por estado
-            estados_query = supabase.table("solicitudes").select("estado", count="exact").eq("empresa_id", empresa_id)
-            estados_query = self._aplicar_query_filtros_rol(estados_query, usuario_info, empresa_id)
-            estados_resp = estados_query.execute()
-            solicitudes_data = _get_data(estados_resp) or []
+            total_solicitantes = resultados["total_solicitantes"]
+            total_solicitudes = resultados["total_solicitudes"]
+            total_documentos = resultados["total_documentos"]
 
-            # Agrupar por estado
+            # Agrupar por estado, banco y ciudad: vacío o null cuentan como "Sin …",
+            # igual que en la RPC y en los contadores
             solicitudes_por_estado = {}
-            for solicitud in solicitudes_data:
-                estado = solicitud.get("estado", "Sin Estado")
+            for solicitud in resultados["estados"]:
+                estado = solicitud.get("estado") or "Sin Estado"
                 solicitudes_por_estado[estado] = solicitudes_por_estado.get(estado, 0) + 1
 
-            # Solicitudes por banco (solo si el usuario puede ver múltiples bancos)
             solicitudes_por_banco = {}
-            if not usuario_info or usuario_info.get("rol") in ["admin", "supervisor", "empresa"]:
-                bancos_query = supabase.table("solicitudes").select("banco_nombre", count="exact").eq("empresa_id", empresa_id)
-                bancos_query = self._aplicar_query_filtros_rol(bancos_query, usuario_info, empresa_id)
-                bancos_resp = bancos_query.execute()
-                bancos_data = _get_data(bancos_resp) or []
-
-                for solicitud in bancos_data:
-                    banco = solicitud.get("banco_nombre", "Sin Banco")
-                    solicitudes_por_banco[banco] = solicitudes_por_banco.get(banco, 0) + 1
+            for solicitud in resultados.get("bancos", []):
+                banco = solicitud.get("banco_nombre") or "Sin Banco"
+                solicitudes_por_banco[banco] = solicitudes_por_banco.get(banco, 0) + 1
 
-            # Solicitudes por ciudad (solo si el usuario puede ver múltiples ciudades)
             solicitudes_por_ciudad = {}
-            if not usuario_info or usuario_info.get("rol") in ["admin", "supervisor", "empresa"]:
-                ciudades_query = supabase.table("solicitudes").select("ciudad_solicitud", count="exact").eq("empresa_id", empresa_id)
-                ciudades_query = self._aplicar_query_filtros_rol(ciudades_query, usuario_info, empresa_id)
-                ciudades_resp = ciudades_query.execute()
-                ciudades_data = _get_data(ciudades_resp) or []
-
-                for solicitud in ciudades_data:
-                    ciudad = solicitud.get("ciudad_solicitud", "Sin Ciudad")
-                    solicitudes_por_ciudad[ciudad] = solicitudes_por_ciudad.get(ciudad, 0) + 1
-
-            # Total de documentos (aplicando filtros de empresa y rol optimizados)
-            total_documentos = self._contar_documentos_por_rol(empresa_id, usuario_info)
-
-            # Solicitudes por día (últimos 30 días para gráfico de línea de tiempo)
-            from datetime import datetime, timedelta
-            fecha_inicio = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-
-            solicitudes_tiempo_query = supabase.table("solicitudes").select("created_at").eq("empresa_id", empresa_id).gte("created_at", fecha_inicio)
-            solicitudes_tiempo_query = self._aplicar_query_filtros_rol(solicitudes_tiempo_query, usuario_info, empresa_id)
-            solicitudes_tiempo_resp = solicitudes_tiempo_query.execute()
-            solicitudes_tiempo_data = _get_data(solicitudes_tiempo_resp) or []
+            for solicitud in resultados.get("ciudades", []):
+                ciudad = solicitud.get("ciudad_solicitud") or "Sin Ciudad"
+                solicitudes_por_ciudad[ciudad] = solicitudes_por_ciudad.get(ciudad, 0) + 1
 
             # Agrupar por fecha
             solicitudes_por_dia = {}
-            for solicitud in solicitudes_tiempo_data:
+            for solicitud in resultados["tiempo"]:
                 fecha = solicitud.get("created_at", "")[:10]  # Solo la fecha YYYY-MM-DD
                 solicitudes_por_dia[fecha] = solicitudes_por_dia.get(fecha, 0) + 1
 
             # Métricas de radicaciones y montos
-            # Definir estados que consideramos como radicaciones para métricas
-            estados_radicados = ["Radicado", "Aprobado", "Rechazado"]
-
-            # Consultar solicitudes radicadas (filtradas por rol)
-            radicados_query = (
-                supabase
-                .table("solicitudes")
-                .select("estado,banco_nombre,detalle_credito")
-                .eq("empresa_id", empresa_id)
-                .in_("estado", estados_radicados)
-            )
-            radicados_query = self._aplicar_query_filtros_rol(radicados_query, usuario_info, empresa_id)
-            radicados_resp = radicados_query.execute()
-            radicados_data = _get_data(radicados_resp) or []
-
-            # Helper para extraer monto del detalle_credito de forma robusta
-            def _extraer_monto(detalle: dict) -> float:
-                if not isinstance(detalle, dict):
-                    return 0.0
-                # Candidatos comunes
-                for k in ("monto_radicado", "monto_solicitado", "monto", "valor_solicitado"):
-                    v = detalle.get(k)
-                    if isinstance(v, (int, float)):
-                        return float(v)
-                    if isinstance(v, str):
-                        try:
-                            return float(v)
-                        except:
-                            pass
-                # Buscar en tipos de crédito específicos
-                for sub in ("credito_vehicular", "credito_hipotecario", "credito_consumo", "credito_comercial", "microcredito", "credito_educativo"):
-                    subobj = detalle.get(sub)
-                    if isinstance(subobj, dict):
-                        v = subobj.get("monto_solicitado") or subobj.get("monto")
-                        if isinstance(v, (int, float)):
-                            return float(v)
-                        if isinstance(v, str):
-                            try:
-                                return float(v)
-                            except:
-                                pass
-                return 0.0
-
             total_creditos = 0
             total_monto = 0.0
             radicaciones_por_estado: Dict[str, int] = {}
@@ -138,12 +279,12 @@ class EstadisticasModel:
             radicaciones_por_banco: Dict[str, int] = {}
             monto_por_banco: Dict[str, float] = {}
 
-            for item in radicados_data:
-                estado_item = item.get("estado", "Sin Estado")
-                banco_item = item.get("banco_nombre", "Sin Banco")
+            for item in resultados["radicados"]:
+                estado_item = item.get("estado") or "Sin Estado"
+                banco_item = item.get("banco_nombre") or "Sin Banco"
                 detalle = item.get("detalle_credito") or {}
 
-                monto = _extraer_monto(detalle)
+                monto = extraer_monto_credito(detalle)
 
                 total_creditos += 1
                 total_monto += monto
@@ -152,7 +293,7 @@ class EstadisticasModel:
                 monto_por_estado[estado_item] = round(monto_por_estado.get(estado_item, 0.0) + monto, 2)
 
                 # Solo exponer desglose por banco cuando el usuario puede ver múltiples bancos
-                if not usuario_info or usuario_info.get("rol") in ["admin", "supervisor", "empresa"]:
+                if puede_ver_desglose:
                     radicaciones_por_banco[banco_item] = radicaciones_por_banco.get(banco_item, 0) + 1
                     monto_por_banco[banco_item] = round(monto_por_banco.get(banco_item, 0.0) + monto, 2)
 
@@ -175,7 +316,7 @@ class EstadisticasModel:
 
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas generales: {e}")
-            return {
+            return _ResultadoSinCache({
                 "total_solicitantes": 0,
                 "total_solicitudes": 0,
                 "solicitudes_por_estado": {},
@@ -190,50 +331,60 @@ class EstadisticasModel:
                 "total_monto": 0,
                 "monto_por_banco": {},
                 "monto_por_estado": {},
-            }
+            })
 
     def estadisticas_rendimiento(self, empresa_id: int, usuario_info: dict = None, dias: int = 30) -> Dict[str, Any]:
         """Obtiene estadísticas de rendimiento del sistema"""
+        return self._con_cache(
+            "rendimiento", empresa_id, usuario_info, {"dias": dias},
+            lambda: self._calcular_rendimiento(empresa_id, usuario_info, dias),
+        )
+
+    def _calcular_rendimiento(self, empresa_id: int, usuario_info: dict = None, dias: int = 30) -> Dict[str, Any]:
+        """Calcula las estadísticas de rendimiento sin pasar por la caché"""
         try:
             from datetime import datetime, timedelta
 
             fecha_inicio = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
 
-            # Solicitudes creadas por día (últimos N días)
-            solicitudes_query = supabase.table("solicitudes").select("created_at").eq("empresa_id", empresa_id).gte("created_at", fecha_inicio)
-            solicitudes_query = self._aplicar_query_filtros_rol(solicitudes_query, usuario_info, empresa_id)
-            solicitudes_resp = solicitudes_query.execute()
-            solicitudes_data = _get_data(solicitudes_resp) or []
+            def _consultar_solicitudes(columnas: str, count: Optional[str] = None, ajustar=None):
+                return self._consultar_solicitudes(empresa_id, usuario_info, columnas, count=count, ajustar=ajustar)
+
+            tareas = {
+                # Solicitudes creadas por día (últimos N días)
+                "tiempo": lambda: _get_data(_consultar_solicitudes(
+                    "created_at", ajustar=lambda q: q.gte("created_at", fecha_inicio)
+                )) or [],
+                # Solicitudes completadas vs pendientes
+                "completadas": lambda: _consultar_solicitudes(
+                    "id", count="exact", ajustar=lambda q: q.neq("estado", "Pendiente")
+                ).count or 0,
+                "pendientes": lambda: _consultar_solicitudes(
+                    "id", count="exact", ajustar=lambda q: q.eq("estado", "Pendiente")
+                ).count or 0,
+            }
+            # Productividad por usuario (solo para admin/supervisor)
+            if not usuario_info or usuario_info.get("rol") in ["admin", "supervisor"]:
+                tareas["productividad"] = lambda: _get_data(_consultar_solicitudes(
+                    "assigned_to_user_id, usuarios(id, info_extra)"
+                )) or []
+
+            resultados = ejecutar_en_paralelo(tareas)
 
             # Agrupar por fecha
             solicitudes_por_dia = {}
-            for solicitud in solicitudes_data:
+            for solicitud in resultados["tiempo"]:
                 fecha = solicitud.get("created_at", "")[:10]  # Solo la fecha YYYY-MM-DD
                 solicitudes_por_dia[fecha] = solicitudes_por_dia.get(fecha, 0) + 1
 
-            # Solicitudes completadas vs pendientes
-            completadas_query = supabase.table("solicitudes").select("id", count="exact").eq("empresa_id", empresa_id).neq("estado", "Pendiente")
-            completadas_query = self._aplicar_query_filtros_rol(completadas_query, usuario_info, empresa_id)
-            completadas_resp = completadas_query.execute()
-            solicitudes_completadas = completadas_resp.count or 0
-
-            pendientes_query = supabase.table("solicitudes").select("id", count="exact").eq("empresa_id", empresa_id).eq("estado", "Pendiente")
-            pendientes_query = self._aplicar_query_filtros_rol(pendientes_query, usuario_info, empresa_id)
-            pendientes_resp = pendientes_query.execute()
-            solicitudes_pendientes = pendientes_resp.count or 0
+            solicitudes_completadas = resultados["completadas"]
+            solicitudes_pendientes = resultados["pendientes"]
 
-            # Productividad por usuario (solo para admin/supervisor)
             productividad_usuarios = {}
-            if not usuario_info or usuario_info.get("rol") in ["admin", "supervisor"]:
-                usuarios_query = supabase.table("solicitudes").select("assigned_to_user_id, usuarios(id, info_extra)").eq("empresa_id", empresa_id)
-                usuarios_query = self._aplicar_query_filtros_rol(usuarios_query, usuario_info, empresa_id)
-                usuarios_resp = usuarios_query.execute()
-                usuarios_data = _get_data(usuarios_resp) or []
-
-                for solicitud in usuarios_data:
-                    user_id = solicitud.get("assigned_to_user_id")
-                    if user_id:
-                        productividad_usuarios[user_id] = productividad_usuarios.get(user_id, 0) + 1
+            for solicitud in resultados.get("productividad", []):
+                user_id = solicitud.get("assigned_to_user_id")
+                if user_id:
+                    productividad_usuarios[user_id] = productividad_usuarios.get(user_id, 0) + 1
 
             return {
                 "periodo_dias": dias,
@@ -245,16 +396,23 @@ class EstadisticasModel:
 
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas de rendimiento: {e}")
-            return {
+            return _ResultadoSinCache({
                 "periodo_dias": dias,
                 "solicitudes_por_dia": {},
                 "solicitudes_completadas": 0,
                 "solicitudes_pendientes": 0,
                 "productividad_usuarios": {}
-            }
+            })
 
     def estadisticas_usuarios(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
         """Obtiene estadísticas de usuarios por empresa"""
+        return self._con_cache(
+            "usuarios", empresa_id, usuario_info, {},
+            lambda: self._calcular_usuarios(empresa_id, usuario_info),
+        )
+
+    def _calcular_usuarios(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Calcula las estadísticas de usuarios sin pasar por la caché"""
         try:
             # Solo admin y supervisor pueden ver estadísticas de usuarios
             if usuario_info and usuario_info.get("rol") not in ["admin", "supervisor"]:
@@ -300,18 +458,33 @@ class EstadisticasModel:
 
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas de usuarios: {e}")
-            return {
+            return _ResultadoSinCache({
                 "total_usuarios": 0,
                 "usuarios_por_rol": {},
                 "usuarios_por_banco": {},
                 "usuarios_por_ciudad": {}
-            }
+            })
 
     def estadisticas_financieras(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
         """Obtiene estadísticas financieras y de calidad"""
+        return self._con_cache(
+            "financieras", empresa_id, usuario_info, {},
+            lambda: self._calcular_financieras(empresa_id, usuario_info),
+        )
+
+    def _calcular_financieras(self, empresa_id: int, usuario_info: dict = None) -> Dict[str, Any]:
+        """Calcula las estadísticas financieras sin pasar por la caché"""
         try:
-            # Rangos de ingresos y actividad económica (optimizado con filtros directos por user_id)
-            financiera_data, actividades_data = self._obtener_datos_financieros_por_rol(empresa_id, usuario_info)
+            # Las cuatro consultas son independientes: se lanzan en paralelo
+            resultados = ejecutar_en_paralelo({
+                # Rangos de ingresos y actividad económica (optimizado con filtros directos por user_id)
+                "datos_financieros": lambda: self._obtener_datos_financieros_por_rol(empresa_id, usuario_info),
+                # Referencias y documentos promedio (optimizado con filtros directos por user_id)
+                "total_solicitantes": lambda: self._contar_solicitantes_por_rol(empresa_id, usuario_info),
+                "total_referencias": lambda: self._contar_referencias_por_rol(empresa_id, usuario_info),
+                "total_documentos": lambda: self._contar_documentos_por_rol(empresa_id, usuario_info),
+            })
+            financiera_data, actividades_data = resultados["datos_financieros"]
 
             # Procesar rangos de ingresos
             rangos_ingresos = {"0-1M": 0, "1M-3M": 0, "3M-5M": 0, "5M+": 0}
@@ -339,10 +512,9 @@ class EstadisticasModel:
                 tipo = detalle.get("tipo_actividad", "Sin Especificar")
                 tipos_actividad[tipo] = tipos_actividad.get(tipo, 0) + 1
 
-            # Referencias y documentos promedio (optimizado con filtros directos por user_id)
-            total_solicitantes = self._contar_solicitantes_por_rol(empresa_id, usuario_info) or 1  # Evitar división por cero
-            total_referencias = self._contar_referencias_por_rol(empresa_id, usuario_info)
-            total_documentos = self._contar_documentos_por_rol(empresa_id, usuario_info)
+            total_solicitantes = resultados["total_solicitantes"] or 1  # Evitar división por cero
+            total_referencias = resultados["total_referencias"]
+            total_documentos = resultados["total_documentos"]
 
             referencias_promedio = round(total_referencias / total_solicitantes, 2)
             documentos_promedio = round(total_documentos / total_solicitantes, 2)
@@ -358,398 +530,122 @@ class EstadisticasModel:
 
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas financieras: {e}")
-            return {
+            return _ResultadoSinCache({
                 "rangos_ingresos": {},
                 "tipos_actividad_economica": {},
                 "referencias_promedio": 0,
                 "documentos_promedio": 0,
                 "total_referencias": 0,
                 "total_documentos": 0
-            }
-
-    def _aplicar_filtros_rol(self, filtros_base: dict, usuario_info: dict = None) -> dict:
-        """Aplica filtros adicionales según el rol del usuario"""
-        if not usuario_info:
-            return filtros_base
-
-        rol = usuario_info.get("rol")
-
-        if rol == "banco":
-            banco_nombre = usuario_info.get("banco_nombre")
-            ciudad = usuario_info.get("ciudad")
-
-            if banco_nombre:
-                filtros_base["banco_nombre"] = banco_nombre
-            if ciudad:
-                filtros_base["ciudad_solicitud"] = ciudad
-
-        return filtros_base
+            })
+
+    def _con_cache(self, endpoint: str, empresa_id: int, usuario_info: Optional[dict], params: dict, calcular) -> Dict[str, Any]:
+        """Devuelve el resultado en caché para este alcance o lo calcula y lo guarda"""
+        if not _cache_estadisticas.habilitada:
+            return calcular()
+
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        clave = (
+            int(empresa_id),
+            alcance.rol,
+            alcance.clave(),
+            endpoint,
+            tuple(sorted(params.items())),
+        )
+        resultado = _cache_estadisticas.get(clave)
+        if resultado is None:
+            # Una escritura que invalide mientras se calcula deja el resultado fuera de la caché
+            generacion = _cache_estadisticas.generacion
+            resultado = calcular()
+            if isinstance(resultado, _ResultadoSinCache):
+                return dict(resultado)
+            _cache_estadisticas.set(clave, resultado, generacion=generacion)
+        return copy.deepcopy(resultado)
+
+    def _consultar_solicitudes(self, empresa_id: int, usuario_info: dict, columnas: str, count: Optional[str] = None, ajustar=None):
+        """Ejecuta un select sobre solicitudes de la empresa con los filtros de rol aplicados"""
+        query = supabase.table("solicitudes").select(columnas, count=count).eq("empresa_id", empresa_id)
+        if ajustar:
+            query = ajustar(query)
+        query = self._aplicar_query_filtros_rol(query, usuario_info, empresa_id)
+        return query.execute()
 
     def _aplicar_query_filtros_rol(self, query, usuario_info: dict = None, empresa_id: int = None):
         """Aplica filtros de rol a una query de Supabase"""
-        if not usuario_info:
-            return query
-
-        rol = usuario_info.get("rol")
-
-        if rol == "banco":
-            banco_nombre = usuario_info.get("banco_nombre")
-            ciudad = usuario_info.get("ciudad")
-
-            if banco_nombre:
-                query = query.eq("banco_nombre", banco_nombre)
-            if ciudad:
-                query = query.eq("ciudad_solicitud", ciudad)
-        elif rol == "supervisor":
-            # Usuario supervisor ve las solicitudes de su equipo + las suyas propias
-            user_id = usuario_info.get("id")
-            if user_id and empresa_id:
-                # Obtener IDs de usuarios de su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-
-                # Filtrar por created_by_user_id o assigned_to_user_id
-                query = query.or_(f"created_by_user_id.in.({','.join(map(str, user_ids))}),assigned_to_user_id.in.({','.join(map(str, user_ids))})")
-        elif rol == "asesor":
-            # Usuario asesor ve solo sus propias solicitudes (priorizando created_by_user_id)
-            user_id = usuario_info.get("id")
-            if user_id:
-                # Priorizar solicitudes creadas por el usuario, incluir también las asignadas
-                query = query.or_(f"created_by_user_id.eq.{user_id},assigned_to_user_id.eq.{user_id}")
-
-        return query
+        return AlcanceRol.resolver(usuario_info, empresa_id).filtrar_solicitudes(query)
+
+    def _query_con_alcance(self, tabla: str, columnas: str, empresa_id: int, usuario_info: dict = None, count: Optional[str] = None):
+        """
+        Select sobre solicitantes o una tabla ligada a ellos (documentos, referencias, informacion_financiera,
+        actividad_economica), acotado por las solicitudes que ve el rol con el mismo AlcanceRol que las
+        consultas de solicitudes. None si el usuario no puede ver nada.
+        """
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        if alcance.sin_acceso:
+            return None
+
+        if alcance.ve_todo:
+            # Toda la empresa; documentos no tiene empresa_id y se acota por su solicitante
+            if tabla == "documentos":
+                return supabase.table(tabla).select(
+                    f"{columnas}, solicitantes!inner(empresa_id)", count=count
+                ).eq("solicitantes.empresa_id", empresa_id)
+            return supabase.table(tabla).select(columnas, count=count).eq("empresa_id", empresa_id)
+
+        # Solo los solicitantes con alguna solicitud visible (solicitudes!inner filtrado por el alcance)
+        if tabla == "solicitantes":
+            query = supabase.table(tabla).select(
+                f"{columnas}, solicitudes!inner(id)", count=count
+            ).eq("empresa_id", empresa_id)
+            return alcance.filtrar_solicitudes(query, reference_table="solicitudes")
+
+        query = supabase.table(tabla).select(
+            f"{columnas}, solicitantes!inner(empresa_id, solicitudes!inner(id))", count=count
+        ).eq("solicitantes.empresa_id", empresa_id)
+        return alcance.filtrar_solicitudes(query, reference_table="solicitantes.solicitudes")
+
+    def _contar_por_rol(self, tabla: str, empresa_id: int, usuario_info: dict = None) -> int:
+        query = self._query_con_alcance(tabla, "id", empresa_id, usuario_info, count="exact")
+        if query is None:
+            return 0
+        return query.execute().count or 0
 
     def _contar_solicitantes_por_rol(self, empresa_id: int, usuario_info: dict = None) -> int:
-        """Cuenta solicitantes aplicando filtros de rol de manera optimizada usando user_id directamente"""
+        """Cuenta los solicitantes visibles para el rol"""
         try:
-            if not usuario_info or usuario_info.get("rol") in ["admin", "empresa"]:
-                # Admin y empresa ven todos los solicitantes de la empresa
-                resp = supabase.table("solicitantes").select("id", count="exact").eq("empresa_id", empresa_id).execute()
-                return resp.count or 0
-
-            rol = usuario_info.get("rol")
-            user_id = usuario_info.get("id")
-
-            if rol == "supervisor" and user_id:
-                # Supervisor ve solo solicitantes de solicitudes creadas por él y su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-
-                # Contar solicitantes que tienen solicitudes creadas por el supervisor o su equipo
-                resp = supabase.table("solicitantes").select(
-                    "id, solicitudes!inner(created_by_user_id)",
-                    count="exact"
-                ).eq("empresa_id", empresa_id).in_(
-                    "solicitudes.created_by_user_id", user_ids
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "asesor" and user_id:
-                # Asesor ve solo solicitantes de solicitudes creadas por él (created_by_user_id es la variable principal)
-                # Usar join directo con solicitudes filtrando principalmente por created_by_user_id
-                resp = supabase.table("solicitantes").select(
-                    "id, solicitudes!inner(created_by_user_id, assigned_to_user_id)",
-                    count="exact"
-                ).eq("empresa_id", empresa_id).eq(
-                    "solicitudes.created_by_user_id", user_id
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "banco":
-                # Usuario banco ve solicitantes filtrados por banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad = usuario_info.get("ciudad")
-
-                if not banco_nombre and not ciudad:
-                    return 0
-
-                # Usar join directo con solicitudes filtrando por banco/ciudad
-                query = supabase.table("solicitantes").select(
-                    "id, solicitudes!inner(banco_nombre, ciudad_solicitud)",
-                    count="exact"
-                ).eq("empresa_id", empresa_id)
-
-                filters = []
-                if banco_nombre:
-                    filters.append(f"solicitudes.banco_nombre.eq.{banco_nombre}")
-                if ciudad:
-                    filters.append(f"solicitudes.ciudad_solicitud.eq.{ciudad}")
-
-                if filters:
-                    query = query.or_(",".join(filters))
-
-                resp = query.execute()
-                return resp.count or 0
-
-            return 0
-
+            return self._contar_por_rol("solicitantes", empresa_id, usuario_info)
         except Exception as e:
             print(f"❌ Error contando solicitantes por rol: {e}")
             return 0
 
     def _contar_documentos_por_rol(self, empresa_id: int, usuario_info: dict = None) -> int:
-        """Cuenta documentos aplicando filtros de rol de manera optimizada usando user_id directamente"""
+        """Cuenta los documentos de los solicitantes visibles para el rol"""
         try:
-            if not usuario_info or usuario_info.get("rol") in ["admin", "empresa"]:
-                # Admin y empresa ven todos los documentos de la empresa
-                resp = supabase.table("documentos").select(
-                    "id, solicitantes!inner(empresa_id)",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id).execute()
-                return resp.count or 0
-
-            rol = usuario_info.get("rol")
-            user_id = usuario_info.get("id")
-
-            if rol == "supervisor" and user_id:
-                # Supervisor ve solo documentos de solicitantes de solicitudes creadas por él y su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-
-                # Contar documentos de solicitantes que tienen solicitudes creadas por el supervisor o su equipo
-                resp = supabase.table("documentos").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id).in_(
-                    "solicitantes.solicitudes.created_by_user_id", user_ids
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "asesor" and user_id:
-                # Asesor ve solo documentos de solicitantes de solicitudes creadas por él (created_by_user_id principal)
-                # Usar doble join: documentos -> solicitantes -> solicitudes, filtrando por created_by_user_id
-                resp = supabase.table("documentos").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id).eq(
-                    "solicitantes.solicitudes.created_by_user_id", user_id
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "banco":
-                # Usuario banco ve documentos filtrados por banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad = usuario_info.get("ciudad")
-
-                if not banco_nombre and not ciudad:
-                    return 0
-
-                # Usar doble join: documentos -> solicitantes -> solicitudes, filtrando por banco/ciudad
-                query = supabase.table("documentos").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(banco_nombre, ciudad_solicitud))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id)
-
-                if banco_nombre:
-                    query = query.eq("solicitantes.solicitudes.banco_nombre", banco_nombre)
-                if ciudad:
-                    query = query.eq("solicitantes.solicitudes.ciudad_solicitud", ciudad)
-
-                resp = query.execute()
-                return resp.count or 0
-
-            return 0
-
+            return self._contar_por_rol("documentos", empresa_id, usuario_info)
         except Exception as e:
             print(f"❌ Error contando documentos por rol: {e}")
             return 0
 
     def _obtener_datos_financieros_por_rol(self, empresa_id: int, usuario_info: dict = None) -> tuple:
-        """Obtiene datos financieros y de actividad económica aplicando filtros de rol optimizados"""
+        """Información financiera y actividad económica de los solicitantes visibles para el rol"""
         try:
-            if not usuario_info or usuario_info.get("rol") in ["admin", "empresa"]:
-                # Admin y empresa ven toda la información de la empresa
-                financiera_resp = supabase.table("informacion_financiera").select("detalle_financiera").eq("empresa_id", empresa_id).execute()
-                financiera_data = _get_data(financiera_resp) or []
-
-                actividades_resp = supabase.table("actividad_economica").select("detalle_actividad").eq("empresa_id", empresa_id).execute()
-                actividades_data = _get_data(actividades_resp) or []
-
-                return financiera_data, actividades_data
-
-            rol = usuario_info.get("rol")
-            user_id = usuario_info.get("id")
-
-            if rol == "supervisor" and user_id:
-                # Supervisor ve solo información de solicitantes de solicitudes creadas por él y su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-
-                # Información financiera con filtro de equipo
-                financiera_resp = supabase.table("informacion_financiera").select(
-                    "detalle_financiera, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))"
-                ).eq("solicitantes.empresa_id", empresa_id).in_(
-                    "solicitantes.solicitudes.created_by_user_id", user_ids
-                ).execute()
-                financiera_data = _get_data(financiera_resp) or []
-
-                # Actividad económica con el mismo filtro
-                actividades_resp = supabase.table("actividad_economica").select(
-                    "detalle_actividad, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))"
-                ).eq("solicitantes.empresa_id", empresa_id).in_(
-                    "solicitantes.solicitudes.created_by_user_id", user_ids
-                ).execute()
-                actividades_data = _get_data(actividades_resp) or []
-
-                return financiera_data, actividades_data
-
-            elif rol == "asesor" and user_id:
-                # Asesor ve solo información de solicitantes de solicitudes creadas por él (created_by_user_id principal)
-                # Usar join directo: informacion_financiera -> solicitantes -> solicitudes, filtrando por created_by_user_id
-                financiera_resp = supabase.table("informacion_financiera").select(
-                    "detalle_financiera, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))"
-                ).eq("solicitantes.empresa_id", empresa_id).eq(
-                    "solicitantes.solicitudes.created_by_user_id", user_id
-                ).execute()
-                financiera_data = _get_data(financiera_resp) or []
-
-                # Actividad económica con el mismo filtro
-                actividades_resp = supabase.table("actividad_economica").select(
-                    "detalle_actividad, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))"
-                ).eq("solicitantes.empresa_id", empresa_id).eq(
-                    "solicitantes.solicitudes.created_by_user_id", user_id
-                ).execute()
-                actividades_data = _get_data(actividades_resp) or []
-
-                return financiera_data, actividades_data
-
-            elif rol == "banco":
-                # Usuario banco ve información filtrada por banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad = usuario_info.get("ciudad")
-
-                if not banco_nombre and not ciudad:
-                    return [], []
-
-                # Información financiera con filtro de banco/ciudad
-                query_financiera = supabase.table("informacion_financiera").select(
-                    "detalle_financiera, solicitantes!inner(empresa_id, solicitudes!inner(banco_nombre, ciudad_solicitud))"
-                ).eq("solicitantes.empresa_id", empresa_id)
-
-                if banco_nombre:
-                    query_financiera = query_financiera.eq("solicitantes.solicitudes.banco_nombre", banco_nombre)
-                if ciudad:
-                    query_financiera = query_financiera.eq("solicitantes.solicitudes.ciudad_solicitud", ciudad)
-
-                financiera_resp = query_financiera.execute()
-                financiera_data = _get_data(financiera_resp) or []
-
-                # Actividad económica con el mismo filtro
-                query_actividades = supabase.table("actividad_economica").select(
-                    "detalle_actividad, solicitantes!inner(empresa_id, solicitudes!inner(banco_nombre, ciudad_solicitud))"
-                ).eq("solicitantes.empresa_id", empresa_id)
-
-                if banco_nombre:
-                    query_actividades = query_actividades.eq("solicitantes.solicitudes.banco_nombre", banco_nombre)
-                if ciudad:
-                    query_actividades = query_actividades.eq("solicitantes.solicitudes.ciudad_solicitud", ciudad)
+            query_financiera = self._query_con_alcance("informacion_financiera", "detalle_financiera", empresa_id, usuario_info)
+            query_actividades = self._query_con_alcance("actividad_economica", "detalle_actividad", empresa_id, usuario_info)
+            if query_financiera is None or query_actividades is None:
+                return [], []
 
-                actividades_resp = query_actividades.execute()
-                actividades_data = _get_data(actividades_resp) or []
-
-                return financiera_data, actividades_data
-
-            return [], []
+            financiera_data = _get_data(query_financiera.execute()) or []
+            actividades_data = _get_data(query_actividades.execute()) or []
+            return financiera_data, actividades_data
 
         except Exception as e:
             print(f"❌ Error obteniendo datos financieros por rol: {e}")
             return [], []
 
     def _contar_referencias_por_rol(self, empresa_id: int, usuario_info: dict = None) -> int:
-        """Cuenta referencias aplicando filtros de rol de manera optimizada usando user_id directamente"""
+        """Cuenta las referencias de los solicitantes visibles para el rol"""
         try:
-            if not usuario_info or usuario_info.get("rol") in ["admin", "empresa"]:
-                # Admin y empresa ven todas las referencias de la empresa
-                resp = supabase.table("referencias").select("id", count="exact").eq("empresa_id", empresa_id).execute()
-                return resp.count or 0
-
-            rol = usuario_info.get("rol")
-            user_id = usuario_info.get("id")
-
-            if rol == "supervisor" and user_id:
-                # Supervisor ve solo referencias de solicitantes de solicitudes creadas por él y su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-
-                # Contar referencias de solicitantes que tienen solicitudes creadas por el supervisor o su equipo
-                resp = supabase.table("referencias").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id).in_(
-                    "solicitantes.solicitudes.created_by_user_id", user_ids
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "asesor" and user_id:
-                # Asesor ve solo referencias de solicitantes de solicitudes creadas por él (created_by_user_id principal)
-                # Usar doble join: referencias -> solicitantes -> solicitudes, filtrando por created_by_user_id
-                resp = supabase.table("referencias").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(created_by_user_id))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id).eq(
-                    "solicitantes.solicitudes.created_by_user_id", user_id
-                ).execute()
-                return resp.count or 0
-
-            elif rol == "banco":
-                # Usuario banco ve referencias filtradas por banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad = usuario_info.get("ciudad")
-
-                if not banco_nombre and not ciudad:
-                    return 0
-
-                # Usar doble join: referencias -> solicitantes -> solicitudes, filtrando por banco/ciudad
-                query = supabase.table("referencias").select(
-                    "id, solicitantes!inner(empresa_id, solicitudes!inner(banco_nombre, ciudad_solicitud))",
-                    count="exact"
-                ).eq("solicitantes.empresa_id", empresa_id)
-
-                if banco_nombre:
-                    query = query.eq("solicitantes.solicitudes.banco_nombre", banco_nombre)
-                if ciudad:
-                    query = query.eq("solicitantes.solicitudes.ciudad_solicitud", ciudad)
-
-                resp = query.execute()
-                return resp.count or 0
-
-            return 0
-
+            return self._contar_por_rol("referencias", empresa_id, usuario_info)
         except Exception as e:
             print(f"❌ Error contando referencias por rol: {e}")
             return 0
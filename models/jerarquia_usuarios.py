@@ -0,0 +1,160 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, FrozenSet, Optional, Tuple
+from utils.cache_ttl import CacheTTL
+
+# Cierre de la jerarquía por empresa; UsuariosModel lo actualiza al cambiar reports_to_id
+_cache_jerarquias = CacheTTL(
+    ttl_segundos=float(os.getenv("JERARQUIA_USUARIOS_TTL", "300")),
+    max_entradas=int(os.getenv("JERARQUIA_USUARIOS_MAX", "256")),
+)
+
+
+def invalidar_jerarquia(empresa_id: Optional[int] = None) -> None:
+    """Descarta la jerarquía en caché de una empresa (o de todas)."""
+    if empresa_id is None:
+        _cache_jerarquias.invalidar()
+    else:
+        _cache_jerarquias.invalidar(lambda clave: clave == int(empresa_id))
+
+
+def actualizar_jerarquia(empresa_id: int, user_id: int, reports_to_id: Optional[int]) -> None:
+    """Aplica un cambio de línea de reporte ya guardado a la jerarquía en caché (si está cargada)."""
+    jerarquia = _cache_jerarquias.get(int(empresa_id))
+    if jerarquia is None:
+        return
+    try:
+        jerarquia.mover(user_id, reports_to_id)
+    except ValueError as e:
+        # La BD ya tiene el cambio y la caché no coincide (cambios en otro worker): se reconstruye al leerla
+        print(f"⚠️ Jerarquía en caché desactualizada para la empresa {empresa_id}: {e}")
+        invalidar_jerarquia(empresa_id)
+
+
+def quitar_de_jerarquia(empresa_id: int, user_id: int) -> None:
+    """Quita un usuario eliminado de la jerarquía en caché (si está cargada)."""
+    jerarquia = _cache_jerarquias.get(int(empresa_id))
+    if jerarquia is not None:
+        jerarquia.quitar(user_id)
+
+
+class JerarquiaUsuarios:
+    """
+    Cierre transitivo de usuarios.reports_to_id dentro de una empresa:
+    para cada usuario guarda todos sus descendientes (equipo directo, equipos de
+    sus supervisores, ...) y su cadena de ancestros, así "todos los usuarios bajo X"
+    es una sola búsqueda en memoria en lugar de una consulta por nivel.
+    """
+
+    def __init__(self, reportes: Dict[int, Optional[int]]):
+        self._lock = threading.Lock()
+        self._padres: Dict[int, Optional[int]] = dict(reportes)
+        self._descendientes: Dict[int, FrozenSet[int]] = {}
+        self._ancestros: Dict[int, Tuple[int, ...]] = {}
+        self._recalcular()
+
+    @classmethod
+    def de_empresa(cls, empresa_id: int) -> "JerarquiaUsuarios":
+        """Jerarquía de la empresa, en caché por TTL (se construye desde el directorio de usuarios)."""
+        from models.directorio_usuarios import DirectorioUsuarios
+
+        clave = int(empresa_id)
+        jerarquia = _cache_jerarquias.get(clave)
+        if jerarquia is None:
+            jerarquia = cls(DirectorioUsuarios.de_empresa(clave).reportes())
+            _cache_jerarquias.set(clave, jerarquia)
+        return jerarquia
+
+    @classmethod
+    def desde_bd(cls, empresa_id: int) -> "JerarquiaUsuarios":
+        """Jerarquía leída de la BD sin pasar por cachés (para validar un cambio antes de guardarlo).
+        Queda en caché como la versión vigente de la empresa."""
+        from data.supabase_conn import supabase
+
+        clave = int(empresa_id)
+        resp = supabase.table("usuarios").select("id, reports_to_id").eq("empresa_id", clave).execute()
+        jerarquia = cls({usuario["id"]: usuario.get("reports_to_id") for usuario in resp.data or []})
+        _cache_jerarquias.set(clave, jerarquia)
+        return jerarquia
+
+    def descendientes(self, user_id: int) -> FrozenSet[int]:
+        """IDs de todos los usuarios bajo `user_id` (sin incluirlo)"""
+        return self._descendientes.get(user_id, frozenset())
+
+    def ancestros(self, user_id: int) -> Tuple[int, ...]:
+        """Cadena de supervisores de `user_id`, del inmediato hacia arriba"""
+        return self._ancestros.get(user_id, ())
+
+    def padre(self, user_id: int) -> Optional[int]:
+        return self._padres.get(user_id)
+
+    def crearia_ciclo(self, user_id: int, reports_to_id: Optional[int]) -> bool:
+        """True si hacer que `user_id` reporte a `reports_to_id` cerraría un ciclo"""
+        if not reports_to_id:
+            return False
+        return reports_to_id == user_id or reports_to_id in self.descendientes(user_id)
+
+    def mover(self, user_id: int, reports_to_id: Optional[int]) -> None:
+        """Cambia la línea de reporte de `user_id` actualizando solo los ancestros afectados."""
+        with self._lock:
+            if self._padres.get(user_id) == reports_to_id and user_id in self._padres:
+                return
+            if self.crearia_ciclo(user_id, reports_to_id):
+                raise ValueError(f"El usuario {reports_to_id} está bajo el usuario {user_id}: se formaría un ciclo")
+
+            subarbol = self.descendientes(user_id) | {user_id}
+            descendientes = dict(self._descendientes)
+            for ancestro in self.ancestros(user_id):
+                descendientes[ancestro] = descendientes.get(ancestro, frozenset()) - subarbol
+
+            if reports_to_id and reports_to_id not in self._padres:
+                # Supervisor que no estaba en el directorio (p. ej. creado en otro worker)
+                self._padres[reports_to_id] = None
+                self._ancestros[reports_to_id] = ()
+            self._padres[user_id] = reports_to_id
+
+            nuevos_ancestros = ((reports_to_id,) + self.ancestros(reports_to_id)) if reports_to_id else ()
+            for ancestro in nuevos_ancestros:
+                descendientes[ancestro] = descendientes.get(ancestro, frozenset()) | subarbol
+            self._descendientes = descendientes
+
+            # Los ancestros de todo el subárbol cambian en el mismo tramo superior
+            ancestros = dict(self._ancestros)
+            for miembro in subarbol:
+                tramo = ancestros.get(miembro, ())
+                corte = tramo.index(user_id) + 1 if user_id in tramo else 0
+                ancestros[miembro] = tramo[:corte] + nuevos_ancestros if miembro != user_id else nuevos_ancestros
+            self._ancestros = ancestros
+
+    def quitar(self, user_id: int) -> None:
+        """Elimina a `user_id`; su equipo conserva el reports_to_id (como en la BD) y deja de colgar de sus ancestros."""
+        with self._lock:
+            if user_id not in self._padres:
+                return
+            del self._padres[user_id]
+            self._recalcular()
+
+    def _recalcular(self) -> None:
+        descendientes: Dict[int, set] = {}
+        ancestros: Dict[int, Tuple[int, ...]] = {}
+        for user_id in self._padres:
+            cadena = []
+            visitados = {user_id}
+            actual = self._padres.get(user_id)
+            while actual and actual not in visitados:
+                # Un ciclo en los datos corta la cadena en lugar de colgar la construcción
+                cadena.append(actual)
+                visitados.add(actual)
+                actual = self._padres.get(actual)
+            ancestros[user_id] = tuple(cadena)
+            for ancestro in cadena:
+                descendientes.setdefault(ancestro, set()).add(user_id)
+        self._ancestros = ancestros
+        self._descendientes = {user_id: frozenset(ids) for user_id, ids in descendientes.items()}
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._padres
+
+    def __len__(self) -> int:
+        return len(self._padres)
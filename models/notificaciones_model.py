@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 from data.supabase_conn import supabase
+from models.alcance_rol import AlcanceRol
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -242,66 +243,6 @@ class NotificacionesModel:
         """Aplica filtros de rol a una query de notificaciones"""
         if not usuario_info:
             return query
-
-        rol = usuario_info.get("rol")
-        user_id = usuario_info.get("id")
-
-        if rol == "banco":
-            # Usuario banco: solo ve notificaciones de su banco y ciudad
-            banco_nombre = usuario_info.get("banco_nombre")
-            ciudad = usuario_info.get("ciudad")
-
-            # Filtrar por metadata que contenga banco_nombre y ciudad
-            if banco_nombre or ciudad:
-                # Crear filtros para metadata JSONB
-                metadata_filtros = []
-                if banco_nombre:
-                    metadata_filtros.append(f"metadata->>'banco_nombre'.eq.{banco_nombre}")
-                if ciudad:
-                    metadata_filtros.append(f"metadata->>'ciudad'.eq.{ciudad}")
-
-                if metadata_filtros:
-                    # Aplicar filtros OR para metadata
-                    query = query.or_(",".join(metadata_filtros))
-
-        elif rol == "supervisor":
-            # Usuario supervisor: ve notificaciones creadas por su equipo + las suyas propias
-            if user_id and empresa_id:
-                # Obtener IDs de usuarios de su equipo
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                # Incluir su propio ID + IDs de su equipo
-                user_ids = [user_id]  # Su propio ID
-                if team_members:
-                    team_ids = [member["id"] for member in team_members]
-                    user_ids.extend(team_ids)
-                    print(f"   ✅ Supervisor {user_id} - viendo notificaciones creadas por su equipo: {user_ids}")
-
-                # Filtrar por usuario_id (quien creó la notificación)
-                query = query.in_("usuario_id", user_ids)
-
-        elif rol == "asesor":
-            # Usuario asesor: ve notificaciones creadas por él + las creadas por su supervisor
-            if user_id and empresa_id:
-                # Obtener el supervisor del asesor
-                from models.usuarios_model import UsuariosModel
-                usuarios_model = UsuariosModel()
-                asesor_info = usuarios_model.get_by_id(user_id, empresa_id)
-
-                user_ids = [user_id]  # Sus propias notificaciones
-
-                if asesor_info and asesor_info.get("reports_to_id"):
-                    supervisor_id = asesor_info["reports_to_id"]
-                    user_ids.append(supervisor_id)
-                    print(f"   ✅ Asesor {user_id} - viendo notificaciones creadas por él + por su supervisor {supervisor_id}: {user_ids}")
-                else:
-                    print(f"   ✅ Asesor {user_id} - sin supervisor, viendo solo sus notificaciones: {user_ids}")
-
-                # Filtrar por usuario_id (quien creó la notificación)
-                query = query.in_("usuario_id", user_ids)
-
-        # admin, empresa: ven todas las notificaciones (sin filtros adicionales)
-
-        return query
+        # banco: metadata de su banco o ciudad; supervisor: su equipo + las suyas;
+        # asesor: las suyas + las de su supervisor; admin, empresa: todas
+        return AlcanceRol.resolver(usuario_info, empresa_id).filtrar_notificaciones(query)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 from data.supabase_conn import supabase
+from data.supabase_async import obtener_cliente_async
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -31,13 +32,22 @@ class ReferenciasModel:
         return data[0] if isinstance(data, list) and data else None
 
     def list(self, *, empresa_id: int, solicitante_id: Optional[int] = None, tipo_referencia: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
-        q = supabase.table(self.TABLE).select("*").eq("empresa_id", empresa_id)
+        resp = self._consulta_list(supabase, empresa_id=empresa_id, solicitante_id=solicitante_id, tipo_referencia=tipo_referencia, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    async def list_async(self, *, empresa_id: int, solicitante_id: Optional[int] = None, tipo_referencia: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Igual que list, sobre el cliente asíncrono (ver data.supabase_async)"""
+        cliente = await obtener_cliente_async()
+        resp = await self._consulta_list(cliente, empresa_id=empresa_id, solicitante_id=solicitante_id, tipo_referencia=tipo_referencia, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    def _consulta_list(self, cliente, *, empresa_id: int, solicitante_id: Optional[int], tipo_referencia: Optional[str], limit: int, offset: int):
+        q = cliente.table(self.TABLE).select("*").eq("empresa_id", empresa_id)
         if solicitante_id:
             q = q.eq("solicitante_id", solicitante_id)
         if tipo_referencia:
             q = q.eq("tipo_referencia", tipo_referencia)
-        resp = q.range(offset, offset + max(limit - 1, 0)).execute()
-        return _get_data(resp) or []
+        return q.range(offset, offset + max(limit - 1, 0))
 
     def update(self, *, id: int, empresa_id: int, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         resp = supabase.table(self.TABLE).update(updates).eq("id", id).eq("empresa_id", empresa_id).execute()
@@ -97,6 +107,26 @@ class ReferenciasModel:
     def _normalize_tipo_obj(self, tipo: Any) -> Optional[Dict[str, Any]]:
         return None  # Tipos ya no se manejan a nivel de modelo (columna eliminada)
 
+    def _preparar_referencia(self, referencia: Dict[str, Any], referencia_id: int) -> Dict[str, Any]:
+        # Asegurar que va dentro de la clave referencias
+        nueva = dict(referencia) if referencia else {}
+        nueva["referencia_id"] = referencia_id
+
+        # Limpiar llaves no usadas; permitimos 'tipo_referencia' como parte del detalle
+        nueva.pop("tipo", None)
+        nueva.pop("id_tipo_referencia", None)
+        return nueva
+
+    def construir_contenedor(self, *, empresa_id: int, solicitante_id: int, referencias: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fila contenedora de un solicitante nuevo con sus referencias ya numeradas (referencia_id desde 1)"""
+        return {
+            "empresa_id": empresa_id,
+            "solicitante_id": solicitante_id,
+            "detalle_referencia": {
+                "referencias": [self._preparar_referencia(ref, idx) for idx, ref in enumerate(referencias, start=1)]
+            },
+        }
+
     def add_referencia(self, *, empresa_id: int, solicitante_id: int, referencia: Dict[str, Any]) -> Dict[str, Any]:
         """Agrega una referencia al JSON del solicitante, generando referencia_id incremental.
         También actualiza el arreglo tipo_referencia agregando el tipo si no existe.
@@ -117,16 +147,7 @@ class ReferenciasModel:
                 continue
         next_id = max_id + 1
 
-        # Preparar referencia nueva
-        nueva = dict(referencia) if referencia else {}
-        # Asegurar que va dentro de la clave referencias
-        nueva["referencia_id"] = next_id
-
-        # Limpiar llaves no usadas; permitimos 'tipo_referencia' como parte del detalle
-        nueva.pop("tipo", None)
-        nueva.pop("id_tipo_referencia", None)
-
-        referencias_arr.append(nueva)
+        referencias_arr.append(self._preparar_referencia(referencia, next_id))
 
         # Persistir cambios
         updates = {
@@ -0,0 +1,236 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from data.supabase_conn import supabase
+from data.supabase_async import consultar_en_paralelo
+from models.estadisticas_model import invalidar_estadisticas
+from models.estadisticas_contadores_model import EstadisticasContadoresModel
+from utils.supabase_errors import is_relationship_not_found_error, is_rpc_not_found_error
+
+def _get_data(resp):
+    if hasattr(resp, "data"):
+        return resp.data
+    if isinstance(resp, dict) and "data" in resp:
+        return resp["data"]
+    return resp
+
+
+def _como_lista(valor: Any) -> List[Dict[str, Any]]:
+    # PostgREST embebe como objeto (no lista) las relaciones uno a uno
+    if not valor:
+        return []
+    return valor if isinstance(valor, list) else [valor]
+
+
+# Contadores incrementales de estadísticas (opt-in con ESTADISTICAS_CONTADORES)
+_contadores = EstadisticasContadoresModel()
+
+
+class RegistroCompletoModel:
+    """
+    Registro completo de un solicitante: el solicitante y todas sus secciones
+    (ubicaciones, actividad económica, información financiera, referencias,
+    solicitudes y documentos) en una sola ida y vuelta a la BD, tanto al leerlo
+    como al crearlo.
+    """
+
+    TABLE = "solicitantes"
+
+    # Secciones embebidas: clave de la respuesta -> tabla
+    SECCIONES = {
+        "ubicaciones": "ubicacion",
+        "actividad_economica": "actividad_economica",
+        "informacion_financiera": "informacion_financiera",
+        "referencias": "referencias",
+        "solicitudes": "solicitudes",
+        "documentos": "documentos",
+    }
+
+    # documentos no tiene empresa_id: se acota por el solicitante (que sí se filtra por empresa)
+    SECCIONES_SIN_EMPRESA = ("documentos",)
+
+    SELECT_EMBEBIDO = (
+        "*, ubicacion(*), actividad_economica(*), informacion_financiera(*), referencias(*), "
+        "solicitudes(*, usuarios!created_by_user_id(nombre)), documentos(*)"
+    )
+
+    # Se desactiva si la BD no tiene alguna de las relaciones (PGRST200) y se consulta por secciones
+    _embebido_disponible = True
+
+    # Función de sql/registro_completo.sql; si no está instalada se crea por pasos
+    RPC_CREAR = "crear_registro_completo"
+    _rpc_crear_disponible = True
+
+    # Tablas hijas en orden de inserción (al deshacer se borran en orden inverso)
+    TABLAS_CREACION = ("ubicacion", "actividad_economica", "informacion_financiera", "referencias", "solicitudes")
+
+    def cargar(self, *, solicitante_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+        """
+        {"solicitante", "ubicaciones", "actividad_economica", "informacion_financiera",
+         "referencias", "solicitudes", "documentos"} o None si el solicitante no existe en la empresa.
+        actividad_economica e informacion_financiera son el primer registro (o None); el resto, listas.
+        """
+        if RegistroCompletoModel._embebido_disponible:
+            try:
+                return self._cargar_embebido(solicitante_id, empresa_id)
+            except Exception as e:
+                if is_relationship_not_found_error(e):
+                    RegistroCompletoModel._embebido_disponible = False
+                    print(f"⚠️ Relaciones de {self.TABLE} no disponibles para embeber, consultando por secciones: {e}")
+                else:
+                    print(f"⚠️ Error en select embebido del registro completo, consultando por secciones: {e}")
+
+        return self._cargar_por_secciones(solicitante_id, empresa_id)
+
+    def _cargar_embebido(self, solicitante_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+        from models.solicitudes_model import SolicitudesModel
+
+        q = supabase.table(self.TABLE).select(self.SELECT_EMBEBIDO).eq("id", solicitante_id).eq("empresa_id", empresa_id)
+        for tabla in self.SECCIONES.values():
+            if tabla not in self.SECCIONES_SIN_EMPRESA:
+                # Filtro sobre la tabla embebida: acota sus filas, no al solicitante
+                q = q.eq(f"{tabla}.empresa_id", empresa_id)
+        data = _get_data(q.execute())
+        fila = data[0] if isinstance(data, list) and data else None
+        if not fila:
+            return None
+
+        solicitante = dict(fila)
+        secciones = {clave: _como_lista(solicitante.pop(tabla, None)) for clave, tabla in self.SECCIONES.items()}
+        secciones["solicitudes"] = SolicitudesModel()._procesar_list(secciones["solicitudes"])
+        return self._armar(solicitante, secciones)
+
+    def _cargar_por_secciones(self, solicitante_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+        """Mismas lecturas que el select embebido, lanzadas en paralelo sobre el cliente asíncrono"""
+        from models.solicitantes_model import SolicitantesModel
+        from models.ubicaciones_model import UbicacionesModel
+        from models.actividad_economica_model import ActividadEconomicaModel
+        from models.informacion_financiera_model import InformacionFinancieraModel
+        from models.referencias_model import ReferenciasModel
+        from models.solicitudes_model import SolicitudesModel
+        from models.documentos_model import DocumentosModel
+
+        # Si una sección falla se devuelve sin ella; si falla el solicitante se propaga el error
+        registros = consultar_en_paralelo(
+            {
+                "solicitante": lambda: SolicitantesModel().get_by_id_async(id=solicitante_id, empresa_id=empresa_id),
+                "ubicaciones": lambda: UbicacionesModel().list_async(empresa_id=empresa_id, solicitante_id=solicitante_id),
+                "actividad_economica": lambda: ActividadEconomicaModel().list_async(empresa_id=empresa_id, solicitante_id=solicitante_id),
+                "informacion_financiera": lambda: InformacionFinancieraModel().list_async(empresa_id=empresa_id, solicitante_id=solicitante_id),
+                "referencias": lambda: ReferenciasModel().list_async(empresa_id=empresa_id, solicitante_id=solicitante_id),
+                "solicitudes": lambda: SolicitudesModel().list_async(empresa_id=empresa_id, solicitante_id=solicitante_id),
+                "documentos": lambda: DocumentosModel().list_async(solicitante_id=solicitante_id),
+            },
+            defaults={clave: [] for clave in self.SECCIONES},
+        )
+        solicitante = registros.pop("solicitante")
+        if not solicitante:
+            return None
+        return self._armar(solicitante, registros)
+
+    def _armar(self, solicitante: Dict[str, Any], secciones: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        actividad = secciones.get("actividad_economica") or []
+        financiera = secciones.get("informacion_financiera") or []
+        return {
+            "solicitante": solicitante,
+            "ubicaciones": secciones.get("ubicaciones") or [],
+            "actividad_economica": actividad[0] if actividad else None,
+            "informacion_financiera": financiera[0] if financiera else None,
+            "referencias": secciones.get("referencias") or [],
+            "solicitudes": secciones.get("solicitudes") or [],
+            "documentos": secciones.get("documentos") or [],
+        }
+
+    # ------------------------------------------------------------------
+    # Creación
+    # ------------------------------------------------------------------
+    def crear(self, *, empresa_id: int, registro: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Crea el registro completo en una sola transacción y devuelve las filas creadas:
+        {"solicitante", "ubicaciones", "actividad_economica", "informacion_financiera", "referencias", "solicitudes"}.
+        `registro` trae las filas ya armadas por construir_payload de cada modelo (las secciones sin
+        solicitante_id, que se asigna aquí); "referencias" es la fila contenedora o None.
+        """
+        if not registro.get("solicitante"):
+            raise ValueError("Datos del solicitante son requeridos")
+
+        creado = None
+        if RegistroCompletoModel._rpc_crear_disponible:
+            try:
+                creado = self._crear_rpc(empresa_id, registro)
+            except Exception as e:
+                if not is_rpc_not_found_error(e):
+                    # La transacción se deshizo en la BD: no queda nada que limpiar
+                    raise
+                RegistroCompletoModel._rpc_crear_disponible = False
+                print(f"⚠️ RPC {self.RPC_CREAR} no instalada, creando el registro por pasos")
+
+        if creado is None:
+            creado = self._crear_por_pasos(empresa_id, registro)
+
+        for solicitud in creado["solicitudes"]:
+            if isinstance(solicitud, dict):
+                _contadores.registrar_cambio(empresa_id, None, solicitud)
+        invalidar_estadisticas(empresa_id)
+        return creado
+
+    def _crear_rpc(self, empresa_id: int, registro: Dict[str, Any]) -> Dict[str, Any]:
+        resp = supabase.rpc(self.RPC_CREAR, {"p_empresa_id": empresa_id, "p_registro": registro}).execute()
+        data = _get_data(resp) or {}
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        return {
+            "solicitante": data.get("solicitante"),
+            "ubicaciones": data.get("ubicaciones") or [],
+            "actividad_economica": data.get("actividad_economica"),
+            "informacion_financiera": data.get("informacion_financiera"),
+            "referencias": data.get("referencias"),
+            "solicitudes": data.get("solicitudes") or [],
+        }
+
+    def _crear_por_pasos(self, empresa_id: int, registro: Dict[str, Any]) -> Dict[str, Any]:
+        """Mismas inserciones que la RPC, una por sección; si una falla se borra lo ya creado"""
+        resp = supabase.table(self.TABLE).insert({**registro["solicitante"], "empresa_id": empresa_id}).execute()
+        data = _get_data(resp)
+        solicitante = data[0] if isinstance(data, list) and data else data
+        solicitante_id = solicitante["id"]
+        claves = {"empresa_id": empresa_id, "solicitante_id": solicitante_id}
+
+        def _insertar(tabla: str, filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            if not filas:
+                return []
+            resp = supabase.table(tabla).insert([{**fila, **claves} for fila in filas]).execute()
+            return _get_data(resp) or []
+
+        def _una(valor: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [valor] if valor else []
+
+        try:
+            ubicaciones = _insertar("ubicacion", registro.get("ubicaciones") or [])
+            actividad = _insertar("actividad_economica", _una(registro.get("actividad_economica")))
+            financiera = _insertar("informacion_financiera", _una(registro.get("informacion_financiera")))
+            referencias = _insertar("referencias", _una(registro.get("referencias")))
+            solicitudes = _insertar("solicitudes", registro.get("solicitudes") or [])
+        except Exception:
+            self._deshacer(solicitante_id, empresa_id)
+            raise
+
+        return {
+            "solicitante": solicitante,
+            "ubicaciones": ubicaciones,
+            "actividad_economica": actividad[0] if actividad else None,
+            "informacion_financiera": financiera[0] if financiera else None,
+            "referencias": referencias[0] if referencias else None,
+            "solicitudes": solicitudes,
+        }
+
+    def _deshacer(self, solicitante_id: int, empresa_id: int) -> None:
+        """Compensación del camino por pasos: borra las secciones y el solicitante recién creados"""
+        for tabla in reversed(self.TABLAS_CREACION):
+            try:
+                supabase.table(tabla).delete().eq("solicitante_id", solicitante_id).eq("empresa_id", empresa_id).execute()
+            except Exception as e:
+                print(f"❌ Error deshaciendo {tabla} del solicitante {solicitante_id}: {e}")
+        try:
+            supabase.table(self.TABLE).delete().eq("id", solicitante_id).eq("empresa_id", empresa_id).execute()
+        except Exception as e:
+            print(f"❌ Error deshaciendo el solicitante {solicitante_id}: {e}")
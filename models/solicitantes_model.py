@@ -1,6 +1,9 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from data.supabase_conn import supabase
+from data.supabase_async import obtener_cliente_async
+from models.estadisticas_model import invalidar_estadisticas
+from models.directorio_usuarios import DirectorioUsuarios
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -13,7 +16,8 @@ class SolicitantesModel:
 
     TABLE = "solicitantes"
 
-    def create(self, *, empresa_id: int, nombres: str, primer_apellido: str, segundo_apellido: str, tipo_identificacion: str, numero_documento: str, fecha_nacimiento: str, genero: str, correo: str, info_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def construir_payload(self, *, empresa_id: int, nombres: str, primer_apellido: str, segundo_apellido: str, tipo_identificacion: str, numero_documento: str, fecha_nacimiento: str, genero: str, correo: str, info_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fila a insertar (también la usa RegistroCompletoModel.crear)"""
         payload = {
             "empresa_id": empresa_id,
             "nombres": nombres,
@@ -26,8 +30,13 @@ class SolicitantesModel:
             "correo": correo,
             "info_extra": info_extra or {},
         }
+        return payload
+
+    def create(self, *, empresa_id: int, nombres: str, primer_apellido: str, segundo_apellido: str, tipo_identificacion: str, numero_documento: str, fecha_nacimiento: str, genero: str, correo: str, info_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload = self.construir_payload(empresa_id=empresa_id, nombres=nombres, primer_apellido=primer_apellido, segundo_apellido=segundo_apellido, tipo_identificacion=tipo_identificacion, numero_documento=numero_documento, fecha_nacimiento=fecha_nacimiento, genero=genero, correo=correo, info_extra=info_extra)
         resp = supabase.table(self.TABLE).insert(payload).execute()
         data = _get_data(resp)
+        invalidar_estadisticas(empresa_id)
         return data[0] if isinstance(data, list) and data else data
 
     def get_by_id(self, *, id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
@@ -35,6 +44,13 @@ class SolicitantesModel:
         data = _get_data(resp)
         return data[0] if isinstance(data, list) and data else None
 
+    async def get_by_id_async(self, *, id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+        """Igual que get_by_id, sobre el cliente asíncrono (ver data.supabase_async)"""
+        cliente = await obtener_cliente_async()
+        resp = await cliente.table(self.TABLE).select("*").eq("id", id).eq("empresa_id", empresa_id).execute()
+        data = _get_data(resp)
+        return data[0] if isinstance(data, list) and data else None
+
     def list(self, *, empresa_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
         # Hacer JOIN con tablas relacionadas para obtener información completa
         query = """
@@ -46,35 +62,8 @@ class SolicitantesModel:
         resp = supabase.table(self.TABLE).select(query).eq("empresa_id", empresa_id).order("created_at", desc=True).range(offset, offset + max(limit - 1, 0)).execute()
         data = _get_data(resp) or []
 
-        # Obtener todos los IDs de usuarios únicos para hacer JOIN manual
-        user_ids = set()
-        for item in data:
-            solicitudes = item.get("solicitudes", [])
-            for solicitud in solicitudes:
-                if solicitud.get("created_by_user_id"):
-                    user_ids.add(solicitud["created_by_user_id"])
-                if solicitud.get("assigned_to_user_id"):
-                    user_ids.add(solicitud["assigned_to_user_id"])
-
-        # Consultar usuarios y supervisores
-        usuarios_map = {}
-        usuarios_data = []
-        supervisores_map = {}
-        if user_ids:
-            usuarios_resp = supabase.table("usuarios").select("id, nombre, reports_to_id").in_("id", list(user_ids)).execute()
-            usuarios_data = _get_data(usuarios_resp) or []
-            usuarios_map = {usuario["id"]: usuario["nombre"] for usuario in usuarios_data}
-
-            # Obtener supervisores
-            supervisor_ids = set()
-            for usuario in usuarios_data:
-                if usuario.get("reports_to_id"):
-                    supervisor_ids.add(usuario["reports_to_id"])
-
-            if supervisor_ids:
-                supervisores_resp = supabase.table("usuarios").select("id, nombre").in_("id", list(supervisor_ids)).execute()
-                supervisores_data = _get_data(supervisores_resp) or []
-                supervisores_map = {supervisor["id"]: supervisor["nombre"] for supervisor in supervisores_data}
+        # Nombres de usuarios y supervisores en un solo directorio por lote
+        directorio = self._directorio_solicitudes(data, empresa_id)
 
         # Procesar los datos para aplanar la estructura
         processed_data = []
@@ -113,34 +102,16 @@ class SolicitantesModel:
                 solicitante["banco_nombre"] = solicitud.get("banco_nombre")
                 solicitante["estado_solicitud"] = solicitud.get("estado")
 
-                # Obtener creado por y supervisor
+                # Obtener creado por, asignado y sus supervisores
                 created_by_user_id = solicitud.get("created_by_user_id")
-                solicitante["created_by_user_name"] = usuarios_map.get(created_by_user_id) if created_by_user_id else None
+                solicitante["created_by_user_name"] = directorio.nombre(created_by_user_id)
                 solicitante["created_by_user_id"] = created_by_user_id
+                solicitante["created_by_supervisor_name"] = directorio.supervisor_nombre(created_by_user_id)
 
-                # Obtener supervisor del usuario creador
-                created_by_supervisor_name = None
-                if created_by_user_id:
-                    for usuario in usuarios_data:
-                        if usuario["id"] == created_by_user_id and usuario.get("reports_to_id"):
-                            supervisor_id = usuario["reports_to_id"]
-                            created_by_supervisor_name = supervisores_map.get(supervisor_id)
-                            break
-                solicitante["created_by_supervisor_name"] = created_by_supervisor_name
-
-                # Obtener asignado y su supervisor
                 assigned_to_user_id = solicitud.get("assigned_to_user_id")
                 solicitante["assigned_to_user_id"] = assigned_to_user_id
-                solicitante["assigned_to_user_name"] = usuarios_map.get(assigned_to_user_id) if assigned_to_user_id else None
-
-                assigned_to_supervisor_name = None
-                if assigned_to_user_id:
-                    for usuario in usuarios_data:
-                        if usuario["id"] == assigned_to_user_id and usuario.get("reports_to_id"):
-                            supervisor_id = usuario["reports_to_id"]
-                            assigned_to_supervisor_name = supervisores_map.get(supervisor_id)
-                            break
-                solicitante["assigned_to_supervisor_name"] = assigned_to_supervisor_name
+                solicitante["assigned_to_user_name"] = directorio.nombre(assigned_to_user_id)
+                solicitante["assigned_to_supervisor_name"] = directorio.supervisor_nombre(assigned_to_user_id)
             else:
                 solicitante["tipo_credito"] = None
                 solicitante["banco_nombre"] = None
@@ -160,60 +131,99 @@ class SolicitantesModel:
 
         return processed_data
 
+    # Columnas embebidas que necesita la exportación completa
+    # IMPORTANTE: solicitudes!inner() = solo trae solicitantes que TENGAN solicitudes
+    QUERY_EXCEL = """
+        *,
+        ubicacion(*),
+        actividad_economica(*),
+        informacion_financiera(*),
+        referencias(*),
+        solicitudes!inner(*)
+    """
+
     def list_completo_para_excel(self, *, empresa_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
         """Obtener lista completa de solicitantes con TODA la información para exportar a Excel
         IMPORTANTE: Solo trae solicitantes que tengan al menos una solicitud (igual que la tabla del frontend)
         """
+        data = self._consultar_pagina_excel(empresa_id=empresa_id, limit=limit, offset=offset)
+        return self._procesar_pagina_excel(data, empresa_id)
+
+    def iterar_completo_para_excel(self, *, empresa_id: int, tamano_pagina: int = 500) -> Iterator[Dict[str, Any]]:
+        """Recorre todos los solicitantes de la empresa para la exportación, página a página.
+
+        Usa paginación por llave (created_at, id) descendente en lugar de offset, así cada
+        página cuesta lo mismo sin importar cuántas filas se hayan leído. Los usuarios y
+        documentos se consultan por lote para cada página.
+        """
+        cursor = None
+        total = 0
+        while True:
+            data = self._consultar_pagina_excel(empresa_id=empresa_id, limit=tamano_pagina, despues_de=cursor)
+            if not data:
+                break
+
+            for solicitante in self._procesar_pagina_excel(data, empresa_id):
+                yield solicitante
+            total += len(data)
+
+            if len(data) < tamano_pagina:
+                break
+            ultimo = data[-1]
+            cursor = (ultimo.get("created_at"), ultimo.get("id"))
+            if cursor[0] is None or cursor[1] is None:
+                print(f"⚠️ Registro sin created_at/id, se detiene la paginación tras {total} solicitantes")
+                break
+
+        print(f"   ✅ Exportación recorrida: {total} solicitantes con solicitudes")
+
+    def contar_para_excel(self, *, empresa_id: int) -> Optional[int]:
+        """Total de solicitantes con al menos una solicitud (las filas de la exportación)"""
+        try:
+            resp = (
+                supabase.table(self.TABLE)
+                .select("id, solicitudes!inner(id)", count="exact", head=True)
+                .eq("empresa_id", empresa_id)
+                .execute()
+            )
+            return resp.count
+        except Exception as e:
+            print(f"⚠️ No se pudo contar los solicitantes a exportar: {e}")
+            return None
+
+    def _consultar_pagina_excel(self, *, empresa_id: int, limit: int, offset: int = 0, despues_de: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+        """Una página de solicitantes ordenada por (created_at, id) descendente.
+        Con `despues_de` = (created_at, id) del último registro se continúa por llave; si no, por offset.
+        """
+        def _consulta(columnas: str):
+            query = (
+                supabase.table(self.TABLE)
+                .select(columnas)
+                .eq("empresa_id", empresa_id)
+                .order("created_at", desc=True)
+                .order("id", desc=True)
+            )
+            if despues_de is None:
+                return query.range(offset, offset + max(limit - 1, 0))
+            created_at, ultimo_id = despues_de
+            return query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{int(ultimo_id)})'
+            ).limit(limit)
+
         try:
-            # Hacer JOIN con TODAS las tablas relacionadas
-            # IMPORTANTE: solicitudes!inner() = solo trae solicitantes que TENGAN solicitudes
-            query = """
-                *,
-                ubicacion(*),
-                actividad_economica(*),
-                informacion_financiera(*),
-                referencias(*),
-                solicitudes!inner(*)
-            """
-
-            resp = supabase.table(self.TABLE).select(query).eq("empresa_id", empresa_id).order("created_at", desc=True).range(offset, offset + max(limit - 1, 0)).execute()
-            data = _get_data(resp) or []
-            print(f"   ✅ Query con !inner: {len(data)} solicitantes con solicitudes")
+            data = _get_data(_consulta(self.QUERY_EXCEL).execute()) or []
         except Exception as e:
             print(f"❌ Error en query principal: {e}")
             # Fallback a query simple si falla
-            resp = supabase.table(self.TABLE).select("*").eq("empresa_id", empresa_id).order("created_at", desc=True).range(offset, offset + max(limit - 1, 0)).execute()
-            data = _get_data(resp) or []
+            data = _get_data(_consulta("*").execute()) or []
+        return data
 
-        # Obtener usuarios y supervisores
-        user_ids = set()
-        for item in data:
-            solicitudes = item.get("solicitudes", [])
-            for solicitud in solicitudes:
-                if solicitud.get("created_by_user_id"):
-                    user_ids.add(solicitud["created_by_user_id"])
-                if solicitud.get("assigned_to_user_id"):
-                    user_ids.add(solicitud["assigned_to_user_id"])
-
-        usuarios_map = {}
-        usuarios_data = []
-        supervisores_map = {}
-        if user_ids:
-            usuarios_resp = supabase.table("usuarios").select("id, nombre, reports_to_id").in_("id", list(user_ids)).execute()
-            usuarios_data = _get_data(usuarios_resp) or []
-            usuarios_map = {usuario["id"]: usuario["nombre"] for usuario in usuarios_data}
-
-            supervisor_ids = set()
-            for usuario in usuarios_data:
-                if usuario.get("reports_to_id"):
-                    supervisor_ids.add(usuario["reports_to_id"])
-
-            if supervisor_ids:
-                supervisores_resp = supabase.table("usuarios").select("id, nombre").in_("id", list(supervisor_ids)).execute()
-                supervisores_data = _get_data(supervisores_resp) or []
-                supervisores_map = {supervisor["id"]: supervisor["nombre"] for supervisor in supervisores_data}
-
-        # Obtener documentos de todos los solicitantes
+    def _procesar_pagina_excel(self, data: List[Dict[str, Any]], empresa_id: int) -> List[Dict[str, Any]]:
+        """Aplana una página de solicitantes y agrega nombres de usuarios, supervisores y documentos"""
+        # Nombres de usuarios y supervisores en un solo directorio por página
+        directorio = self._directorio_solicitudes(data, empresa_id)
+
+        # Obtener documentos de todos los solicitantes de la página
         solicitante_ids = [item.get("id") for item in data if item.get("id")]
         documentos_map = {}
         if solicitante_ids:
@@ -276,29 +286,14 @@ class SolicitantesModel:
 
                 # Agregar nombres de usuarios
                 created_by_user_id = solicitud.get("created_by_user_id")
-                solicitante["created_by_user_name"] = usuarios_map.get(created_by_user_id) if created_by_user_id else None
+                solicitante["created_by_user_name"] = directorio.nombre(created_by_user_id)
                 solicitante["created_by_user_id"] = created_by_user_id
-
-                created_by_supervisor_name = None
-                if created_by_user_id:
-                    for usuario in usuarios_data:
-                        if usuario["id"] == created_by_user_id and usuario.get("reports_to_id"):
-                            supervisor_id = usuario["reports_to_id"]
-                            created_by_supervisor_name = supervisores_map.get(supervisor_id)
-                            break
-                solicitante["created_by_supervisor_name"] = created_by_supervisor_name
+                solicitante["created_by_supervisor_name"] = directorio.supervisor_nombre(created_by_user_id)
 
                 assigned_to_user_id = solicitud.get("assigned_to_user_id")
+                assigned_to_supervisor_name = directorio.supervisor_nombre(assigned_to_user_id)
                 solicitante["assigned_to_user_id"] = assigned_to_user_id
-                solicitante["assigned_to_user_name"] = usuarios_map.get(assigned_to_user_id) if assigned_to_user_id else None
-
-                assigned_to_supervisor_name = None
-                if assigned_to_user_id:
-                    for usuario in usuarios_data:
-                        if usuario["id"] == assigned_to_user_id and usuario.get("reports_to_id"):
-                            supervisor_id = usuario["reports_to_id"]
-                            assigned_to_supervisor_name = supervisores_map.get(supervisor_id)
-                            break
+                solicitante["assigned_to_user_name"] = directorio.nombre(assigned_to_user_id)
                 solicitante["assigned_to_supervisor_name"] = assigned_to_supervisor_name
 
                 if solicitante["solicitud"] is not None and isinstance(solicitante["solicitud"], dict):
@@ -317,12 +312,21 @@ class SolicitantesModel:
 
         return processed_data
 
+    def _directorio_solicitudes(self, data: List[Dict[str, Any]], empresa_id: int) -> DirectorioUsuarios:
+        """Directorio de la empresa que cubre a los creadores y asignados de las solicitudes embebidas"""
+        solicitudes = [solicitud for item in data for solicitud in (item.get("solicitudes") or [])]
+        return DirectorioUsuarios.de_empresa(
+            empresa_id, DirectorioUsuarios.ids_en(solicitudes, "created_by_user_id", "assigned_to_user_id")
+        )
+
     def update(self, *, id: int, empresa_id: int, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         resp = supabase.table(self.TABLE).update(updates).eq("id", id).eq("empresa_id", empresa_id).execute()
         data = _get_data(resp)
+        invalidar_estadisticas(empresa_id)
         return data[0] if isinstance(data, list) and data else None
 
     def delete(self, *, id: int, empresa_id: int) -> int:
         resp = supabase.table(self.TABLE).delete().eq("id", id).eq("empresa_id", empresa_id).execute()
         data = _get_data(resp)
+        invalidar_estadisticas(empresa_id)
         return len(data) if isinstance(data, list) else 0
@@ -3,6 +3,14 @@ from typing import Any, Dict, List, Optional
 from datetime import datetime
 import uuid
 from data.supabase_conn import supabase
+from data.supabase_async import obtener_cliente_async
+from models.estadisticas_model import invalidar_estadisticas
+from models.directorio_usuarios import DirectorioUsuarios
+from models.alcance_rol import AlcanceRol
+from models.estadisticas_contadores_model import EstadisticasContadoresModel, COLUMNAS_CONTADORES
+
+# Contadores incrementales de estadísticas (opt-in con ESTADISTICAS_CONTADORES)
+_contadores = EstadisticasContadoresModel()
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -33,7 +41,8 @@ class SolicitudesModel:
 
     TABLE = "solicitudes"
 
-    def create(self, *, empresa_id: int, solicitante_id: int, created_by_user_id: int, assigned_to_user_id: Optional[int] = None, banco_nombre: Optional[str] = None, ciudad_solicitud: Optional[str] = None, estado: Optional[str] = None, detalle_credito: Optional[Dict[str, Any]] = None, observacion_inicial: Optional[str] = None, usuario_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def construir_payload(self, *, empresa_id: int, solicitante_id: int, created_by_user_id: int, assigned_to_user_id: Optional[int] = None, banco_nombre: Optional[str] = None, ciudad_solicitud: Optional[str] = None, estado: Optional[str] = None, detalle_credito: Optional[Dict[str, Any]] = None, observacion_inicial: Optional[str] = None, usuario_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fila a insertar (también la usa RegistroCompletoModel.crear)"""
         # Crear observaciones inicial si se proporciona
         observaciones_data = {}
         if observacion_inicial and usuario_info:
@@ -54,9 +63,17 @@ class SolicitudesModel:
         if ciudad_solicitud is not None:
             payload["ciudad_solicitud"] = ciudad_solicitud
 
+        return payload
+
+    def create(self, *, empresa_id: int, solicitante_id: int, created_by_user_id: int, assigned_to_user_id: Optional[int] = None, banco_nombre: Optional[str] = None, ciudad_solicitud: Optional[str] = None, estado: Optional[str] = None, detalle_credito: Optional[Dict[str, Any]] = None, observacion_inicial: Optional[str] = None, usuario_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload = self.construir_payload(empresa_id=empresa_id, solicitante_id=solicitante_id, created_by_user_id=created_by_user_id, assigned_to_user_id=assigned_to_user_id, banco_nombre=banco_nombre, ciudad_solicitud=ciudad_solicitud, estado=estado, detalle_credito=detalle_credito, observacion_inicial=observacion_inicial, usuario_info=usuario_info)
         resp = supabase.table(self.TABLE).insert(payload).execute()
         data = _get_data(resp)
-        return data[0] if isinstance(data, list) and data else data
+        creada = data[0] if isinstance(data, list) and data else data
+        if isinstance(creada, dict):
+            _contadores.registrar_cambio(empresa_id, None, creada)
+        invalidar_estadisticas(empresa_id)
+        return creada
 
     def get_by_id(self, *, id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
         # Hacer JOIN con usuarios para obtener el nombre del creador
@@ -83,18 +100,27 @@ class SolicitudesModel:
         return processed_item
 
     def list(self, *, empresa_id: int, estado: Optional[str] = None, solicitante_id: Optional[int] = None, banco_nombre: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        resp = self._consulta_list(supabase, empresa_id=empresa_id, estado=estado, solicitante_id=solicitante_id, banco_nombre=banco_nombre, limit=limit, offset=offset).execute()
+        return self._procesar_list(_get_data(resp))
+
+    async def list_async(self, *, empresa_id: int, estado: Optional[str] = None, solicitante_id: Optional[int] = None, banco_nombre: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Igual que list, sobre el cliente asíncrono (ver data.supabase_async)"""
+        cliente = await obtener_cliente_async()
+        resp = await self._consulta_list(cliente, empresa_id=empresa_id, estado=estado, solicitante_id=solicitante_id, banco_nombre=banco_nombre, limit=limit, offset=offset).execute()
+        return self._procesar_list(_get_data(resp))
+
+    def _consulta_list(self, cliente, *, empresa_id: int, estado: Optional[str], solicitante_id: Optional[int], banco_nombre: Optional[str], limit: int, offset: int):
         # Hacer JOIN con usuarios para obtener el nombre del creador
-        q = supabase.table(self.TABLE).select("*, usuarios!created_by_user_id(nombre)").eq("empresa_id", empresa_id)
+        q = cliente.table(self.TABLE).select("*, usuarios!created_by_user_id(nombre)").eq("empresa_id", empresa_id)
         if estado:
             q = q.eq("estado", estado)
         if solicitante_id:
             q = q.eq("solicitante_id", solicitante_id)
         if banco_nombre:
             q = q.eq("banco_nombre", banco_nombre)
-        q = q.range(offset, offset + max(limit - 1, 0))
-        resp = q.execute()
-        data = _get_data(resp)
+        return q.range(offset, offset + max(limit - 1, 0))
 
+    def _procesar_list(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         # Procesar datos para agregar created_by_user_name
         processed_data = []
         for item in data:
@@ -122,10 +148,10 @@ class SolicitudesModel:
         base_updates: Optional[Dict[str, Any]] = None,
         detalle_credito_merge: Optional[Dict[str, Any]] = None,
     ) -> Optional[Dict[str, Any]]:
-        # Leer actual para merge del JSON
+        # Leer actual para merge del JSON (y para ajustar los contadores de estadísticas)
         current_resp = (
             supabase.table(self.TABLE)
-            .select("detalle_credito")
+            .select(COLUMNAS_CONTADORES)
             .eq("id", id)
             .eq("empresa_id", empresa_id)
             .execute()
@@ -147,7 +173,11 @@ class SolicitudesModel:
 
         resp = supabase.table(self.TABLE).update(update_payload).eq("id", id).eq("empresa_id", empresa_id).execute()
         data = _get_data(resp)
-        return data[0] if isinstance(data, list) and data else None
+        actualizada = data[0] if isinstance(data, list) and data else None
+        if actualizada and current:
+            _contadores.registrar_cambio(empresa_id, current, actualizada)
+        invalidar_estadisticas(empresa_id)
+        return actualizada
 
     def delete(self, *, id: int, empresa_id: int) -> int:
         # Primero verificar que el registro existe
@@ -163,6 +193,8 @@ class SolicitudesModel:
         deleted_count = len(data) if isinstance(data, list) else 0
         # Verificar que realmente se eliminó
         if deleted_count > 0:
+            _contadores.registrar_cambio(empresa_id, existing_record, None)
+            invalidar_estadisticas(empresa_id)
             # Verificar que ya no existe
             still_exists = self.get_by_id(id=id, empresa_id=empresa_id)
             if still_exists:
@@ -172,7 +204,7 @@ class SolicitudesModel:
 
         return deleted_count
 
-    def list_con_filtros_rol(self, *, empresa_id: int, usuario_info: dict = None, estado: Optional[str] = None, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    def list_con_filtros_rol(self, *, empresa_id: int, usuario_info: dict = None, estado: Optional[str] = None, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0, incluir_sin_ciudad: bool = False) -> List[Dict[str, Any]]:
         """Listar solicitudes aplicando filtros de permisos por rol"""
         # Consulta simple sin JOIN por ahora
         q = supabase.table(self.TABLE).select("*").eq("empresa_id", empresa_id)
@@ -184,72 +216,12 @@ class SolicitudesModel:
             q = q.eq("solicitante_id", solicitante_id)
 
         # Aplicar filtros de permisos por rol
-        if usuario_info:
-            rol = usuario_info.get("rol")
-
-            if rol == "admin":
-                # Admin ve todas las solicitudes de la empresa
-                print(f"   ✅ Admin - sin filtros aplicados")
-                pass
-            elif rol == "banco":
-                # Usuario banco solo ve solicitudes de su banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad_solicitud = usuario_info.get("ciudad_solicitud")
-
-                if banco_nombre:
-                    q = q.eq("banco_nombre", banco_nombre)
-                else:
-                    # Si no tiene banco asignado, no ve nada
-                    print(f"   ❌ Usuario sin banco asignado - retornando lista vacía")
-                    return []
-
-                # Aplicar filtro de ciudad_solicitud si está disponible
-                if ciudad_solicitud:
-                    q = q.eq("ciudad_solicitud", ciudad_solicitud)
-                    print(f"   ✅ Filtro ciudad aplicado: {ciudad_solicitud}")
-                else:
-                    print(f"   ⚠️ Usuario sin ciudad asignada - solo filtro por banco")
-
-            elif rol == "empresa":
-                # Usuario empresa ve todas las solicitudes de su empresa
-                print(f"   ✅ Empresa - sin filtros aplicados")
-                pass
-            elif rol == "supervisor":
-                # Usuario supervisor ve las solicitudes de su equipo + las suyas propias
-                user_id = usuario_info.get("id")
-                if user_id:
-                    # Obtener IDs de usuarios de su equipo
-                    from models.usuarios_model import UsuariosModel
-                    usuarios_model = UsuariosModel()
-                    team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                    # Incluir su propio ID + IDs de su equipo
-                    user_ids = [user_id]  # Su propio ID
-                    if team_members:
-                        team_ids = [member["id"] for member in team_members]
-                        user_ids.extend(team_ids)
-                        print(f"   ✅ Supervisor - viendo solicitudes de su equipo + las suyas: {user_ids}")
-                    else:
-                        print(f"   ✅ Supervisor sin equipo - viendo solo sus solicitudes: {user_ids}")
-
-                    # Filtrar por created_by_user_id o assigned_to_user_id
-                    q = q.or_(f"created_by_user_id.in.({','.join(map(str, user_ids))}),assigned_to_user_id.in.({','.join(map(str, user_ids))})")
-                else:
-                    print(f"   ❌ Supervisor sin ID de usuario")
-                    return []
-            elif rol == "asesor":
-                # Usuario asesor ve solo sus propias solicitudes
-                user_id = usuario_info.get("id")
-                if user_id:
-                    q = q.or_(f"created_by_user_id.eq.{user_id},assigned_to_user_id.eq.{user_id}")
-                    print(f"   ✅ Asesor - filtros aplicados para su ID: {user_id}")
-                else:
-                    print(f"   ❌ Asesor sin ID de usuario")
-                    return []
-            else:
-                # Rol desconocido, no ve nada
-                print(f"   ❌ Rol desconocido '{rol}' - retornando lista vacía")
-                return []
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        if alcance.sin_acceso:
+            # Banco sin banco asignado, rol desconocido o usuario sin ID: no ve nada
+            print(f"   ❌ Usuario sin alcance (rol '{alcance.rol}') - retornando lista vacía")
+            return []
+        q = alcance.filtrar_solicitudes(q, incluir_sin_ciudad=incluir_sin_ciudad)
 
         # Aplicar paginación
         q = q.range(offset, offset + max(limit - 1, 0))
@@ -261,63 +233,18 @@ class SolicitudesModel:
         # if data and len(data) > 0:
         #     print(f"🔍 DEBUG JOIN - Primer registro: {data[0]}")
 
-        # Obtener todos los IDs de usuarios únicos
-        user_ids = set()
-        for item in data:
-            if item.get("created_by_user_id"):
-                user_ids.add(item["created_by_user_id"])
-            if item.get("assigned_to_user_id"):
-                user_ids.add(item["assigned_to_user_id"])
-
-        # print(f"🔍 DEBUG JOIN - IDs de usuarios encontrados: {user_ids}")
-
-        # Consultar usuarios para obtener nombres y supervisores
-        usuarios_map = {}
-        supervisores_map = {}
-        if user_ids:
-            # Obtener información completa de usuarios (incluyendo reports_to_id)
-            usuarios_resp = supabase.table("usuarios").select("id, nombre, reports_to_id").in_("id", list(user_ids)).execute()
-            usuarios_data = _get_data(usuarios_resp) or []
-            usuarios_map = {usuario["id"]: usuario["nombre"] for usuario in usuarios_data}
-
-            # Obtener IDs de supervisores únicos
-            supervisor_ids = set()
-            for usuario in usuarios_data:
-                if usuario.get("reports_to_id"):
-                    supervisor_ids.add(usuario["reports_to_id"])
-
-            # Consultar nombres de supervisores
-            if supervisor_ids:
-                supervisores_resp = supabase.table("usuarios").select("id, nombre").in_("id", list(supervisor_ids)).execute()
-                supervisores_data = _get_data(supervisores_resp) or []
-                supervisores_map = {supervisor["id"]: supervisor["nombre"] for supervisor in supervisores_data}
-
-                # print(f"🔍 DEBUG JOIN - Mapa de usuarios: {usuarios_map}")
-                # print(f"🔍 DEBUG JOIN - Mapa de supervisores: {supervisores_map}")
+        # Nombres del creador y de su supervisor en un solo directorio por lote
+        directorio = DirectorioUsuarios.de_empresa(empresa_id, DirectorioUsuarios.ids_en(data or [], "created_by_user_id"))
 
         # Procesar datos para agregar created_by_user_name y created_by_supervisor_name
         processed_data = []
         for item in data:
-            # Obtener nombre del usuario creador
             created_by_user_id = item.get("created_by_user_id")
-            created_by_user_name = usuarios_map.get(created_by_user_id) if created_by_user_id else None
-
-            # Obtener nombre del supervisor del usuario creador
-            created_by_supervisor_name = None
-            if created_by_user_id:
-                # Buscar el reports_to_id del usuario creador
-                for usuario in usuarios_data:
-                    if usuario["id"] == created_by_user_id and usuario.get("reports_to_id"):
-                        supervisor_id = usuario["reports_to_id"]
-                        created_by_supervisor_name = supervisores_map.get(supervisor_id)
-                        break
-
-            # print(f"🔍 DEBUG JOIN - ID: {created_by_user_id}, Nombre: {created_by_user_name}, Supervisor: {created_by_supervisor_name}")
 
             # Crear nuevo objeto con los campos agregados
             processed_item = {**item}
-            processed_item["created_by_user_name"] = created_by_user_name
-            processed_item["created_by_supervisor_name"] = created_by_supervisor_name
+            processed_item["created_by_user_name"] = directorio.nombre(created_by_user_id)
+            processed_item["created_by_supervisor_name"] = directorio.supervisor_nombre(created_by_user_id)
 
             processed_data.append(processed_item)
 
@@ -325,62 +252,14 @@ class SolicitudesModel:
 
     def get_by_id_con_filtros_rol(self, *, id: int, empresa_id: int, usuario_info: dict = None) -> Optional[Dict[str, Any]]:
         """Obtener una solicitud específica aplicando filtros de permisos por rol"""
-        # Hacer JOIN con usuarios para obtener el nombre del creador
-        q = supabase.table(self.TABLE).select("*, usuarios!created_by_user_id(nombre)").eq("id", id).eq("empresa_id", empresa_id)
+        # El nombre del creador y de su supervisor salen del directorio de usuarios en caché
+        q = supabase.table(self.TABLE).select("*").eq("id", id).eq("empresa_id", empresa_id)
 
         # Aplicar filtros de permisos por rol
-        if usuario_info:
-            rol = usuario_info.get("rol")
-
-            if rol == "admin":
-                # Admin ve todas las solicitudes de la empresa
-                pass
-            elif rol == "banco":
-                # Usuario banco solo ve solicitudes de su banco y ciudad
-                banco_nombre = usuario_info.get("banco_nombre")
-                ciudad_solicitud = usuario_info.get("ciudad_solicitud")
-
-                if banco_nombre:
-                    q = q.eq("banco_nombre", banco_nombre)
-                else:
-                    # Si no tiene banco asignado, no ve nada
-                    return None
-
-                # Aplicar filtro de ciudad_solicitud si está disponible
-                if ciudad_solicitud:
-                    q = q.eq("ciudad_solicitud", ciudad_solicitud)
-            elif rol == "empresa":
-                # Usuario empresa ve todas las solicitudes de su empresa
-                pass
-            elif rol == "supervisor":
-                # Usuario supervisor ve las solicitudes de su equipo + las suyas propias
-                user_id = usuario_info.get("id")
-                if user_id:
-                    # Obtener IDs de usuarios de su equipo
-                    from models.usuarios_model import UsuariosModel
-                    usuarios_model = UsuariosModel()
-                    team_members = usuarios_model.get_team_members(user_id, empresa_id)
-
-                    # Incluir su propio ID + IDs de su equipo
-                    user_ids = [user_id]  # Su propio ID
-                    if team_members:
-                        team_ids = [member["id"] for member in team_members]
-                        user_ids.extend(team_ids)
-
-                    # Filtrar por created_by_user_id o assigned_to_user_id
-                    q = q.or_(f"created_by_user_id.in.({','.join(map(str, user_ids))}),assigned_to_user_id.in.({','.join(map(str, user_ids))})")
-                else:
-                    return None
-            elif rol == "asesor":
-                # Usuario asesor ve solo sus propias solicitudes
-                user_id = usuario_info.get("id")
-                if user_id:
-                    q = q.or_(f"created_by_user_id.eq.{user_id},assigned_to_user_id.eq.{user_id}")
-                else:
-                    return None
-            else:
-                # Rol desconocido, no ve nada
-                return None
+        alcance = AlcanceRol.resolver(usuario_info, empresa_id)
+        if alcance.sin_acceso:
+            return None
+        q = alcance.filtrar_solicitudes(q)
 
         resp = q.execute()
         data = _get_data(resp)
@@ -390,34 +269,13 @@ class SolicitudesModel:
 
         item = data[0]
 
-        # Extraer nombre del usuario creador
-        usuario_creador = item.get("usuarios", {})
-        created_by_user_name = usuario_creador.get("nombre") if usuario_creador else None
-
-        # Obtener nombre del supervisor del usuario creador
-        created_by_supervisor_name = None
         created_by_user_id = item.get("created_by_user_id")
-        if created_by_user_id:
-            # Consultar el reports_to_id del usuario creador
-            usuario_resp = supabase.table("usuarios").select("reports_to_id").eq("id", created_by_user_id).execute()
-            usuario_data = _get_data(usuario_resp)
-            if usuario_data and len(usuario_data) > 0:
-                reports_to_id = usuario_data[0].get("reports_to_id")
-                if reports_to_id:
-                    # Consultar el nombre del supervisor
-                    supervisor_resp = supabase.table("usuarios").select("nombre").eq("id", reports_to_id).execute()
-                    supervisor_data = _get_data(supervisor_resp)
-                    if supervisor_data and len(supervisor_data) > 0:
-                        created_by_supervisor_name = supervisor_data[0].get("nombre")
+        directorio = DirectorioUsuarios.de_empresa(empresa_id, [created_by_user_id])
 
         # Crear nuevo objeto con los campos agregados
         processed_item = {**item}
-        processed_item["created_by_user_name"] = created_by_user_name
-        processed_item["created_by_supervisor_name"] = created_by_supervisor_name
-
-        # Remover el objeto usuarios anidado para limpiar la respuesta
-        if "usuarios" in processed_item:
-            del processed_item["usuarios"]
+        processed_item["created_by_user_name"] = directorio.nombre(created_by_user_id)
+        processed_item["created_by_supervisor_name"] = directorio.supervisor_nombre(created_by_user_id)
 
         return processed_item
 
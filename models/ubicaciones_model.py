@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 from data.supabase_conn import supabase
+from data.supabase_async import obtener_cliente_async
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -13,7 +14,8 @@ class UbicacionesModel:
 
     TABLE = "ubicacion"
 
-    def create(self, *, empresa_id: int, solicitante_id: int, ciudad_residencia: str, departamento_residencia: str, detalle_direccion: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def construir_payload(self, *, empresa_id: int, solicitante_id: int, ciudad_residencia: str, departamento_residencia: str, detalle_direccion: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fila a insertar (también la usa RegistroCompletoModel.crear)"""
         payload = {
             "empresa_id": empresa_id,
             "solicitante_id": solicitante_id,
@@ -21,6 +23,10 @@ class UbicacionesModel:
             "departamento_residencia": departamento_residencia,
             "detalle_direccion": detalle_direccion or {},
         }
+        return payload
+
+    def create(self, *, empresa_id: int, solicitante_id: int, ciudad_residencia: str, departamento_residencia: str, detalle_direccion: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload = self.construir_payload(empresa_id=empresa_id, solicitante_id=solicitante_id, ciudad_residencia=ciudad_residencia, departamento_residencia=departamento_residencia, detalle_direccion=detalle_direccion)
         resp = supabase.table(self.TABLE).insert(payload).execute()
         data = _get_data(resp)
         return data[0] if isinstance(data, list) and data else data
@@ -31,11 +37,20 @@ class UbicacionesModel:
         return data[0] if isinstance(data, list) and data else None
 
     def list(self, *, empresa_id: int, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
-        q = supabase.table(self.TABLE).select("*").eq("empresa_id", empresa_id)
+        resp = self._consulta_list(supabase, empresa_id=empresa_id, solicitante_id=solicitante_id, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    async def list_async(self, *, empresa_id: int, solicitante_id: Optional[int] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Igual que list, sobre el cliente asíncrono (ver data.supabase_async)"""
+        cliente = await obtener_cliente_async()
+        resp = await self._consulta_list(cliente, empresa_id=empresa_id, solicitante_id=solicitante_id, limit=limit, offset=offset).execute()
+        return _get_data(resp) or []
+
+    def _consulta_list(self, cliente, *, empresa_id: int, solicitante_id: Optional[int], limit: int, offset: int):
+        q = cliente.table(self.TABLE).select("*").eq("empresa_id", empresa_id)
         if solicitante_id:
             q = q.eq("solicitante_id", solicitante_id)
-        resp = q.range(offset, offset + max(limit - 1, 0)).execute()
-        return _get_data(resp) or []
+        return q.range(offset, offset + max(limit - 1, 0))
 
     def update(
         self,
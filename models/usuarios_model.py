@@ -1,7 +1,12 @@
 from __future__ import annotations
 from typing import Dict, List, Optional
-import bcrypt
 from data.supabase_conn import supabase
+from models.estadisticas_model import invalidar_estadisticas
+from models.directorio_usuarios import invalidar_directorio
+from models.alcance_rol import invalidar_alcances
+from models.jerarquia_usuarios import JerarquiaUsuarios, actualizar_jerarquia, quitar_de_jerarquia
+from utils.usuario_autenticado import invalidar_usuario_autenticado
+from utils.contrasenas import ServicioSaturadoError, hashear_contrasena
 
 def _get_data(resp):
     if hasattr(resp, "data"):
@@ -145,6 +150,18 @@ class UsuariosModel:
             if not datos_actualizar:
                 return usuario_actual  # No hay cambios
 
+            cambia_reporte = (
+                "reports_to_id" in datos_actualizar
+                and datos_actualizar["reports_to_id"] != usuario_actual.get("reports_to_id")
+            )
+            if cambia_reporte:
+                reports_to_id = datos_actualizar["reports_to_id"]
+                datos_actualizar["reports_to_id"] = int(reports_to_id) if reports_to_id not in (None, "") else None
+                # Se valida contra la BD antes de escribir: la jerarquía en caché puede no tener
+                # los cambios de otro worker, y después del UPDATE ya sería tarde para rechazarlo
+                if JerarquiaUsuarios.desde_bd(empresa_id).crearia_ciclo(user_id, datos_actualizar["reports_to_id"]):
+                    raise ValueError("reports_to_id no puede ser el propio usuario ni alguien de su equipo")
+
             # Actualizar en la base de datos
             resp = supabase.table(self.usuarios_table).update(datos_actualizar).eq("id", user_id).execute()
 
@@ -152,6 +169,13 @@ class UsuariosModel:
             if not data or len(data) == 0:
                 return None
 
+            if cambia_reporte:
+                # Solo se mueve el subárbol del usuario en el cierre de la jerarquía
+                actualizar_jerarquia(empresa_id, user_id, datos_actualizar["reports_to_id"])
+            self._invalidar_caches(empresa_id)
+            # Rol, banco y ciudad con los que se resuelve al usuario en cada petición
+            invalidar_usuario_autenticado(user_id)
+
             usuario_actualizado = data[0]
             info_extra = usuario_actualizado.get("info_extra", {})
 
@@ -174,6 +198,8 @@ class UsuariosModel:
                 "created_at": usuario_actualizado["created_at"]
             }
 
+        except (ValueError, ServicioSaturadoError):
+            raise
         except Exception as e:
             print(f"Error al actualizar usuario: {e}")
             return None
@@ -193,7 +219,8 @@ class UsuariosModel:
                 "nombre": kwargs["nombre"],
                 "cedula": kwargs["cedula"],
                 "correo": kwargs["correo"],
-                "contraseña": kwargs["contraseña"],
+                # Igual que en update: se guarda el hash, no la contraseña
+                "contraseña": self._hash_password(kwargs["contraseña"]),
                 "rol": kwargs["rol"],
                 "empresa_id": empresa_id,
                 "reports_to_id": kwargs.get("reports_to_id"),
@@ -208,6 +235,10 @@ class UsuariosModel:
                 return None
 
             usuario_creado = data[0]
+            # El nuevo usuario entra como hoja bajo su supervisor
+            actualizar_jerarquia(empresa_id, usuario_creado["id"], usuario_creado.get("reports_to_id"))
+            self._invalidar_caches(empresa_id)
+
             info_extra = usuario_creado.get("info_extra", {})
 
             if isinstance(info_extra, str):
@@ -229,6 +260,8 @@ class UsuariosModel:
                 "created_at": usuario_creado["created_at"]
             }
 
+        except ServicioSaturadoError:
+            raise
         except Exception as e:
             print(f"Error al crear usuario: {e}")
             return None
@@ -246,7 +279,13 @@ class UsuariosModel:
 
             # Verificar que se eliminó correctamente
             data = _get_data(resp)
-            return data is not None and len(data) > 0
+            eliminado = data is not None and len(data) > 0
+            if eliminado:
+                # Su equipo deja de colgar de los supervisores del usuario eliminado
+                quitar_de_jerarquia(empresa_id, user_id)
+                self._invalidar_caches(empresa_id)
+                invalidar_usuario_autenticado(user_id)
+            return eliminado
 
         except Exception as e:
             print(f"Error al eliminar usuario: {e}")
@@ -255,17 +294,28 @@ class UsuariosModel:
     def get_team_members(self, supervisor_id: int, empresa_id: int) -> List[Dict]:
         """Obtiene todos los usuarios que reportan a un supervisor específico."""
         try:
+            supervisor_id = int(supervisor_id)
+            # Una sola consulta: los miembros del equipo y la fila del propio supervisor (para su nombre)
             resp = supabase.table(self.usuarios_table).select(
                 "id, nombre, cedula, correo, rol, info_extra, empresa_id, reports_to_id, created_at"
-            ).eq("empresa_id", empresa_id).eq("reports_to_id", supervisor_id).execute()
+            ).eq("empresa_id", empresa_id).or_(
+                f"reports_to_id.eq.{supervisor_id},id.eq.{supervisor_id}"
+            ).execute()
 
             data = _get_data(resp)
             if not data:
                 return []
 
+            supervisor_nombre = next(
+                (usuario.get("nombre") for usuario in data if usuario["id"] == supervisor_id), None
+            )
+
             # Procesar usuarios del equipo
             team_members = []
             for usuario in data:
+                if usuario.get("reports_to_id") != supervisor_id:
+                    continue
+
                 info_extra = usuario.get("info_extra", {})
                 if isinstance(info_extra, str):
                     import json
@@ -274,15 +324,6 @@ class UsuariosModel:
                     except json.JSONDecodeError:
                         info_extra = {}
 
-                # Obtener nombre del supervisor
-                supervisor_nombre = None
-                reports_to_id = usuario.get("reports_to_id")
-                if reports_to_id:
-                    supervisor_resp = supabase.table(self.usuarios_table).select("nombre").eq("id", reports_to_id).execute()
-                    supervisor_data = _get_data(supervisor_resp)
-                    if supervisor_data and len(supervisor_data) > 0:
-                        supervisor_nombre = supervisor_data[0].get("nombre")
-
                 team_members.append({
                     "id": usuario["id"],
                     "nombre": usuario["nombre"],
@@ -290,7 +331,7 @@ class UsuariosModel:
                     "correo": usuario["correo"],
                     "rol": usuario["rol"],
                     "empresa_id": usuario["empresa_id"],
-                    "reports_to_id": reports_to_id,
+                    "reports_to_id": usuario.get("reports_to_id"),
                     "reports_to_nombre": supervisor_nombre,  # Nombre del supervisor
                     "info_extra": info_extra,
                     "created_at": usuario["created_at"]
@@ -302,7 +343,31 @@ class UsuariosModel:
             print(f"Error al obtener miembros del equipo: {e}")
             return []
 
+    def get_team_member_ids(self, supervisor_id: int, empresa_id: int) -> List[int]:
+        """IDs de los usuarios que reportan a un supervisor (para filtros de alcance)."""
+        try:
+            resp = supabase.table(self.usuarios_table).select("id").eq(
+                "empresa_id", empresa_id
+            ).eq("reports_to_id", supervisor_id).execute()
+            return [usuario["id"] for usuario in _get_data(resp) or []]
+        except Exception as e:
+            print(f"Error al obtener IDs del equipo: {e}")
+            return []
+
+    def get_subordinate_ids(self, supervisor_id: int, empresa_id: int) -> List[int]:
+        """IDs de todos los usuarios bajo un supervisor, en cualquier nivel (cierre de reports_to_id)."""
+        return sorted(JerarquiaUsuarios.de_empresa(empresa_id).descendientes(int(supervisor_id)))
+
+    def _invalidar_caches(self, empresa_id: int) -> None:
+        """Descarta los datos en caché que dependen de los usuarios de la empresa."""
+        # Estadísticas de usuarios y alcance de supervisores (equipos)
+        invalidar_estadisticas(empresa_id)
+        # Nombres y supervisores usados para enriquecer listados
+        invalidar_directorio(empresa_id)
+        # Equipos resueltos por AlcanceRol (supervisor / asesor)
+        invalidar_alcances(empresa_id)
+
     def _hash_password(self, password: str) -> str:
         """Hashea una contraseña usando bcrypt."""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        return hashear_contrasena(password)
 
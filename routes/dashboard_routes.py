@@ -18,3 +18,24 @@ def get_dashboard_data():
         return {"ok": False, "error": "'empresa_id' debe ser un número entero"}, 400
     
     return DashboardController.get_dashboard_data(empresa_id)
+
+@dashboard_bp.route('/datos', methods=['GET'])
+def get_dashboard_datos():
+    """
+    Datos del dashboard paginados por cursor
+    Query params:
+    - limit: tamaño de página (default 50, máximo 500)
+    - cursor: valor de siguiente_cursor de la página anterior
+    - fields: secciones o columnas a incluir, p. ej. solicitante,solicitud.estado,ubicacion.ciudad_residencia
+    """
+    empresa_id = request.args.get('empresa_id') or request.headers.get('X-Empresa-Id')
+
+    if not empresa_id:
+        return {"ok": False, "error": "Se requiere el parámetro 'empresa_id'"}, 400
+
+    try:
+        empresa_id = int(empresa_id)
+    except ValueError:
+        return {"ok": False, "error": "'empresa_id' debe ser un número entero"}, 400
+
+    return DashboardController.get_dashboard_datos(empresa_id)
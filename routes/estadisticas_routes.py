@@ -74,5 +74,14 @@ def get_estadisticas_completas():
     """
     return estadisticas_controller.estadisticas_completas()
 
+@estadisticas_bp.route('/contadores/reconciliar', methods=['POST'])
+def reconciliar_contadores():
+    """
+    Recalcular los contadores incrementales de estadísticas de la empresa
+    desde la tabla solicitudes (corrige desviaciones).
+    Solo disponible para admin y empresa
+    """
+    return estadisticas_controller.reconciliar_contadores()
+
 # Alias para compatibilidad
 estadisticas = estadisticas_bp
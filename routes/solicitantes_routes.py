@@ -64,6 +64,27 @@ def descargar_ventas_excel():
     return con_solicitantes.descargar_ventas_excel()
 
 
+@solicitantes.route("/exportaciones", methods=["POST"])
+@cross_origin()
+def crear_exportacion_ventas():
+    """Encolar la exportación de ventas a Excel en segundo plano"""
+    return con_solicitantes.crear_exportacion_ventas()
+
+
+@solicitantes.route("/exportaciones/<job_id>", methods=["GET"])
+@cross_origin()
+def estado_exportacion(job_id: str):
+    """Consultar el estado y avance de una exportación"""
+    return con_solicitantes.estado_exportacion(job_id)
+
+
+@solicitantes.route("/exportaciones/<job_id>/descargar", methods=["GET"])
+@cross_origin()
+def descargar_exportacion(job_id: str):
+    """Descargar el archivo de una exportación terminada"""
+    return con_solicitantes.descargar_exportacion(job_id)
+
+
 @solicitantes.route("/<int:solicitante_id>/enviar-emails", methods=["POST"])
 @cross_origin()
 def enviar_emails_registro_completo(solicitante_id: int):
@@ -0,0 +1,109 @@
+-- Contadores de estadísticas mantenidos de forma incremental.
+-- SolicitudesModel (create / update / delete) envía los deltas de cada cambio a
+-- estadisticas_contadores_ajustar; EstadisticasModel lee los totales ya
+-- calculados en lugar de recontar la tabla solicitudes.
+-- Requiere sql/estadisticas_generales.sql (fn_extraer_monto_credito).
+--
+-- Dimensiones:
+--   total            clave ''            total de solicitudes
+--   estado           clave estado        solicitudes por estado
+--   banco            clave banco_nombre  solicitudes por banco
+--   ciudad           clave ciudad        solicitudes por ciudad
+--   dia              clave YYYY-MM-DD    solicitudes por día de creación (UTC)
+--   radicado_estado  clave estado        radicaciones y monto por estado
+--   radicado_banco   clave banco_nombre  radicaciones y monto por banco
+
+create table if not exists public.estadisticas_contadores (
+    empresa_id bigint not null,
+    dimension text not null,
+    clave text not null,
+    total bigint not null default 0,
+    monto numeric not null default 0,
+    updated_at timestamp with time zone not null default now(),
+    constraint estadisticas_contadores_pkey primary key (empresa_id, dimension, clave),
+    constraint estadisticas_contadores_empresa_id_fkey foreign key (empresa_id) references public.empresas(id)
+);
+
+
+-- Aplica un lote de deltas: [{"dimension": "...", "clave": "...", "total": 1, "monto": 0}, ...]
+create or replace function public.estadisticas_contadores_ajustar(p_empresa_id bigint, p_deltas jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    perform pg_advisory_xact_lock(hashtext('estadisticas_contadores'), p_empresa_id::integer);
+
+    insert into public.estadisticas_contadores as c (empresa_id, dimension, clave, total, monto, updated_at)
+    select p_empresa_id, d.dimension, d.clave, sum(d.total), sum(coalesce(d.monto, 0)), now()
+    from jsonb_to_recordset(p_deltas) as d(dimension text, clave text, total bigint, monto numeric)
+    group by d.dimension, d.clave
+    on conflict (empresa_id, dimension, clave) do update
+        set total = c.total + excluded.total,
+            monto = c.monto + excluded.monto,
+            updated_at = now();
+
+    delete from public.estadisticas_contadores
+    where empresa_id = p_empresa_id and total = 0;
+end;
+$$;
+
+
+-- Recalcula los contadores desde solicitudes para corregir desviaciones.
+-- Sin empresa recalcula todas las empresas.
+create or replace function public.estadisticas_contadores_reconciliar(p_empresa_id bigint default null)
+returns integer
+language plpgsql
+as $$
+declare
+    v_empresa bigint;
+    v_empresas integer := 0;
+begin
+    for v_empresa in
+        select e.id from public.empresas e where p_empresa_id is null or e.id = p_empresa_id
+    loop
+        perform pg_advisory_xact_lock(hashtext('estadisticas_contadores'), v_empresa::integer);
+
+        delete from public.estadisticas_contadores where empresa_id = v_empresa;
+
+        insert into public.estadisticas_contadores (empresa_id, dimension, clave, total, monto)
+        select v_empresa, t.dimension, t.clave, count(*), coalesce(sum(t.monto), 0)
+        from (
+            select 'total' as dimension, '' as clave, 0::numeric as monto
+            from public.solicitudes s where s.empresa_id = v_empresa
+            union all
+            select 'estado', coalesce(nullif(s.estado, ''), 'Sin Estado'), 0
+            from public.solicitudes s where s.empresa_id = v_empresa
+            union all
+            select 'banco', coalesce(nullif(s.banco_nombre, ''), 'Sin Banco'), 0
+            from public.solicitudes s where s.empresa_id = v_empresa
+            union all
+            select 'ciudad', coalesce(nullif(s.ciudad_solicitud, ''), 'Sin Ciudad'), 0
+            from public.solicitudes s where s.empresa_id = v_empresa
+            union all
+            select 'dia', to_char(s.created_at at time zone 'UTC', 'YYYY-MM-DD'), 0
+            from public.solicitudes s where s.empresa_id = v_empresa
+            union all
+            select 'radicado_estado', s.estado, public.fn_extraer_monto_credito(s.detalle_credito)
+            from public.solicitudes s
+            where s.empresa_id = v_empresa and s.estado in ('Radicado', 'Aprobado', 'Rechazado')
+            union all
+            select 'radicado_banco', coalesce(nullif(s.banco_nombre, ''), 'Sin Banco'), public.fn_extraer_monto_credito(s.detalle_credito)
+            from public.solicitudes s
+            where s.empresa_id = v_empresa and s.estado in ('Radicado', 'Aprobado', 'Rechazado')
+        ) t
+        group by t.dimension, t.clave;
+
+        v_empresas := v_empresas + 1;
+    end loop;
+
+    return v_empresas;
+end;
+$$;
+
+
+-- Reconciliación periódica (requiere la extensión pg_cron en Supabase):
+-- select cron.schedule('reconciliar-estadisticas-contadores', '*/30 * * * *',
+--                      $$select public.estadisticas_contadores_reconciliar()$$);
+--
+-- También se puede lanzar desde la API: POST /estadisticas/contadores/reconciliar
+-- (ejecutarlo una vez tras crear la tabla, antes de activar ESTADISTICAS_CONTADORES=true).
@@ -0,0 +1,182 @@
+-- Agregación de estadísticas generales en el servidor.
+-- Reemplaza las ~8 consultas que hacía EstadisticasModel.estadisticas_generales
+-- (conteos por estado, banco, ciudad y día, radicaciones y sumas de monto)
+-- por una sola llamada RPC: supabase.rpc("estadisticas_generales_agg", {...}).
+--
+-- El alcance por rol se resuelve en Python (EstadisticasModel._parametros_alcance_rpc)
+-- y llega como parámetros:
+--   p_user_ids           supervisor: propio id + equipo; asesor: propio id; null = sin filtro
+--   p_banco_nombre       usuario banco: banco asignado; null = sin filtro
+--   p_ciudad             usuario banco: ciudad asignada; null = sin filtro
+--   p_incluir_desglose   false oculta los desgloses por banco y ciudad
+--   p_conteo_relacionados  cómo contar solicitantes y documentos:
+--                        'empresa' | 'creador' | 'banco' | 'ninguno'
+
+
+-- Replica de _extraer_monto: busca el monto en las llaves comunes y luego en
+-- los sub-objetos por tipo de crédito. Devuelve 0 si no encuentra un número.
+create or replace function public.fn_extraer_monto_credito(p_detalle jsonb)
+returns numeric
+language plpgsql
+immutable
+as $$
+declare
+    v_llave text;
+    v_valor jsonb;
+    v_sub jsonb;
+    v_patron constant text := '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$';
+begin
+    if p_detalle is null or jsonb_typeof(p_detalle) <> 'object' then
+        return 0;
+    end if;
+
+    foreach v_llave in array array['monto_radicado', 'monto_solicitado', 'monto', 'valor_solicitado'] loop
+        v_valor := p_detalle -> v_llave;
+        if jsonb_typeof(v_valor) = 'number' then
+            return (v_valor #>> '{}')::numeric;
+        end if;
+        if jsonb_typeof(v_valor) = 'string' and (v_valor #>> '{}') ~ v_patron then
+            return (v_valor #>> '{}')::numeric;
+        end if;
+    end loop;
+
+    foreach v_llave in array array['credito_vehicular', 'credito_hipotecario', 'credito_consumo',
+                                   'credito_comercial', 'microcredito', 'credito_educativo'] loop
+        v_sub := p_detalle -> v_llave;
+        if jsonb_typeof(v_sub) = 'object' then
+            -- Igual que `monto_solicitado or monto`: valores vacíos pasan a `monto`
+            v_valor := v_sub -> 'monto_solicitado';
+            if v_valor is null
+               or v_valor in ('null'::jsonb, '0'::jsonb, '""'::jsonb, 'false'::jsonb) then
+                v_valor := v_sub -> 'monto';
+            end if;
+            if jsonb_typeof(v_valor) = 'number' then
+                return (v_valor #>> '{}')::numeric;
+            end if;
+            if jsonb_typeof(v_valor) = 'string' and (v_valor #>> '{}') ~ v_patron then
+                return (v_valor #>> '{}')::numeric;
+            end if;
+        end if;
+    end loop;
+
+    return 0;
+end;
+$$;
+
+
+create or replace function public.estadisticas_generales_agg(
+    p_empresa_id bigint,
+    p_user_ids bigint[] default null,
+    p_banco_nombre text default null,
+    p_ciudad text default null,
+    p_fecha_inicio date default (current_date - 30),
+    p_incluir_desglose boolean default true,
+    p_conteo_relacionados text default 'empresa'
+)
+returns jsonb
+language sql
+stable
+as $$
+with base as (
+    select s.solicitante_id, s.estado, s.banco_nombre, s.ciudad_solicitud, s.created_at, s.detalle_credito
+    from public.solicitudes s
+    where s.empresa_id = p_empresa_id
+      and (p_user_ids is null
+           or s.created_by_user_id = any(p_user_ids)
+           or s.assigned_to_user_id = any(p_user_ids))
+      and (p_banco_nombre is null or s.banco_nombre = p_banco_nombre)
+      and (p_ciudad is null or s.ciudad_solicitud = p_ciudad)
+),
+radicados as (
+    select coalesce(nullif(b.estado, ''), 'Sin Estado') as estado,
+           coalesce(nullif(b.banco_nombre, ''), 'Sin Banco') as banco,
+           public.fn_extraer_monto_credito(b.detalle_credito) as monto
+    from base b
+    where b.estado in ('Radicado', 'Aprobado', 'Rechazado')
+),
+-- Solicitantes visibles para los conteos de solicitantes y documentos
+-- (mismas reglas que _contar_solicitantes_por_rol / _contar_documentos_por_rol)
+solicitantes_visibles as (
+    select so.id
+    from public.solicitantes so
+    where so.empresa_id = p_empresa_id
+      and (
+          p_conteo_relacionados = 'empresa'
+          or (p_conteo_relacionados = 'creador' and exists (
+                select 1 from public.solicitudes s
+                where s.solicitante_id = so.id
+                  and s.created_by_user_id = any(p_user_ids)))
+          or (p_conteo_relacionados = 'banco' and exists (
+                select 1 from public.solicitudes s
+                where s.solicitante_id = so.id
+                  and ((p_banco_nombre is not null and s.banco_nombre = p_banco_nombre)
+                       or (p_ciudad is not null and s.ciudad_solicitud = p_ciudad))))
+      )
+),
+documentos_visibles as (
+    select d.id
+    from public.documentos d
+    join public.solicitantes so on so.id = d.solicitante_id
+    where so.empresa_id = p_empresa_id
+      and (
+          p_conteo_relacionados = 'empresa'
+          or (p_conteo_relacionados = 'creador' and exists (
+                select 1 from public.solicitudes s
+                where s.solicitante_id = so.id
+                  and s.created_by_user_id = any(p_user_ids)))
+          or (p_conteo_relacionados = 'banco' and exists (
+                select 1 from public.solicitudes s
+                where s.solicitante_id = so.id
+                  and (p_banco_nombre is null or s.banco_nombre = p_banco_nombre)
+                  and (p_ciudad is null or s.ciudad_solicitud = p_ciudad)))
+      )
+)
+select jsonb_build_object(
+    'total_solicitantes', (select count(*) from solicitantes_visibles),
+    'total_solicitudes', (select count(*) from base),
+    'solicitudes_por_estado', coalesce((
+        select jsonb_object_agg(t.clave, t.total)
+        from (select coalesce(nullif(estado, ''), 'Sin Estado') as clave, count(*) as total from base group by 1) t
+    ), '{}'::jsonb),
+    'solicitudes_por_banco', case when p_incluir_desglose then coalesce((
+        select jsonb_object_agg(t.clave, t.total)
+        from (select coalesce(nullif(banco_nombre, ''), 'Sin Banco') as clave, count(*) as total from base group by 1) t
+    ), '{}'::jsonb) else '{}'::jsonb end,
+    'solicitudes_por_ciudad', case when p_incluir_desglose then coalesce((
+        select jsonb_object_agg(t.clave, t.total)
+        from (select coalesce(nullif(ciudad_solicitud, ''), 'Sin Ciudad') as clave, count(*) as total from base group by 1) t
+    ), '{}'::jsonb) else '{}'::jsonb end,
+    'total_documentos', (select count(*) from documentos_visibles),
+    'solicitudes_por_dia', coalesce((
+        select jsonb_object_agg(t.clave, t.total)
+        from (
+            select to_char(created_at at time zone 'UTC', 'YYYY-MM-DD') as clave, count(*) as total
+            from base
+            where created_at >= p_fecha_inicio
+            group by 1
+        ) t
+    ), '{}'::jsonb),
+    'total_creditos', (select count(*) from radicados),
+    'radicaciones_por_estado', coalesce((
+        select jsonb_object_agg(t.estado, t.total)
+        from (select estado, count(*) as total from radicados group by 1) t
+    ), '{}'::jsonb),
+    'monto_por_estado', coalesce((
+        select jsonb_object_agg(t.estado, t.monto)
+        from (select estado, round(sum(monto), 2) as monto from radicados group by 1) t
+    ), '{}'::jsonb),
+    'radicaciones_por_banco', case when p_incluir_desglose then coalesce((
+        select jsonb_object_agg(t.banco, t.total)
+        from (select banco, count(*) as total from radicados group by 1) t
+    ), '{}'::jsonb) else '{}'::jsonb end,
+    'monto_por_banco', case when p_incluir_desglose then coalesce((
+        select jsonb_object_agg(t.banco, t.monto)
+        from (select banco, round(sum(monto), 2) as monto from radicados group by 1) t
+    ), '{}'::jsonb) else '{}'::jsonb end,
+    'total_monto', (select coalesce(round(sum(monto), 2), 0) from radicados)
+);
+$$;
+
+-- Índice que cubre el filtro principal de todas las agregaciones
+create index if not exists idx_solicitudes_empresa_estado
+    on public.solicitudes (empresa_id, estado);
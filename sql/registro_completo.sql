@@ -0,0 +1,116 @@
+-- Creación de un registro completo en una sola transacción.
+-- Reemplaza las inserciones encadenadas de SolicitantesController.crear_registro_completo
+-- (solicitante, ubicaciones, actividad económica, información financiera, referencias
+-- y solicitudes) por una sola llamada RPC: supabase.rpc("crear_registro_completo", {...}).
+-- Si cualquier inserción falla no queda nada creado.
+--
+-- p_registro llega ya validado por RegistroCompletoModel.crear:
+--   {
+--     "solicitante": {...},
+--     "ubicaciones": [{...}, ...],
+--     "actividad_economica": {...} | null,
+--     "informacion_financiera": {...} | null,
+--     "referencias": {...} | null,        -- fila contenedora (detalle_referencia.referencias)
+--     "solicitudes": [{...}, ...]
+--   }
+-- empresa_id y solicitante_id de las secciones los pone la función (se ignoran los que vengan).
+-- Devuelve las filas creadas con la misma forma.
+--
+-- Cada tabla tiene su insert con columnas explícitas: la función solo puede escribir en estas
+-- seis tablas. Solo la ejecuta el backend (service_role); no queda expuesta a anon/authenticated.
+
+
+-- Versión anterior: insert genérico por nombre de tabla. Se elimina si estaba instalado.
+drop function if exists public.fn_insertar_jsonb(text, jsonb);
+
+
+create or replace function public.crear_registro_completo(p_empresa_id bigint, p_registro jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_solicitante_id bigint;
+    v_solicitante jsonb;
+    v_ubicaciones jsonb;
+    v_actividad jsonb;
+    v_financiera jsonb;
+    v_referencias jsonb;
+    v_solicitudes jsonb;
+begin
+    if coalesce(jsonb_typeof(p_registro -> 'solicitante'), '') <> 'object' or p_registro -> 'solicitante' = '{}'::jsonb then
+        raise exception 'Datos del solicitante son requeridos';
+    end if;
+
+    insert into public.solicitantes as t (
+        empresa_id, nombres, primer_apellido, segundo_apellido, tipo_identificacion,
+        numero_documento, fecha_nacimiento, genero, correo, info_extra
+    )
+    select p_empresa_id, r.nombres, r.primer_apellido, r.segundo_apellido, r.tipo_identificacion,
+           r.numero_documento, r.fecha_nacimiento, r.genero, r.correo, coalesce(r.info_extra, '{}'::jsonb)
+      from jsonb_populate_record(null::public.solicitantes, p_registro -> 'solicitante') r
+    returning t.id, to_jsonb(t) into v_solicitante_id, v_solicitante;
+
+    with creadas as (
+        insert into public.ubicacion as t (
+            empresa_id, solicitante_id, ciudad_residencia, departamento_residencia, detalle_direccion
+        )
+        select p_empresa_id, v_solicitante_id, r.ciudad_residencia, r.departamento_residencia,
+               coalesce(r.detalle_direccion, '{}'::jsonb)
+          from jsonb_array_elements(coalesce(p_registro -> 'ubicaciones', '[]'::jsonb)) e
+         cross join lateral jsonb_populate_record(null::public.ubicacion, e.value) r
+        returning to_jsonb(t) as fila
+    )
+    select coalesce(jsonb_agg(fila), '[]'::jsonb) into v_ubicaciones from creadas;
+
+    if jsonb_typeof(p_registro -> 'actividad_economica') = 'object' then
+        insert into public.actividad_economica as t (empresa_id, solicitante_id, detalle_actividad)
+        select p_empresa_id, v_solicitante_id, coalesce(r.detalle_actividad, '{}'::jsonb)
+          from jsonb_populate_record(null::public.actividad_economica, p_registro -> 'actividad_economica') r
+        returning to_jsonb(t) into v_actividad;
+    end if;
+
+    if jsonb_typeof(p_registro -> 'informacion_financiera') = 'object' then
+        insert into public.informacion_financiera as t (
+            empresa_id, solicitante_id, total_ingresos_mensuales, total_egresos_mensuales,
+            total_activos, total_pasivos, detalle_financiera
+        )
+        select p_empresa_id, v_solicitante_id, r.total_ingresos_mensuales, r.total_egresos_mensuales,
+               r.total_activos, r.total_pasivos, coalesce(r.detalle_financiera, '{}'::jsonb)
+          from jsonb_populate_record(null::public.informacion_financiera, p_registro -> 'informacion_financiera') r
+        returning to_jsonb(t) into v_financiera;
+    end if;
+
+    if jsonb_typeof(p_registro -> 'referencias') = 'object' then
+        insert into public.referencias as t (empresa_id, solicitante_id, detalle_referencia)
+        select p_empresa_id, v_solicitante_id, coalesce(r.detalle_referencia, '{}'::jsonb)
+          from jsonb_populate_record(null::public.referencias, p_registro -> 'referencias') r
+        returning to_jsonb(t) into v_referencias;
+    end if;
+
+    with creadas as (
+        insert into public.solicitudes as t (
+            empresa_id, solicitante_id, created_by_user_id, assigned_to_user_id, estado,
+            detalle_credito, banco_nombre, ciudad_solicitud, observaciones
+        )
+        select p_empresa_id, v_solicitante_id, r.created_by_user_id, r.assigned_to_user_id,
+               coalesce(r.estado, 'Pendiente'), coalesce(r.detalle_credito, '{}'::jsonb),
+               r.banco_nombre, r.ciudad_solicitud, coalesce(r.observaciones, '{}'::jsonb)
+          from jsonb_array_elements(coalesce(p_registro -> 'solicitudes', '[]'::jsonb)) e
+         cross join lateral jsonb_populate_record(null::public.solicitudes, e.value) r
+        returning to_jsonb(t) as fila
+    )
+    select coalesce(jsonb_agg(fila), '[]'::jsonb) into v_solicitudes from creadas;
+
+    return jsonb_build_object(
+        'solicitante', v_solicitante,
+        'ubicaciones', v_ubicaciones,
+        'actividad_economica', v_actividad,
+        'informacion_financiera', v_financiera,
+        'referencias', v_referencias,
+        'solicitudes', v_solicitudes
+    );
+end;
+$$;
+
+revoke execute on function public.crear_registro_completo(bigint, jsonb) from public, anon, authenticated;
+grant execute on function public.crear_registro_completo(bigint, jsonb) to service_role;
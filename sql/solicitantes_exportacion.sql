@@ -0,0 +1,4 @@
+-- Índice para recorrer los solicitantes de una empresa con paginación por llave
+-- (SolicitantesModel.iterar_completo_para_excel): orden created_at desc, id desc.
+create index if not exists idx_solicitantes_empresa_created_id
+    on public.solicitantes (empresa_id, created_at desc, id desc);
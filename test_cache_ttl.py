@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché TTL + LRU (utils.cache_ttl) y de la caché de estadísticas
+(EstadisticasModel._con_cache / invalidar_estadisticas), sin BD.
+"""
+
+import pytest
+
+from utils import cache_ttl
+from utils.cache_ttl import CacheTTL
+
+
+class Reloj:
+    """Sustituye time.monotonic para controlar la expiración"""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_ttl.time, "monotonic", reloj)
+    return reloj
+
+
+def test_expira_tras_el_ttl(reloj):
+    cache = CacheTTL(ttl_segundos=10, max_entradas=10)
+    cache.set("a", 1)
+    reloj.ahora += 9.9
+    assert cache.get("a") == 1
+    reloj.ahora += 0.2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_por_entrada(reloj):
+    cache = CacheTTL(ttl_segundos=10, max_entradas=10)
+    cache.set("corta", 1, ttl=1)
+    cache.set("normal", 2)
+    reloj.ahora += 2
+    assert cache.get("corta") is None
+    assert cache.get("normal") == 2
+
+
+def test_desaloja_el_menos_usado():
+    cache = CacheTTL(ttl_segundos=60, max_entradas=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Leer "a" lo marca como usado: el siguiente set desaloja "b"
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_invalidar_con_predicado_y_todo():
+    cache = CacheTTL(ttl_segundos=60, max_entradas=10)
+    cache.set((1, "x"), "a")
+    cache.set((1, "y"), "b")
+    cache.set((2, "x"), "c")
+    assert cache.invalidar(lambda clave: clave[0] == 1) == 2
+    assert cache.get((1, "x")) is None
+    assert cache.get((2, "x")) == "c"
+    assert cache.invalidar() == 1
+    assert len(cache) == 0
+
+
+def test_deshabilitada_no_guarda():
+    cache = CacheTTL(ttl_segundos=0, max_entradas=10)
+    assert not cache.habilitada
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_set_descarta_valor_calculado_antes_de_invalidar():
+    cache = CacheTTL(ttl_segundos=60, max_entradas=10)
+    generacion = cache.generacion
+    cache.invalidar(lambda clave: False)
+    cache.set("a", "obsoleto", generacion=generacion)
+    assert cache.get("a") is None
+
+    cache.set("a", "vigente", generacion=cache.generacion)
+    assert cache.get("a") == "vigente"
+
+
+# ----------------------------------------------------------------------
+# Caché de estadísticas
+# ----------------------------------------------------------------------
+@pytest.fixture
+def estadisticas():
+    from models import estadisticas_model
+
+    estadisticas_model.invalidar_estadisticas()
+    yield estadisticas_model
+    estadisticas_model.invalidar_estadisticas()
+
+
+def test_estadisticas_usa_cache_por_alcance(estadisticas, monkeypatch):
+    from models import alcance_rol
+    from models.alcance_rol import AlcanceRol
+
+    # El equipo del asesor saldría de la jerarquía en BD: aquí solo él mismo
+    def resolver_equipo(cls, rol, user_id, empresa_id):
+        return cls(empresa_id=empresa_id, rol=rol, user_id=user_id, user_ids=(user_id,))
+
+    monkeypatch.setattr(AlcanceRol, "_resolver_equipo", classmethod(resolver_equipo))
+    alcance_rol.invalidar_alcances(1)
+    modelo = estadisticas.EstadisticasModel()
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        return {"total": len(llamadas)}
+
+    asesor = {"rol": "asesor", "id": 7}
+    assert modelo._con_cache("generales", 1, asesor, {}, calcular) == {"total": 1}
+    assert modelo._con_cache("generales", 1, asesor, {}, calcular) == {"total": 1}
+    # Otro usuario del mismo rol no comparte la entrada
+    assert modelo._con_cache("generales", 1, {"rol": "asesor", "id": 8}, {}, calcular) == {"total": 2}
+    # Usuarios banco: la clave es su banco y ciudad
+    banco = {"rol": "banco", "id": 9, "banco_nombre": "B", "ciudad": "C"}
+    assert modelo._con_cache("generales", 1, banco, {}, calcular) == {"total": 3}
+    assert modelo._con_cache("generales", 1, {**banco, "id": 10}, {}, calcular) == {"total": 3}
+    assert modelo._con_cache("generales", 1, {**banco, "ciudad": "D"}, {}, calcular) == {"total": 4}
+    assert len(llamadas) == 4
+    alcance_rol.invalidar_alcances(1)
+
+
+def test_estadisticas_devuelve_copias(estadisticas):
+    modelo = estadisticas.EstadisticasModel()
+    resultado = modelo._con_cache("generales", 1, None, {}, lambda: {"por_estado": {"Pendiente": 1}})
+    resultado["por_estado"]["Pendiente"] = 99
+    assert modelo._con_cache("generales", 1, None, {}, lambda: {}) == {"por_estado": {"Pendiente": 1}}
+
+
+def test_invalidar_estadisticas_por_empresa(estadisticas):
+    modelo = estadisticas.EstadisticasModel()
+    modelo._con_cache("generales", 1, None, {}, lambda: {"v": 1})
+    modelo._con_cache("generales", 2, None, {}, lambda: {"v": 1})
+
+    estadisticas.invalidar_estadisticas(1)
+    assert modelo._con_cache("generales", 1, None, {}, lambda: {"v": 2}) == {"v": 2}
+    assert modelo._con_cache("generales", 2, None, {}, lambda: {"v": 2}) == {"v": 1}
+
+
+def test_estadisticas_no_cachea_si_se_invalida_durante_el_calculo(estadisticas):
+    modelo = estadisticas.EstadisticasModel()
+
+    def calcular_con_escritura_concurrente():
+        # Una escritura de solicitudes invalida mientras se calculan las estadísticas
+        estadisticas.invalidar_estadisticas(1)
+        return {"v": "obsoleto"}
+
+    assert modelo._con_cache("generales", 1, None, {}, calcular_con_escritura_concurrente) == {"v": "obsoleto"}
+    assert modelo._con_cache("generales", 1, None, {}, lambda: {"v": "nuevo"}) == {"v": "nuevo"}
+
+
+def test_estadisticas_no_cachea_resultado_de_error(estadisticas):
+    modelo = estadisticas.EstadisticasModel()
+    modelo._con_cache("generales", 1, None, {}, lambda: estadisticas._ResultadoSinCache({"total": 0}))
+    assert modelo._con_cache("generales", 1, None, {}, lambda: {"total": 5}) == {"total": 5}
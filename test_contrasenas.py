@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Pruebas de utils.contrasenas: ventana deslizante de intentos de login, limpieza al
+iniciar sesión, Retry-After del endpoint de login y control de admisión del pool de bcrypt.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "aaa.bbb.ccc")
+os.environ.setdefault("JWT_SECRET_KEY", "clave-de-prueba")
+
+from utils import contrasenas
+from utils.contrasenas import LimitadorIntentos, ServicioSaturadoError
+
+
+class Reloj:
+    """Sustituye time.monotonic para mover la ventana sin esperar"""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(contrasenas.time, "monotonic", reloj)
+    return reloj
+
+
+# ----------------------------------------------------------------------
+# LimitadorIntentos
+# ----------------------------------------------------------------------
+def test_bloquea_al_llegar_al_maximo(reloj):
+    limitador = LimitadorIntentos(max_intentos=3, ventana_segundos=60)
+    for _ in range(2):
+        limitador.registrar("ana@x.com")
+        assert limitador.espera("ana@x.com") == 0
+    limitador.registrar("ana@x.com")
+    assert limitador.espera("ana@x.com") == pytest.approx(60)
+    # Otras claves no se ven afectadas
+    assert limitador.espera("otra@x.com") == 0
+
+
+def test_ventana_deslizante(reloj):
+    limitador = LimitadorIntentos(max_intentos=3, ventana_segundos=60)
+    limitador.registrar("k")
+    reloj.ahora += 20
+    limitador.registrar("k")
+    reloj.ahora += 20
+    limitador.registrar("k")
+
+    # La espera se cuenta desde el intento más antiguo de la ventana
+    assert limitador.espera("k") == pytest.approx(20)
+    reloj.ahora += 20
+    # El primer intento salió de la ventana: queda un cupo
+    assert limitador.espera("k") == 0
+    limitador.registrar("k")
+    assert limitador.espera("k") == pytest.approx(20)
+
+
+def test_intentos_viejos_se_descartan(reloj):
+    limitador = LimitadorIntentos(max_intentos=2, ventana_segundos=10)
+    limitador.registrar("k")
+    limitador.registrar("k")
+    reloj.ahora += 10
+    assert limitador.espera("k") == 0
+    assert "k" not in limitador._intentos
+
+
+def test_limpiar_reinicia_la_clave(reloj):
+    limitador = LimitadorIntentos(max_intentos=2, ventana_segundos=60)
+    limitador.registrar("k")
+    limitador.registrar("k")
+    assert limitador.espera("k") > 0
+    limitador.limpiar("k")
+    assert limitador.espera("k") == 0
+
+
+@pytest.fixture
+def limitadores(monkeypatch):
+    cuenta = LimitadorIntentos(max_intentos=2, ventana_segundos=60)
+    ip = LimitadorIntentos(max_intentos=3, ventana_segundos=60)
+    monkeypatch.setattr(contrasenas, "_intentos_cuenta", cuenta)
+    monkeypatch.setattr(contrasenas, "_intentos_ip", ip)
+    return cuenta, ip
+
+
+def test_login_exitoso_limpia_la_cuenta_pero_no_la_ip(limitadores):
+    cuenta, ip = limitadores
+    contrasenas.registrar_login_fallido("Ana@X.com ", "10.0.0.1")
+    contrasenas.registrar_login_fallido("ana@x.com", "10.0.0.1")
+    with pytest.raises(contrasenas.IntentosExcedidosError):
+        contrasenas.verificar_intentos_login("ana@x.com", None)
+
+    contrasenas.registrar_login_exitoso("ANA@x.com")
+    contrasenas.verificar_intentos_login("ana@x.com", None)
+    assert len(ip._intentos["10.0.0.1"]) == 2
+
+
+def test_limite_por_ip_entre_cuentas(limitadores):
+    for correo in ("a@x.com", "b@x.com", "c@x.com"):
+        contrasenas.registrar_login_fallido(correo, "10.0.0.1")
+    with pytest.raises(contrasenas.IntentosExcedidosError) as error:
+        contrasenas.verificar_intentos_login("d@x.com", "10.0.0.1")
+    assert error.value.reintentar_en > 0
+    contrasenas.verificar_intentos_login("d@x.com", "10.0.0.2")
+
+
+# ----------------------------------------------------------------------
+# Endpoint de login: 429 / 503 con Retry-After
+# ----------------------------------------------------------------------
+@pytest.fixture
+def cliente(monkeypatch, limitadores):
+    import app
+    from routes import auth_routes
+
+    resultado = {"usuario": None, "empresa": None, "temporal": None}
+    monkeypatch.setattr(auth_routes.con_auth.model, "autenticar", lambda correo, contraseña: resultado)
+    return app.app.test_client()
+
+
+def _login(cliente, correo="ana@x.com", **headers):
+    return cliente.post("/auth/login", json={"correo": correo, "contraseña": "mala"}, headers=headers)
+
+
+def test_login_responde_429_con_retry_after(cliente):
+    assert _login(cliente).status_code == 401
+    assert _login(cliente).status_code == 401
+
+    respuesta = _login(cliente)
+    assert respuesta.status_code == 429
+    assert respuesta.get_json()["error_code"] == "TOO_MANY_ATTEMPTS"
+    assert 1 <= int(respuesta.headers["Retry-After"]) <= 61
+
+
+def test_x_forwarded_for_no_evita_el_limite_por_ip(cliente):
+    # Sin PROXY_SALTOS la IP es remote_addr: rotar la cabecera no da cupos nuevos
+    for numero in range(3):
+        _login(cliente, correo=f"u{numero}@x.com", **{"X-Forwarded-For": f"1.2.3.{numero}"})
+    respuesta = _login(cliente, correo="otra@x.com", **{"X-Forwarded-For": "9.9.9.9"})
+    assert respuesta.status_code == 429
+
+
+def test_login_responde_503_si_bcrypt_esta_saturado(cliente, monkeypatch):
+    from routes import auth_routes
+
+    def saturado(correo, contraseña):
+        raise ServicioSaturadoError(reintentar_en=3)
+
+    monkeypatch.setattr(auth_routes.con_auth.model, "autenticar", saturado)
+    respuesta = _login(cliente)
+    assert respuesta.status_code == 503
+    assert respuesta.get_json()["error_code"] == "LOGIN_BUSY"
+    assert respuesta.headers["Retry-After"] == "3"
+
+
+# ----------------------------------------------------------------------
+# Control de admisión del pool de bcrypt
+# ----------------------------------------------------------------------
+@pytest.fixture
+def admision(monkeypatch):
+    semaforo = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(contrasenas, "_admision", semaforo)
+    monkeypatch.setattr(contrasenas, "BCRYPT_ESPERA_ADMISION", 0.05)
+    return semaforo
+
+
+def test_hash_y_verificacion(admision):
+    password_hash = contrasenas.hashear_contrasena("secreta", rounds=4)
+    assert contrasenas.verificar_contrasena("secreta", password_hash)
+    assert not contrasenas.verificar_contrasena("otra", password_hash)
+    # Cada operación libera su cupo al terminar
+    assert admision.acquire(blocking=False)
+    admision.release()
+
+
+def test_sin_cupo_rechaza_en_lugar_de_encolar(admision):
+    assert admision.acquire(blocking=False)
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(ServicioSaturadoError):
+            contrasenas.hashear_contrasena("secreta", rounds=4)
+        assert time.monotonic() - inicio < 1
+    finally:
+        admision.release()
+
+
+def test_timeout_libera_el_cupo_al_terminar(admision, monkeypatch):
+    monkeypatch.setattr(contrasenas, "BCRYPT_TIMEOUT", 0.05)
+    terminada = threading.Event()
+
+    def lenta():
+        time.sleep(0.2)
+        terminada.set()
+
+    with pytest.raises(ServicioSaturadoError):
+        contrasenas._ejecutar(lenta)
+    assert terminada.wait(2)
+    time.sleep(0.05)
+    assert admision.acquire(blocking=False)
+    admision.release()
+
+
+def test_rehash_en_segundo_plano_no_espera_cupo(admision):
+    guardados = []
+    assert admision.acquire(blocking=False)
+    try:
+        contrasenas.rehashear_en_segundo_plano("secreta", guardados.append)
+    finally:
+        admision.release()
+    time.sleep(0.1)
+    assert guardados == []
+
+
+def test_contrasena_antigua_sin_hash():
+    assert contrasenas.verificar_contrasena("plana", "plana")
+    assert not contrasenas.verificar_contrasena("plana", "")
+    assert contrasenas.necesita_rehash("plana")
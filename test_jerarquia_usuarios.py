@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Pruebas del cierre de la jerarquía de usuarios (JerarquiaUsuarios), sin BD:
+mover subárboles, rechazo de ciclos y eliminación de usuarios.
+"""
+
+import pytest
+
+from models import jerarquia_usuarios
+from models.jerarquia_usuarios import JerarquiaUsuarios, actualizar_jerarquia
+
+# 1 ── 2 ── 4
+# │    └─── 5 ── 6
+# └─── 3
+# 7 (sin supervisor)
+REPORTES = {1: None, 2: 1, 3: 1, 4: 2, 5: 2, 6: 5, 7: None}
+
+
+def assert_igual_a_reconstruida(jerarquia, reportes):
+    """El cierre mantenido incrementalmente debe coincidir con uno calculado desde cero"""
+    esperada = JerarquiaUsuarios(reportes)
+    for user_id in set(reportes) | set(jerarquia._padres):
+        assert jerarquia.descendientes(user_id) == esperada.descendientes(user_id), user_id
+        assert jerarquia.ancestros(user_id) == esperada.ancestros(user_id), user_id
+        assert jerarquia.padre(user_id) == esperada.padre(user_id), user_id
+
+
+def test_cierre_inicial():
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    assert jerarquia.descendientes(1) == {2, 3, 4, 5, 6}
+    assert jerarquia.descendientes(2) == {4, 5, 6}
+    assert jerarquia.descendientes(6) == frozenset()
+    assert jerarquia.ancestros(6) == (5, 2, 1)
+    assert jerarquia.ancestros(7) == ()
+
+
+def test_mover_subarbol():
+    """Mover a 5 (con 6 debajo) bajo 3 actualiza descendientes y ancestros de todo el subárbol"""
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    jerarquia.mover(5, 3)
+
+    assert jerarquia.descendientes(2) == {4}
+    assert jerarquia.descendientes(3) == {5, 6}
+    assert jerarquia.descendientes(1) == {2, 3, 4, 5, 6}
+    assert jerarquia.ancestros(6) == (5, 3, 1)
+    assert_igual_a_reconstruida(jerarquia, {**REPORTES, 5: 3})
+
+
+def test_mover_a_otra_rama_y_sin_supervisor():
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    jerarquia.mover(2, 7)
+    assert jerarquia.descendientes(1) == {3}
+    assert jerarquia.descendientes(7) == {2, 4, 5, 6}
+    assert_igual_a_reconstruida(jerarquia, {**REPORTES, 2: 7})
+
+    jerarquia.mover(2, None)
+    assert jerarquia.descendientes(7) == frozenset()
+    assert jerarquia.ancestros(6) == (5, 2)
+    assert_igual_a_reconstruida(jerarquia, {**REPORTES, 2: None})
+
+
+def test_mover_bajo_supervisor_desconocido():
+    """Supervisor que no estaba en el directorio (creado en otro worker)"""
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    jerarquia.mover(4, 99)
+    assert 99 in jerarquia
+    assert jerarquia.descendientes(99) == {4}
+    assert jerarquia.descendientes(2) == {5, 6}
+
+
+def test_rechaza_ciclo_sin_modificar():
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    assert jerarquia.crearia_ciclo(2, 6)
+    assert jerarquia.crearia_ciclo(2, 2)
+    assert not jerarquia.crearia_ciclo(6, 3)
+    assert not jerarquia.crearia_ciclo(2, None)
+
+    with pytest.raises(ValueError):
+        jerarquia.mover(2, 6)
+    with pytest.raises(ValueError):
+        jerarquia.mover(2, 2)
+    assert_igual_a_reconstruida(jerarquia, REPORTES)
+
+
+def test_quitar_usuario():
+    """Al eliminar a 2 su equipo deja de estar bajo 1; reports_to_id de 4 y 5 se conserva"""
+    jerarquia = JerarquiaUsuarios(REPORTES)
+    jerarquia.quitar(2)
+
+    assert 2 not in jerarquia
+    assert jerarquia.descendientes(1) == {3}
+    assert jerarquia.padre(4) == 2
+    assert jerarquia.ancestros(6) == (5, 2)
+    reportes = {user_id: padre for user_id, padre in REPORTES.items() if user_id != 2}
+    assert_igual_a_reconstruida(jerarquia, reportes)
+
+    # Quitar un usuario que no está no cambia nada
+    jerarquia.quitar(2)
+    assert_igual_a_reconstruida(jerarquia, reportes)
+
+
+def test_ciclo_en_los_datos_no_cuelga():
+    jerarquia = JerarquiaUsuarios({1: 2, 2: 1, 3: 1})
+    assert jerarquia.ancestros(3) == (1, 2)
+    assert jerarquia.descendientes(2) == {1, 3}
+
+
+def test_actualizar_jerarquia_con_cache_desactualizada():
+    """Un cambio ya guardado que la caché ve como ciclo invalida la caché en lugar de fallar"""
+    empresa_id = 424242
+    jerarquia_usuarios._cache_jerarquias.set(empresa_id, JerarquiaUsuarios(REPORTES))
+    try:
+        actualizar_jerarquia(empresa_id, 2, 6)
+        assert jerarquia_usuarios._cache_jerarquias.get(empresa_id) is None
+
+        jerarquia_usuarios._cache_jerarquias.set(empresa_id, JerarquiaUsuarios(REPORTES))
+        actualizar_jerarquia(empresa_id, 5, 3)
+        assert jerarquia_usuarios._cache_jerarquias.get(empresa_id).descendientes(3) == {5, 6}
+    finally:
+        jerarquia_usuarios.invalidar_jerarquia(empresa_id)
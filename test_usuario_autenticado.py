@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Pruebas de utils.usuario_autenticado.obtener_usuario_autenticado, sin BD:
+identidad ligada al subject del token, claims de alcance con versión del servidor
+y vuelta a X-User-Id con tokens ajenos.
+"""
+
+import os
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "aaa.bbb.ccc")
+os.environ.setdefault("JWT_SECRET_KEY", "clave-de-prueba")
+
+from flask_jwt_extended import create_access_token
+
+from models.alcance_rol import AlcanceRol
+from utils import usuario_autenticado as ua
+
+EMPRESA_ID = 5
+
+
+@pytest.fixture
+def app():
+    import app as modulo_app
+
+    return modulo_app.app
+
+
+@pytest.fixture
+def usuarios(monkeypatch):
+    """Tabla usuarios en memoria: {id: fila}; cuenta las lecturas de la BD"""
+    filas = {
+        7: {"id": 7, "rol": "asesor", "empresa_id": EMPRESA_ID, "info_extra": {}},
+        8: {"id": 8, "rol": "admin", "empresa_id": EMPRESA_ID, "info_extra": {}},
+        9: {"id": 9, "rol": None, "empresa_id": EMPRESA_ID, "info_extra": {}},
+    }
+    lecturas = []
+
+    def cargar_usuario(user_id):
+        lecturas.append(user_id)
+        fila = filas.get(user_id)
+        if not fila:
+            return None
+        return {
+            "id": fila["id"], "rol": fila["rol"], "empresa_id": fila["empresa_id"],
+            "banco_nombre": None, "ciudad": None, "ciudad_solicitud": None,
+        }
+
+    def versiones_empresa(empresa_id):
+        return {
+            fila["id"]: ua.huella_alcance(fila["rol"], fila["empresa_id"], None, None)
+            for fila in filas.values() if fila["empresa_id"] == empresa_id
+        }
+
+    monkeypatch.setattr(ua, "_cargar_usuario", cargar_usuario)
+    monkeypatch.setattr(ua, "_versiones_empresa", versiones_empresa)
+    ua.invalidar_usuario_autenticado()
+    yield filas, lecturas
+    ua.invalidar_usuario_autenticado()
+
+
+def _token(app, fila):
+    with app.app_context():
+        return create_access_token(identity=str(fila["id"]), additional_claims=ua.claims_alcance(fila))
+
+
+def _resolver(app, token, **headers):
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}", **headers}):
+        return ua.obtener_usuario_autenticado()
+
+
+def test_claims_vigentes_sin_consultar_la_bd(app, usuarios):
+    filas, lecturas = usuarios
+    usuario = _resolver(app, _token(app, filas[7]), **{"X-User-Id": "7"})
+    assert usuario["id"] == 7 and usuario["rol"] == "asesor" and usuario["empresa_id"] == EMPRESA_ID
+    assert lecturas == []
+    # Sin X-User-Id la identidad es el subject del token
+    assert _resolver(app, _token(app, filas[7]))["id"] == 7
+
+
+def test_subject_distinto_de_x_user_id_se_rechaza(app, usuarios):
+    filas, lecturas = usuarios
+    assert _resolver(app, _token(app, filas[7]), **{"X-User-Id": "8"}) is None
+    assert lecturas == []
+
+
+def test_alcance_v_desactualizado_vuelve_a_la_bd(app, usuarios):
+    filas, lecturas = usuarios
+    token = _token(app, filas[7])
+    filas[7]["rol"] = "supervisor"
+
+    usuario = _resolver(app, token)
+    assert usuario["rol"] == "supervisor"
+    assert lecturas == [7]
+
+
+def test_usuario_eliminado_se_rechaza(app, usuarios):
+    filas, _ = usuarios
+    token = _token(app, filas[7])
+    del filas[7]
+    assert _resolver(app, token) is None
+
+
+def test_usuario_movido_de_empresa_no_usa_los_claims(app, usuarios):
+    filas, lecturas = usuarios
+    token = _token(app, filas[7])
+    filas[7]["empresa_id"] = 6
+
+    usuario = _resolver(app, token)
+    assert usuario["empresa_id"] == 6
+    assert lecturas == [7]
+
+
+def test_rol_nulo_no_se_amplia(app, usuarios):
+    filas, lecturas = usuarios
+    usuario = _resolver(app, _token(app, filas[9]))
+    assert lecturas == []
+    assert usuario["rol"] is None
+    alcance = AlcanceRol.resolver(usuario, EMPRESA_ID)
+    assert alcance.sin_acceso and not alcance.ve_todo
+
+
+def test_token_ajeno_usa_x_user_id(app, usuarios):
+    _, lecturas = usuarios
+    usuario = _resolver(app, "no-es-un-jwt", **{"X-User-Id": "8"})
+    assert usuario["id"] == 8 and usuario["rol"] == "admin"
+    assert lecturas == [8]
+
+    with app.test_request_context("/?user_id=7", headers={"Authorization": "Bearer no-es-un-jwt"}):
+        assert ua.obtener_usuario_autenticado()["id"] == 7
+        assert ua.obtener_usuario_autenticado(permitir_query_param=False) is None
+
+
+def test_token_firmado_con_otra_clave_usa_x_user_id(app, usuarios):
+    import jwt
+
+    ajeno = jwt.encode({"sub": "8", "alcance_v": "x"}, "otra-clave", algorithm="HS256")
+    assert _resolver(app, ajeno, **{"X-User-Id": "7"})["id"] == 7
+
+
+def test_sin_bearer_no_hay_usuario(app, usuarios):
+    with app.test_request_context(headers={"X-User-Id": "7"}):
+        assert ua.obtener_usuario_autenticado() is None
@@ -0,0 +1,81 @@
+"""
+Caché en memoria con expiración (TTL) y desalojo LRU acotado por tamaño.
+Es por proceso: con varios workers de gunicorn cada uno mantiene su propia copia,
+por lo que los datos pueden tardar hasta un TTL en reflejarse en otros workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_SIN_VALOR = object()
+
+
+class CacheTTL:
+    """Caché clave -> valor segura entre hilos, con TTL y máximo de entradas."""
+
+    def __init__(self, ttl_segundos: float, max_entradas: int = 1024):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Aumenta en cada invalidación; ver `set(..., generacion=...)`
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    @property
+    def habilitada(self) -> bool:
+        return self.ttl_segundos > 0 and self.max_entradas > 0
+
+    def get(self, clave: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor vigente o `default` si no existe o expiró."""
+        with self._lock:
+            entrada = self._datos.get(clave, _SIN_VALOR)
+            if entrada is _SIN_VALOR:
+                self.fallos += 1
+                return default
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    @property
+    def generacion(self) -> int:
+        """Se lee antes de calcular un valor y se pasa a `set`."""
+        return self._generacion
+
+    def set(self, clave: Hashable, valor: Any, ttl: Optional[float] = None, generacion: Optional[int] = None) -> None:
+        """Guarda un valor; desaloja el menos usado si se supera el máximo.
+        Con `generacion`, no se guarda si hubo una invalidación desde que se leyó: el valor
+        se calculó con datos que ya cambiaron y quedaría obsoleto durante todo el TTL."""
+        if not self.habilitada:
+            return
+        expira = time.monotonic() + (self.ttl_segundos if ttl is None else ttl)
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, predicado: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Elimina las claves que cumplen el predicado (todas si no se indica). Devuelve cuántas."""
+        with self._lock:
+            self._generacion += 1
+            if predicado is None:
+                total = len(self._datos)
+                self._datos.clear()
+                return total
+            claves = [clave for clave in self._datos if predicado(clave)]
+            for clave in claves:
+                del self._datos[clave]
+            return len(claves)
+
+    def __len__(self) -> int:
+        return len(self._datos)
@@ -0,0 +1,96 @@
+"""
+Ejecución concurrente de consultas independientes a Supabase.
+Permite lanzar varias consultas a la vez sobre un pool de hilos acotado y esperar
+solo lo que tarda la más lenta, con un tiempo límite por petición.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+# Tiempo límite (segundos) por defecto para un grupo de tareas paralelas
+TIMEOUT_POR_DEFECTO = float(os.getenv("CONSULTAS_PARALELAS_TIMEOUT", "20"))
+
+# Hilos por defecto de cada pool; se puede ajustar por pool con POOL_<NOMBRE>_WORKERS
+WORKERS_POR_DEFECTO = int(os.getenv("CONSULTAS_PARALELAS_WORKERS", "8"))
+
+_pools: Dict[str, tuple] = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(nombre: str = "consultas", max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """
+    Devuelve el pool de hilos con ese nombre, creándolo la primera vez.
+    Los pools se separan por propósito para que una tarea que a su vez lanza
+    subtareas (p. ej. /estadisticas/completas) no espere sobre su propio pool.
+    Se recrean tras un fork (workers de gunicorn con preload).
+    `max_workers` es el tamaño por defecto de ese pool (POOL_<NOMBRE>_WORKERS lo sustituye).
+    """
+    pid = os.getpid()
+    entrada = _pools.get(nombre)
+    if entrada and entrada[0] == pid:
+        return entrada[1]
+
+    with _pools_lock:
+        entrada = _pools.get(nombre)
+        if entrada and entrada[0] == pid:
+            return entrada[1]
+        por_defecto = WORKERS_POR_DEFECTO if max_workers is None else max_workers
+        tamano = int(os.getenv(f"POOL_{nombre.upper()}_WORKERS", por_defecto))
+        pool = ThreadPoolExecutor(max_workers=tamano, thread_name_prefix=f"pool-{nombre}")
+        _pools[nombre] = (pid, pool)
+        return pool
+
+
+_SIN_DEFAULT = object()
+
+
+def ejecutar_en_paralelo(
+    tareas: Dict[str, Callable[[], Any]],
+    timeout: Optional[float] = None,
+    pool: str = "consultas",
+    defaults: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta en paralelo funciones sin argumentos y devuelve {nombre: resultado}.
+
+    Si una tarea falla o no termina antes del tiempo límite se usa su valor en
+    `defaults`; si no tiene default, se propaga el error (TimeoutError en caso
+    de tiempo agotado).
+    """
+    defaults = defaults or {}
+    timeout = TIMEOUT_POR_DEFECTO if timeout is None else timeout
+
+    # Una sola tarea no justifica pasar por el pool
+    if len(tareas) <= 1:
+        return {nombre: fn() for nombre, fn in tareas.items()}
+
+    inicio = time.monotonic()
+    executor = obtener_pool(pool)
+    futuros = {nombre: executor.submit(fn) for nombre, fn in tareas.items()}
+    wait(list(futuros.values()), timeout=timeout)
+
+    resultados: Dict[str, Any] = {}
+    for nombre, futuro in futuros.items():
+        default = defaults.get(nombre, _SIN_DEFAULT)
+
+        if not futuro.done():
+            futuro.cancel()
+            print(f"⏱️ Tarea '{nombre}' sin respuesta tras {time.monotonic() - inicio:.1f}s")
+            if default is _SIN_DEFAULT:
+                raise TimeoutError(f"La consulta '{nombre}' excedió el tiempo límite de {timeout}s")
+            resultados[nombre] = default
+            continue
+
+        error = futuro.exception()
+        if error is not None:
+            if default is _SIN_DEFAULT:
+                raise error
+            print(f"❌ Error en tarea '{nombre}': {error}")
+            resultados[nombre] = default
+            continue
+
+        resultados[nombre] = futuro.result()
+
+    return resultados
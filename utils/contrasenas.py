@@ -0,0 +1,184 @@
+"""
+Hash y verificación de contraseñas con bcrypt fuera del hilo de la petición.
+
+bcrypt es CPU intensivo a propósito: una ráfaga de logins (p. ej. al inicio de turno)
+ocupaba todos los workers. Aquí el trabajo va a un pool dedicado y acotado, con control
+de admisión (si hay demasiadas operaciones pendientes se rechaza en lugar de encolar),
+y el login limita los intentos fallidos por cuenta y por IP.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FuturoTimeoutError
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+import bcrypt
+
+from utils.concurrencia import obtener_pool
+
+# Factor de trabajo de los hashes nuevos; los existentes con otro costo se rehashean al hacer login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hilos del pool de bcrypt (POOL_BCRYPT_WORKERS lo sustituye, como en los demás pools)
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+
+# Operaciones admitidas a la vez (en ejecución + en cola) y cuánto se espera un cupo
+BCRYPT_MAX_PENDIENTES = int(os.getenv("BCRYPT_MAX_PENDIENTES", "16"))
+BCRYPT_ESPERA_ADMISION = float(os.getenv("BCRYPT_ESPERA_ADMISION", "2"))
+
+# Tiempo límite de una operación ya admitida
+BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", "10"))
+
+# Intentos fallidos de login permitidos por ventana
+LOGIN_VENTANA_SEGUNDOS = float(os.getenv("LOGIN_VENTANA_SEGUNDOS", "300"))
+LOGIN_MAX_INTENTOS_CUENTA = int(os.getenv("LOGIN_MAX_INTENTOS_CUENTA", "5"))
+LOGIN_MAX_INTENTOS_IP = int(os.getenv("LOGIN_MAX_INTENTOS_IP", "30"))
+
+_admision = threading.BoundedSemaphore(BCRYPT_MAX_PENDIENTES)
+
+T = TypeVar("T")
+
+
+class ServicioSaturadoError(Exception):
+    """No hay cupo en el pool de bcrypt: el cliente debe reintentar más tarde."""
+
+    def __init__(self, reintentar_en: float = 1.0):
+        super().__init__("Demasiados inicios de sesión simultáneos, intenta de nuevo en unos segundos")
+        self.reintentar_en = reintentar_en
+
+
+class IntentosExcedidosError(Exception):
+    """Demasiados intentos fallidos para la cuenta o la IP."""
+
+    def __init__(self, reintentar_en: float):
+        super().__init__("Demasiados intentos fallidos, intenta de nuevo más tarde")
+        self.reintentar_en = reintentar_en
+
+
+def _ejecutar(fn: Callable[[], T]) -> T:
+    """Ejecuta `fn` en el pool de bcrypt respetando el límite de operaciones pendientes"""
+    if not _admision.acquire(timeout=BCRYPT_ESPERA_ADMISION):
+        raise ServicioSaturadoError()
+    try:
+        futuro = obtener_pool("bcrypt", max_workers=BCRYPT_WORKERS).submit(fn)
+    except Exception:
+        _admision.release()
+        raise
+    futuro.add_done_callback(lambda _: _admision.release())
+    try:
+        return futuro.result(timeout=BCRYPT_TIMEOUT)
+    except FuturoTimeoutError as exc:
+        futuro.cancel()
+        raise ServicioSaturadoError() from exc
+
+
+def hashear_contrasena(password: str, rounds: Optional[int] = None) -> str:
+    """Hash bcrypt de la contraseña con el costo configurado"""
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return _ejecutar(lambda: bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8"))
+
+
+def verificar_contrasena(password: str, password_hash: str) -> bool:
+    """Compara la contraseña con el hash guardado (admite contraseñas antiguas sin hashear)"""
+    if not password_hash:
+        return False
+    if not password_hash.startswith("$2b$"):
+        return password == password_hash
+    try:
+        return _ejecutar(lambda: bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8")))
+    except ValueError:
+        # Hash malformado: mismo comportamiento que antes (comparación directa)
+        return password == password_hash
+
+
+def necesita_rehash(password_hash: str) -> bool:
+    """True si el hash no es bcrypt o se generó con un costo distinto al configurado"""
+    if not password_hash or not password_hash.startswith("$2b$"):
+        return True
+    try:
+        return int(password_hash.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def rehashear_en_segundo_plano(password: str, guardar: Callable[[str], None]) -> None:
+    """Genera el hash con el costo actual y lo guarda sin hacer esperar al login"""
+    def _tarea():
+        try:
+            guardar(bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8"))
+        except Exception as e:
+            print(f"❌ Error rehasheando contraseña: {e}")
+        finally:
+            _admision.release()
+
+    # Solo si hay cupo libre: el rehash puede esperar al próximo login
+    if not _admision.acquire(blocking=False):
+        return
+    try:
+        obtener_pool("bcrypt", max_workers=BCRYPT_WORKERS).submit(_tarea)
+    except Exception:
+        _admision.release()
+
+
+class LimitadorIntentos:
+    """Ventana deslizante de intentos fallidos por clave (cuenta o IP), en memoria del proceso."""
+
+    def __init__(self, max_intentos: int, ventana_segundos: float):
+        self.max_intentos = max_intentos
+        self.ventana_segundos = ventana_segundos
+        self._intentos: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _vigentes(self, clave: str, ahora: float) -> Deque[float]:
+        intentos = self._intentos.get(clave)
+        if intentos is None:
+            return deque()
+        while intentos and ahora - intentos[0] >= self.ventana_segundos:
+            intentos.popleft()
+        if not intentos:
+            del self._intentos[clave]
+        return intentos
+
+    def espera(self, clave: str) -> float:
+        """Segundos que faltan para poder intentar de nuevo (0 si no está bloqueada)"""
+        ahora = time.monotonic()
+        with self._lock:
+            intentos = self._vigentes(clave, ahora)
+            if len(intentos) < self.max_intentos:
+                return 0.0
+            return self.ventana_segundos - (ahora - intentos[0])
+
+    def registrar(self, clave: str) -> None:
+        ahora = time.monotonic()
+        with self._lock:
+            self._vigentes(clave, ahora)
+            self._intentos.setdefault(clave, deque()).append(ahora)
+
+    def limpiar(self, clave: str) -> None:
+        with self._lock:
+            self._intentos.pop(clave, None)
+
+
+_intentos_cuenta = LimitadorIntentos(LOGIN_MAX_INTENTOS_CUENTA, LOGIN_VENTANA_SEGUNDOS)
+_intentos_ip = LimitadorIntentos(LOGIN_MAX_INTENTOS_IP, LOGIN_VENTANA_SEGUNDOS)
+
+
+def verificar_intentos_login(correo: str, ip: Optional[str]) -> None:
+    """Lanza IntentosExcedidosError si la cuenta o la IP superaron los intentos fallidos"""
+    espera = max(
+        _intentos_cuenta.espera(correo.strip().lower()),
+        _intentos_ip.espera(ip) if ip else 0.0,
+    )
+    if espera > 0:
+        raise IntentosExcedidosError(espera)
+
+
+def registrar_login_fallido(correo: str, ip: Optional[str]) -> None:
+    _intentos_cuenta.registrar(correo.strip().lower())
+    if ip:
+        _intentos_ip.registrar(ip)
+
+
+def registrar_login_exitoso(correo: str) -> None:
+    _intentos_cuenta.limpiar(correo.strip().lower())
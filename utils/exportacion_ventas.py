@@ -0,0 +1,250 @@
+"""
+Columnas de la exportación de ventas y aplanado de cada registro a una fila.
+
+COLUMNAS_VENTAS declara cada columna como (encabezado, fuente, campo). AplanadorFilas
+agrupa las columnas por fuente una sola vez por exportación; luego, por cada registro,
+resuelve cada fuente (ubicación, actividad, solicitud, ...) una única vez y reparte sus
+campos en la tupla de salida, en el orden de las columnas.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Zona horaria de Colombia (UTC-5) para la fecha y hora de creación
+ZONA_COLOMBIA = timezone(timedelta(hours=-5))
+
+# Fuentes que son listas de sub-registros con su JSON de detalle: (llave en el registro, llave del detalle)
+_SUBREGISTROS = {
+    "ubicacion": ("ubicaciones", "detalle_direccion"),
+    "actividad": ("actividad_economica", "detalle_actividad"),
+    "financiera": ("informacion_financiera", "detalle_financiera"),
+}
+
+# (encabezado, fuente, campo) - TODAS las columnas del registro completo
+COLUMNAS_VENTAS: List[Tuple[str, str, Any]] = [
+    # === DATOS BÁSICOS ===
+    ("Nombres", "nombre", None),
+    ("Tipo Identificación", "solicitante", "tipo_identificacion"),
+    ("Número Documento", "solicitante", "numero_documento"),
+    ("Fecha Nacimiento", "solicitante", "fecha_nacimiento"),
+    ("Género", "solicitante", "genero"),
+    ("Correo", "solicitante", "correo"),
+    ("Fecha Creación", "creacion", "fecha"),
+    ("Hora Creación", "creacion", "hora"),
+
+    # === INFO EXTRA ===
+    ("Celular", "info_extra", "celular"),
+    ("Teléfono", "info_extra", "telefono"),
+    ("Estado Civil", "info_extra", "estado_civil"),
+    ("Nivel Educativo", "info_extra", "nivel_educativo"),
+    ("Profesión", "info_extra", "profesion"),
+    ("Personas a Cargo", "info_extra", "personas_a_cargo"),
+    ("Lugar Nacimiento", "info_extra", "lugar_nacimiento"),
+    ("Nacionalidad", "info_extra", "nacionalidad"),
+
+    # === UBICACIÓN ===
+    ("Dirección", "ubicacion", "direccion"),
+    ("Ciudad Residencia", "ubicacion", "ciudad_residencia"),
+    ("Departamento Residencia", "ubicacion", "departamento_residencia"),
+    ("Barrio", "ubicacion", "barrio"),
+    ("Estrato", "ubicacion", "estrato"),
+    ("Tipo Vivienda", "ubicacion", "tipo_vivienda"),
+    ("Paga Arriendo", "ubicacion", "paga_arriendo"),
+    ("Valor Arriendo", "ubicacion", "valor_mensual_arriendo"),
+
+    # === ACTIVIDAD ECONÓMICA ===
+    ("Tipo Actividad", "actividad", "tipo_actividad"),
+    ("Tipo Actividad Económica", "actividad", "tipo_actividad_economica"),
+    ("Ocupación", "actividad", "ocupacion"),
+    ("Nombre Empresa", "actividad", "nombre_empresa"),
+    ("Cargo", "actividad", "cargo"),
+    ("Antigüedad Laboral", "actividad", "antiguedad_laboral"),
+    ("Tipo Contrato", "actividad", "tipo_contrato"),
+    ("Dirección Empresa", "actividad", "direccion_empresa"),
+    ("Teléfono Empresa", "actividad", "telefono_empresa"),
+    ("Ciudad Empresa", "actividad", "ciudad_empresa"),
+    ("Sector Económico", "actividad", "sector_economico"),
+
+    # === INFORMACIÓN FINANCIERA ===
+    ("Total Ingresos Mensuales", "financiera", "total_ingresos_mensuales"),
+    ("Total Egresos Mensuales", "financiera", "total_egresos_mensuales"),
+    ("Total Activos", "financiera", "total_activos"),
+    ("Total Pasivos", "financiera", "total_pasivos"),
+    ("Ingreso Básico Mensual", "financiera", "ingreso_basico_mensual"),
+    ("Ingreso Variable Mensual", "financiera", "ingreso_variable_mensual"),
+    ("Otros Ingresos Mensuales", "financiera", "otros_ingresos_mensuales"),
+    ("Gastos Financieros", "financiera", "gastos_financieros_mensuales"),
+    ("Gastos Personales", "financiera", "gastos_personales_mensuales"),
+    ("Declara Renta", "financiera", "declara_renta"),
+
+    # === SOLICITUD ===
+    ("Tipo Crédito", "solicitud", ("detalle_credito", "tipo_credito")),
+    ("Monto Solicitado", "solicitud", ("detalle_credito", "monto_solicitado")),
+    ("Plazo", "solicitud", ("detalle_credito", "plazo")),
+    ("Destino Crédito", "solicitud", ("detalle_credito", "destino_credito")),
+    ("Banco", "solicitud", ("banco_nombre",)),
+    ("Ciudad Solicitud", "solicitud", ("ciudad_solicitud",)),
+    ("Estado", "solicitud", ("estado",)),
+
+    # === REFERENCIAS ===
+    ("Referencia 1 - Nombre", "referencia", (0, "nombre_completo")),
+    ("Referencia 1 - Relación", "referencia", (0, "relacion_referencia")),
+    ("Referencia 1 - Teléfono", "referencia", (0, "telefono")),
+    ("Referencia 1 - Celular", "referencia", (0, "celular_referencia")),
+    ("Referencia 1 - Ciudad", "referencia", (0, "ciudad")),
+    ("Referencia 2 - Nombre", "referencia", (1, "nombre_completo")),
+    ("Referencia 2 - Relación", "referencia", (1, "relacion_referencia")),
+    ("Referencia 2 - Teléfono", "referencia", (1, "telefono")),
+    ("Referencia 2 - Celular", "referencia", (1, "celular_referencia")),
+    ("Referencia 2 - Ciudad", "referencia", (1, "ciudad")),
+
+    # === DOCUMENTOS ===
+    ("Total Documentos", "documentos", "total"),
+    ("Documentos Cargados", "documentos", "tipos"),
+
+    # === USUARIOS ===
+    ("Creado por", "solicitante", "created_by_user_name"),
+    ("Supervisor", "solicitante", "created_by_supervisor_name"),
+]
+
+
+def _texto(valor: Any) -> str:
+    """Convierte None y vacíos a string vacío y el resto a string"""
+    return str(valor) if valor else ""
+
+
+def _primero(lista: Any) -> Dict[str, Any]:
+    return lista[0] if isinstance(lista, list) and lista and isinstance(lista[0], dict) else {}
+
+
+def _con_detalle(registro: Dict[str, Any], llave_detalle: str) -> Callable[[str], Any]:
+    """Busca primero en el JSON de detalle y luego en el nivel superior del sub-registro"""
+    detalle = registro.get(llave_detalle) or {}
+    if not isinstance(detalle, dict):
+        detalle = {}
+    return lambda campo: detalle.get(campo) or registro.get(campo)
+
+
+def parsear_fecha_colombia(created_at: Any):
+    """Timestamp de Supabase convertido a la zona horaria de Colombia; None si no se puede parsear"""
+    if not created_at:
+        return None
+    try:
+        return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).astimezone(ZONA_COLOMBIA)
+    except ValueError:
+        return None
+
+
+def formatear_fecha(created_at: Any) -> str:
+    """Fecha DD/MM/YYYY en hora de Colombia; si no se puede parsear, la parte de fecha del texto"""
+    fecha = parsear_fecha_colombia(created_at)
+    if fecha is not None:
+        return fecha.strftime("%d/%m/%Y")
+    texto = str(created_at or "")
+    return texto.split("T")[0] if "T" in texto else texto
+
+
+def formatear_hora(created_at: Any) -> str:
+    """Hora en formato 12 horas (hh:mm:ss AM/PM) en hora de Colombia"""
+    fecha = parsear_fecha_colombia(created_at)
+    if fecha is not None:
+        return fecha.strftime("%I:%M:%S %p")
+    texto = str(created_at or "")
+    return texto.split("T")[1].split(".")[0] if "T" in texto else ""
+
+
+class AplanadorFilas:
+    """Convierte registros completos de solicitantes en tuplas de texto según una especificación de columnas."""
+
+    def __init__(self, columnas: Sequence[Tuple[str, str, Any]]):
+        self.encabezados = [columna[0] for columna in columnas]
+        # Agrupar por fuente: {fuente: [(posición, campo), ...]} en orden de aparición
+        plan: Dict[str, List[Tuple[int, Any]]] = {}
+        for posicion, (encabezado, fuente, campo) in enumerate(columnas):
+            if fuente not in self._RESOLVEDORES:
+                raise ValueError(f"Fuente de columna desconocida '{fuente}' en '{encabezado}'")
+            plan.setdefault(fuente, []).append((posicion, campo))
+        self._plan = [(fuente, getattr(self, self._RESOLVEDORES[fuente]), posiciones) for fuente, posiciones in plan.items()]
+
+    def aplanar(self, item: Dict[str, Any], fila_idx: int = 0) -> Tuple[str, ...]:
+        fila = [""] * len(self.encabezados)
+        for fuente, resolver, posiciones in self._plan:
+            try:
+                resolver(item, posiciones, fila, fuente)
+            except Exception as e:
+                print(f"   ⚠️ Error extrayendo '{fuente}' en fila {fila_idx}: {e}")
+        return tuple(fila)
+
+    # Cada resolvedor navega una vez hasta su sub-registro y llena sus posiciones de la fila
+    def _resolver_solicitante(self, item, posiciones, fila, fuente):
+        for posicion, campo in posiciones:
+            fila[posicion] = _texto(item.get(campo))
+
+    def _resolver_nombre(self, item, posiciones, fila, fuente):
+        partes = (item.get("nombres"), item.get("primer_apellido"), item.get("segundo_apellido"))
+        nombre = " ".join(str(parte or "") for parte in partes).strip()
+        for posicion, _ in posiciones:
+            fila[posicion] = nombre
+
+    def _resolver_creacion(self, item, posiciones, fila, fuente):
+        created_at = item.get("created_at")
+        fecha = parsear_fecha_colombia(created_at)
+        for posicion, campo in posiciones:
+            if fecha is None:
+                fila[posicion] = formatear_fecha(created_at) if campo == "fecha" else formatear_hora(created_at)
+            else:
+                fila[posicion] = fecha.strftime("%d/%m/%Y" if campo == "fecha" else "%I:%M:%S %p")
+
+    def _resolver_info_extra(self, item, posiciones, fila, fuente):
+        info_extra = item.get("info_extra") or {}
+        for posicion, campo in posiciones:
+            fila[posicion] = _texto(info_extra.get(campo))
+
+    def _resolver_subregistro(self, item, posiciones, fila, fuente):
+        llave_lista, llave_detalle = _SUBREGISTROS[fuente]
+        registro = _primero(item.get(llave_lista))
+        if not registro:
+            return
+        valor = _con_detalle(registro, llave_detalle)
+        for posicion, campo in posiciones:
+            fila[posicion] = _texto(valor(campo))
+
+    def _resolver_solicitud(self, item, posiciones, fila, fuente):
+        solicitud = item.get("solicitud")
+        if not isinstance(solicitud, dict):
+            return
+        for posicion, ruta in posiciones:
+            valor: Any = solicitud
+            for campo in ruta:
+                valor = valor.get(campo) if isinstance(valor, dict) else None
+            fila[posicion] = _texto(valor)
+
+    def _resolver_referencia(self, item, posiciones, fila, fuente):
+        referencias = item.get("referencias") or []
+        valores = {}
+        for posicion, (indice, campo) in posiciones:
+            if indice >= len(referencias) or not isinstance(referencias[indice], dict):
+                continue
+            if indice not in valores:
+                valores[indice] = _con_detalle(referencias[indice], "detalle_referencia")
+            fila[posicion] = _texto(valores[indice](campo))
+
+    def _resolver_documentos(self, item, posiciones, fila, fuente):
+        documentos = item.get("documentos") or []
+        for posicion, campo in posiciones:
+            if campo == "total":
+                fila[posicion] = str(len(documentos))
+            else:
+                fila[posicion] = ", ".join(doc["tipo_documento"] for doc in documentos if doc.get("tipo_documento"))
+
+    _RESOLVEDORES = {
+        "solicitante": "_resolver_solicitante",
+        "nombre": "_resolver_nombre",
+        "creacion": "_resolver_creacion",
+        "info_extra": "_resolver_info_extra",
+        "ubicacion": "_resolver_subregistro",
+        "actividad": "_resolver_subregistro",
+        "financiera": "_resolver_subregistro",
+        "solicitud": "_resolver_solicitud",
+        "referencia": "_resolver_referencia",
+        "documentos": "_resolver_documentos",
+    }
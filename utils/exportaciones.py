@@ -0,0 +1,315 @@
+"""
+Exportaciones en segundo plano.
+
+Una exportación se encola como trabajo, se ejecuta en un pool acotado de hilos y deja
+el archivo generado (artefacto) en disco local o en un bucket de Supabase Storage.
+El estado de cada trabajo se guarda como JSON en EXPORTACIONES_DIR para que cualquier
+worker de gunicorn de la misma máquina pueda responder el estado o servir la descarga.
+Si se pide la misma exportación dentro de la ventana de reutilización se devuelve el
+trabajo existente (en curso o terminado) en lugar de generar otro archivo.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from utils.concurrencia import obtener_pool
+
+try:
+    import fcntl
+except ImportError:  # Windows (entorno local de desarrollo)
+    fcntl = None
+
+EXPORTACIONES_DIR = os.getenv("EXPORTACIONES_DIR", os.path.join(tempfile.gettempdir(), "exportaciones"))
+
+# "local" guarda el archivo en EXPORTACIONES_DIR; "supabase" lo sube a EXPORTACIONES_BUCKET
+EXPORTACIONES_ALMACENAMIENTO = os.getenv("EXPORTACIONES_ALMACENAMIENTO", "local").lower()
+EXPORTACIONES_BUCKET = os.getenv("EXPORTACIONES_BUCKET", "exportaciones")
+
+# Segundos durante los que una exportación idéntica reutiliza el último artefacto
+EXPORTACIONES_REUTILIZAR_SEGUNDOS = int(os.getenv("EXPORTACIONES_REUTILIZAR_SEGUNDOS", "300"))
+
+# Segundos que se conservan los trabajos terminados y sus archivos
+EXPORTACIONES_RETENCION_SEGUNDOS = int(os.getenv("EXPORTACIONES_RETENCION_SEGUNDOS", "3600"))
+
+# Un trabajo sin actualizar su estado en este tiempo se da por interrumpido
+EXPORTACIONES_TIEMPO_MAXIMO = int(os.getenv("EXPORTACIONES_TIEMPO_MAXIMO", "1800"))
+
+# Validez (segundos) del enlace firmado de descarga cuando se usa Supabase Storage
+EXPORTACIONES_URL_EXPIRA = int(os.getenv("EXPORTACIONES_URL_EXPIRA", "300"))
+
+# Hilos del pool de exportaciones (POOL_EXPORTACIONES_WORKERS lo sustituye)
+WORKERS_EXPORTACIONES = 2
+
+ESTADO_EN_COLA = "en_cola"
+ESTADO_PROCESANDO = "procesando"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+
+# Campos internos que no se exponen en la API
+_CAMPOS_INTERNOS = ("clave", "pid", "ruta_storage", "ultima_actividad")
+
+
+def _ahora_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class GestorExportaciones:
+    """Encola, ejecuta y sirve exportaciones de archivos generadas en segundo plano."""
+
+    def __init__(self, directorio: str = EXPORTACIONES_DIR, almacenamiento: str = EXPORTACIONES_ALMACENAMIENTO):
+        self.directorio = directorio
+        self.almacenamiento = almacenamiento
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def encolar(
+        self,
+        *,
+        tipo: str,
+        empresa_id: int,
+        parametros: Dict[str, Any],
+        nombre_archivo: str,
+        generar: Callable[[str, Callable[[int, Optional[int]], None]], Optional[int]],
+    ) -> Dict[str, Any]:
+        """
+        Encola una exportación y devuelve su trabajo (o el reutilizado).
+
+        `generar(ruta_destino, progreso)` escribe el archivo en `ruta_destino`, informa el
+        avance con `progreso(filas_escritas, total_filas)` y puede devolver las filas escritas.
+        """
+        clave = self._clave(tipo, empresa_id, parametros)
+
+        with self._lock, self._bloqueo_archivos():
+            self._purgar()
+            existente = self._buscar_reutilizable(clave)
+            if existente:
+                print(f"♻️ Reutilizando exportación {existente['id']} ({tipo}, empresa {empresa_id})")
+                return self._publico(existente, reutilizado=True)
+
+            job_id = uuid.uuid4().hex
+            extension = os.path.splitext(nombre_archivo)[1]
+            job = {
+                "id": job_id,
+                "tipo": tipo,
+                "empresa_id": int(empresa_id),
+                "parametros": parametros,
+                "clave": clave,
+                "estado": ESTADO_EN_COLA,
+                "filas_escritas": 0,
+                "total_filas": None,
+                "nombre_archivo": nombre_archivo,
+                "archivo": f"{job_id}{extension}",
+                "almacenamiento": self.almacenamiento,
+                "tamano_bytes": None,
+                "error": None,
+                "creado": _ahora_iso(),
+                "iniciado": None,
+                "finalizado": None,
+                "ultima_actividad": time.time(),
+                "pid": os.getpid(),
+            }
+            self._guardar(job)
+
+        obtener_pool("exportaciones", WORKERS_EXPORTACIONES).submit(self._ejecutar, job_id, generar)
+        print(f"📤 Exportación {job_id} encolada ({tipo}, empresa {empresa_id})")
+        return self._publico(job, reutilizado=False)
+
+    def obtener(self, job_id: str, empresa_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Estado público del trabajo; None si no existe o pertenece a otra empresa."""
+        job = self._leer(job_id)
+        if not job or (empresa_id is not None and int(job["empresa_id"]) != int(empresa_id)):
+            return None
+        return self._publico(job)
+
+    def ruta_local(self, job_id: str) -> Optional[str]:
+        """Ruta del artefacto en disco de un trabajo completado con almacenamiento local."""
+        job = self._leer(job_id)
+        if not job or job["estado"] != ESTADO_COMPLETADO or job["almacenamiento"] != "local":
+            return None
+        ruta = os.path.join(self.directorio, job["archivo"])
+        return ruta if os.path.exists(ruta) else None
+
+    def url_descarga(self, job_id: str) -> Optional[str]:
+        """Enlace firmado y temporal del artefacto guardado en Supabase Storage."""
+        job = self._leer(job_id)
+        if not job or job["estado"] != ESTADO_COMPLETADO or not job.get("ruta_storage"):
+            return None
+        from data.supabase_conn import supabase
+        resp = supabase.storage.from_(EXPORTACIONES_BUCKET).create_signed_url(
+            job["ruta_storage"], EXPORTACIONES_URL_EXPIRA, {"download": job["nombre_archivo"]}
+        )
+        return resp.get("signedURL") or resp.get("signedUrl")
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+    def _ejecutar(self, job_id: str, generar) -> None:
+        job = self._leer(job_id)
+        if not job:
+            return
+
+        job.update(estado=ESTADO_PROCESANDO, iniciado=_ahora_iso(), pid=os.getpid())
+        self._guardar(job)
+        ruta = os.path.join(self.directorio, job["archivo"])
+        ultimo_guardado = [0.0]
+
+        def progreso(filas_escritas: int, total_filas: Optional[int] = None) -> None:
+            job["filas_escritas"] = filas_escritas
+            if total_filas is not None:
+                job["total_filas"] = total_filas
+            # Limitar las escrituras del estado a disco a una por segundo
+            if time.monotonic() - ultimo_guardado[0] >= 1:
+                ultimo_guardado[0] = time.monotonic()
+                self._guardar(job)
+
+        inicio = time.monotonic()
+        try:
+            filas = generar(ruta, progreso)
+            if filas is not None:
+                job["filas_escritas"] = filas
+            job["tamano_bytes"] = os.path.getsize(ruta)
+
+            if self.almacenamiento == "supabase":
+                job["ruta_storage"] = self._subir(job, ruta)
+                os.remove(ruta)
+
+            job.update(estado=ESTADO_COMPLETADO, finalizado=_ahora_iso())
+            print(f"✅ Exportación {job_id} completada: {job['filas_escritas']} filas en {time.monotonic() - inicio:.1f}s")
+        except Exception as e:
+            print(f"❌ Error en exportación {job_id}: {e}")
+            job.update(estado=ESTADO_ERROR, error=str(e), finalizado=_ahora_iso())
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        self._guardar(job)
+
+    def _subir(self, job: Dict[str, Any], ruta: str) -> str:
+        from data.supabase_conn import supabase
+        ruta_storage = f"{job['tipo']}/{job['empresa_id']}/{job['archivo']}"
+        supabase.storage.from_(EXPORTACIONES_BUCKET).upload(
+            ruta_storage,
+            ruta,
+            file_options={"content-type": "application/octet-stream", "upsert": "true"},
+        )
+        return ruta_storage
+
+    # ------------------------------------------------------------------
+    # Persistencia del estado
+    # ------------------------------------------------------------------
+    def _ruta_estado(self, job_id: str) -> str:
+        return os.path.join(self.directorio, f"{job_id}.json")
+
+    def _guardar(self, job: Dict[str, Any]) -> None:
+        os.makedirs(self.directorio, exist_ok=True)
+        job["ultima_actividad"] = time.time()
+        destino = self._ruta_estado(job["id"])
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(job, archivo, ensure_ascii=False)
+        os.replace(temporal, destino)
+
+    def _leer(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # Los ids son uuid4 en hexadecimal; cualquier otra cosa no corresponde a un archivo de estado
+        if not job_id or len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._ruta_estado(job_id), encoding="utf-8") as archivo:
+                job = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+        return self._marcar_interrumpido(job)
+
+    def _listar(self):
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            if nombre.endswith(".json"):
+                job = self._leer(nombre[:-5])
+                if job:
+                    yield job
+
+    def _marcar_interrumpido(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Un trabajo en curso que dejó de actualizarse (p. ej. el worker se reinició) pasa a error."""
+        en_curso = job["estado"] in (ESTADO_EN_COLA, ESTADO_PROCESANDO)
+        if en_curso and time.time() - job.get("ultima_actividad", 0) > EXPORTACIONES_TIEMPO_MAXIMO:
+            job["estado"] = ESTADO_ERROR
+            job["error"] = "La exportación se interrumpió antes de terminar"
+        return job
+
+    @staticmethod
+    def _clave(tipo: str, empresa_id: int, parametros: Dict[str, Any]) -> str:
+        base = json.dumps([tipo, int(empresa_id), parametros], sort_keys=True, default=str)
+        return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+    def _buscar_reutilizable(self, clave: str) -> Optional[Dict[str, Any]]:
+        """Último trabajo con la misma clave que sigue en curso o terminó dentro de la ventana."""
+        ahora = time.time()
+        candidatos = []
+        for job in self._listar():
+            if job.get("clave") != clave:
+                continue
+            if job["estado"] in (ESTADO_EN_COLA, ESTADO_PROCESANDO):
+                candidatos.append(job)
+            elif job["estado"] == ESTADO_COMPLETADO and ahora - job["ultima_actividad"] <= EXPORTACIONES_REUTILIZAR_SEGUNDOS:
+                candidatos.append(job)
+        if not candidatos:
+            return None
+        return max(candidatos, key=lambda job: job["creado"])
+
+    def _purgar(self) -> None:
+        """Elimina los trabajos terminados fuera del periodo de retención junto con sus archivos."""
+        ahora = time.time()
+        for job in list(self._listar()):
+            if job["estado"] not in (ESTADO_COMPLETADO, ESTADO_ERROR):
+                continue
+            if ahora - job.get("ultima_actividad", 0) <= EXPORTACIONES_RETENCION_SEGUNDOS:
+                continue
+            try:
+                if job.get("ruta_storage"):
+                    from data.supabase_conn import supabase
+                    supabase.storage.from_(EXPORTACIONES_BUCKET).remove([job["ruta_storage"]])
+                for ruta in (os.path.join(self.directorio, job["archivo"]), self._ruta_estado(job["id"])):
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+            except Exception as e:
+                print(f"⚠️ No se pudo purgar la exportación {job['id']}: {e}")
+
+    @contextmanager
+    def _bloqueo_archivos(self):
+        """Bloqueo entre procesos para que dos workers no encolen la misma exportación a la vez."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(os.path.join(self.directorio, ".lock"), "w") as archivo:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _publico(job: Dict[str, Any], reutilizado: Optional[bool] = None) -> Dict[str, Any]:
+        datos = {k: v for k, v in job.items() if k not in _CAMPOS_INTERNOS}
+        total = job.get("total_filas")
+        datos["progreso"] = round(min(job["filas_escritas"] / total, 1) * 100, 1) if total else None
+        if job["estado"] == ESTADO_COMPLETADO:
+            datos["progreso"] = 100.0
+        if reutilizado is not None:
+            datos["reutilizado"] = reutilizado
+        return datos
+
+
+gestor_exportaciones = GestorExportaciones()
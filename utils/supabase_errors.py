@@ -53,3 +53,25 @@ def is_supabase_connectivity_error(exc: BaseException) -> bool:
 def get_supabase_error_message(exc: BaseException) -> str:
     """Mensaje amigable para el cliente cuando Supabase no está disponible."""
     return "El servicio de base de datos no está disponible temporalmente. Intenta de nuevo en unos minutos."
+
+
+def is_rpc_not_found_error(exc: BaseException) -> bool:
+    """
+    Indica si la excepción corresponde a una función RPC que no existe en la BD
+    (PostgREST responde PGRST202 cuando la migración SQL aún no se ha aplicado).
+    """
+    if getattr(exc, "code", None) == "PGRST202":
+        return True
+    msg = str(exc).lower()
+    return "pgrst202" in msg or "could not find the function" in msg
+
+
+def is_relationship_not_found_error(exc: BaseException) -> bool:
+    """
+    Indica si la excepción corresponde a un select embebido cuya relación no existe
+    o es ambigua en la BD (PostgREST responde PGRST200 / PGRST201).
+    """
+    if getattr(exc, "code", None) in ("PGRST200", "PGRST201"):
+        return True
+    msg = str(exc).lower()
+    return "pgrst200" in msg or "pgrst201" in msg or "could not find a relationship" in msg
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from data.supabase_conn import supabase
+from utils.cache_ttl import CacheTTL
+
+# Usuarios autenticados por ID; UsuariosModel los invalida en update / delete
+_cache_usuarios = CacheTTL(
+    ttl_segundos=float(os.getenv("USUARIO_AUTENTICADO_TTL", "30")),
+    max_entradas=int(os.getenv("USUARIO_AUTENTICADO_MAX", "4096")),
+)
+
+# Se guarda como None cuando el usuario no existe, para distinguirlo de "no está en caché"
+_NO_ENCONTRADO = object()
+
+# Versión vigente del alcance de cada usuario, por empresa: {user_id: huella}. Los claims de un token
+# solo se usan si su alcance_v coincide; un cambio hecho en otro worker se nota en como máximo un TTL
+_versiones_alcance = CacheTTL(
+    ttl_segundos=float(os.getenv("JWT_ALCANCE_VERSIONES_TTL", "60")),
+    max_entradas=int(os.getenv("JWT_ALCANCE_VERSIONES_MAX", "256")),
+)
+
+
+def invalidar_usuario_autenticado(user_id: Optional[int] = None) -> None:
+    """Descarta un usuario autenticado en caché (o todos) y deja sin efecto los claims de sus tokens."""
+    # Las versiones se cachean por empresa y aquí no se conoce la del usuario: se recargan todas
+    _versiones_alcance.invalidar()
+    if user_id is None:
+        _cache_usuarios.invalidar()
+        return
+    _cache_usuarios.invalidar(lambda clave: clave == int(user_id))
+
+
+def huella_alcance(rol: Any, empresa_id: Any, banco_nombre: Any, ciudad: Any) -> str:
+    """Versión de los datos de alcance de un usuario: cambia si cambia cualquiera de ellos"""
+    datos = json.dumps([rol, empresa_id, banco_nombre, ciudad], default=str)
+    return hashlib.sha1(datos.encode("utf-8")).hexdigest()[:16]
+
+
+def claims_alcance(usuario: Dict[str, Any]) -> Dict[str, Any]:
+    """Claims adicionales del JWT con lo que necesitan los filtros por rol (login y refresh)"""
+    info_extra = _parsear_info_extra(usuario.get("info_extra"))
+    # authenticate_user / get_user_by_id devuelven en "rol" el nombre y en "rol_id" el valor de la columna
+    rol = usuario.get("rol_id", usuario.get("rol"))
+    empresa_id = usuario.get("empresa_id")
+    banco_nombre = info_extra.get("banco_nombre")
+    ciudad = info_extra.get("ciudad")
+    return {
+        "rol": rol,
+        "empresa_id": empresa_id,
+        "banco_nombre": banco_nombre,
+        "ciudad": ciudad,
+        "alcance_v": huella_alcance(rol, empresa_id, banco_nombre, ciudad),
+    }
+
+
+def obtener_usuario_autenticado(*, permitir_query_param: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Usuario autenticado de la petición actual: {"id", "rol", "banco_nombre", "ciudad", "ciudad_solicitud"}.
+    Requiere Authorization: Bearer. Si el token es un JWT válido de la API su subject es la identidad
+    (un X-User-Id distinto se rechaza); si no, el ID va en X-User-Id (o en ?user_id si permitir_query_param).
+    Con claims de alcance vigentes (alcance_v igual a la versión del servidor) se usan directamente;
+    si no, se resuelve una vez por petición (flask.g) y se cachea por ID con un TTL corto.
+    """
+    if not has_request_context():
+        return None
+
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+
+    user_id = request.headers.get("X-User-Id")
+    if not user_id and permitir_query_param:
+        user_id = request.args.get("user_id")
+
+    por_peticion = g.setdefault("usuarios_autenticados", {})
+    if "token" not in por_peticion:
+        por_peticion["token"] = _claims_token()
+    claims = por_peticion["token"]
+
+    if claims is not None:
+        if user_id and str(user_id) != str(claims["sub"]):
+            # El token es de otro usuario: no se puede actuar en nombre de X-User-Id
+            return None
+        user_id = claims["sub"]
+        if "claims" not in por_peticion:
+            por_peticion["claims"] = _usuario_desde_claims(claims)
+        if por_peticion["claims"]:
+            return dict(por_peticion["claims"])
+
+    if not user_id:
+        return None
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    if user_id not in por_peticion:
+        por_peticion[user_id] = _usuario_por_id(user_id)
+    usuario = por_peticion[user_id]
+    # Copia: los controladores pueden modificar el dict sin afectar a la caché
+    return dict(usuario) if usuario else None
+
+
+def _claims_token() -> Optional[Dict[str, Any]]:
+    """Claims del JWT de la petición si es un token válido de la API (con subject numérico); si no, None"""
+    try:
+        verify_jwt_in_request(optional=True)
+        claims = get_jwt()
+    except Exception:
+        # Token ajeno a la API (o inválido): se sigue con X-User-Id
+        return None
+    if not claims:
+        return None
+    try:
+        return {**claims, "sub": int(claims["sub"])}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _usuario_desde_claims(claims: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """usuario_info a partir de los claims de alcance, si siguen vigentes (None si no son utilizables)"""
+    if "alcance_v" not in claims or not claims.get("empresa_id"):
+        return None
+    user_id = claims["sub"]
+
+    try:
+        versiones = _versiones_empresa(int(claims["empresa_id"]))
+    except Exception as e:
+        print(f"❌ Error obteniendo versiones de alcance: {e}")
+        return None
+    if versiones.get(user_id) != claims["alcance_v"]:
+        # El usuario cambió (o se eliminó) después de emitir el token
+        return None
+
+    return {
+        "id": user_id,
+        # Igual que en _cargar_usuario: un rol nulo sigue siendo nulo (AlcanceRol lo deja sin acceso)
+        "rol": claims.get("rol"),
+        "empresa_id": claims.get("empresa_id"),
+        "banco_nombre": claims.get("banco_nombre"),
+        "ciudad": claims.get("ciudad"),
+        "ciudad_solicitud": claims.get("ciudad"),
+    }
+
+
+def _versiones_empresa(empresa_id: int) -> Dict[int, str]:
+    """Huella de alcance vigente de cada usuario de la empresa (una consulta por empresa y TTL)"""
+    versiones = _versiones_alcance.get(empresa_id)
+    if versiones is None:
+        resp = supabase.table("usuarios").select("id, rol, info_extra, empresa_id").eq("empresa_id", empresa_id).execute()
+        versiones = {}
+        for fila in resp.data or []:
+            info_extra = _parsear_info_extra(fila.get("info_extra"))
+            versiones[fila["id"]] = huella_alcance(
+                fila.get("rol"), fila.get("empresa_id"), info_extra.get("banco_nombre"), info_extra.get("ciudad")
+            )
+        _versiones_alcance.set(empresa_id, versiones)
+    return versiones
+
+
+def _usuario_por_id(user_id: int) -> Optional[Dict[str, Any]]:
+    usuario = _cache_usuarios.get(user_id)
+    if usuario is None:
+        try:
+            usuario = _cargar_usuario(user_id)
+        except Exception as e:
+            print(f"❌ Error obteniendo usuario autenticado: {e}")
+            return None
+        _cache_usuarios.set(user_id, usuario if usuario else _NO_ENCONTRADO)
+    return None if usuario is _NO_ENCONTRADO else usuario
+
+
+def _cargar_usuario(user_id: int) -> Optional[Dict[str, Any]]:
+    resp = supabase.table("usuarios").select("id, rol, info_extra, empresa_id").eq("id", user_id).execute()
+    user_data = resp.data[0] if resp.data else None
+    if not user_data:
+        return None
+
+    info_extra = _parsear_info_extra(user_data.get("info_extra"))
+    ciudad = info_extra.get("ciudad")
+    return {
+        "id": user_data["id"],
+        "rol": user_data.get("rol", "empresa"),
+        "empresa_id": user_data.get("empresa_id"),
+        "banco_nombre": info_extra.get("banco_nombre"),
+        "ciudad": ciudad,
+        # Solicitudes lo llama ciudad_solicitud; en la BD está como "ciudad"
+        "ciudad_solicitud": ciudad,
+    }
+
+
+def _parsear_info_extra(info_extra: Any) -> Dict[str, Any]:
+    # banco_nombre y ciudad vienen del info_extra del usuario (a veces guardado como string JSON)
+    if isinstance(info_extra, str):
+        try:
+            info_extra = json.loads(info_extra)
+        except json.JSONDecodeError:
+            info_extra = {}
+    return info_extra if isinstance(info_extra, dict) else {}